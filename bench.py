@@ -0,0 +1,255 @@
+#! /usr/bin/env python3
+#
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""Benchmark the models and the sample scripts
+
+Each benchmark is run repeatedly for at least --min-time seconds and
+the best of --repeat runs is reported in operations per second. The
+results can be saved as a JSON baseline (--save) and later runs
+compared against it (--baseline): a benchmark which is slower than
+the baseline by more than --threshold is reported as a regression and
+the script exits with 1.
+
+The scalar models are benchmarked with memoisation turned off (see
+model/memo.py), apart from the '(memo)' benchmark.
+
+pcie.Cfg objects are interned, so once a configuration has been
+created, creating it again is a lookup. The 'pcie.Cfg' benchmark
+creates new configurations in a fresh interpreter, 'pcie.Cfg
+(interned)' looks up existing ones.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+import numpy as np
+
+from model import pcie, eth, mem_bw, simple_nic, niantic, util, memo
+
+# pylint: disable=invalid-name
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CFG = pcie.Cfg(version='gen3', lanes='x8', addr=64, ecrc=0,
+               mps=256, mrrs=512, rcb=64)
+BW_SPEC = pcie.BW_Spec(CFG.TLP_bw, CFG.TLP_bw, pcie.BW_Spec.BW_RAW)
+ETH = eth.Cfg('40GigE')
+SIZES = np.arange(64, 1501)
+
+def _sizes(fn):
+    """Return a benchmark calling @fn for all SIZES (one op per size)"""
+    def run():
+        for size in range(64, 1501):
+            fn(size)
+        return len(SIZES)
+    return run
+
+def _once(fn):
+    """Return a benchmark calling @fn once"""
+    def run():
+        fn()
+        return 1
+    return run
+
+def _cfgs():
+    for ver in pcie.Vers:
+        for lanes in pcie.Laness:
+            for mps in pcie.MPSs:
+                pcie.Cfg(version=ver, lanes=lanes, addr=64, ecrc=0,
+                         mps=mps, mrrs=512, rcb=64)
+    return len(pcie.Vers) * len(pcie.Laness) * len(pcie.MPSs)
+
+def _python(code):
+    """Run @code in a fresh interpreter and return what it prints"""
+    return subprocess.run([sys.executable, "-c", code], cwd=HERE, check=True,
+                          stdout=subprocess.PIPE).stdout
+
+def _import():
+    # time only the import, not the interpreter start up
+    out = _python("import time; t = time.perf_counter(); import model; "
+                  "from model import *; print(time.perf_counter() - t)")
+    return 1, float(out)
+
+# Create one pcie.Cfg for each combination of the parameters below
+_CFG_LOOP = """
+n = 0
+for ver in pcie.Vers:
+    for lanes in pcie.Laness:
+        for mps in pcie.MPSs:
+            for mrrs in pcie.MRRSs:
+                for addr in (32, 64):
+                    pcie.Cfg(version=ver, lanes=lanes, addr=addr, ecrc=0,
+                             mps=mps, mrrs=mrrs, rcb=64)
+                    n += 1
+"""
+
+def _cfgs_cold():
+    # time only the construction in a fresh interpreter, where none of
+    # the configurations exist yet
+    out = _python("import time\nfrom model import pcie\n"
+                  "t = time.perf_counter()\n" + _CFG_LOOP +
+                  "print(n, time.perf_counter() - t)\n")
+    n, secs = out.split()
+    return int(n), float(secs)
+
+def _script(name):
+    """Return a benchmark running the script @name"""
+    def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            subprocess.run([sys.executable, os.path.join(HERE, name),
+                            "-o", os.path.join(tmp, "out.dat")],
+                           cwd=tmp, check=True, stdout=subprocess.DEVNULL)
+        return 1
+    return run
+
+def _gen_res(size):
+    return util.gen_res(BW_SPEC, pcie.DIR_BOTH, size, 16, size + 40,
+                        size + 24, 40)
+
+# The benchmarks: name -> function performing a number of operations
+# and returning how many. A function may instead return a tuple
+# (operations, seconds) if it times itself.
+Benchmarks = {
+    'mem_bw.write':
+        _sizes(lambda s: mem_bw.write(CFG, BW_SPEC, s)),
+    'mem_bw.read':
+        _sizes(lambda s: mem_bw.read(CFG, BW_SPEC, s)),
+    'mem_bw.read_write':
+        _sizes(lambda s: mem_bw.read_write(CFG, BW_SPEC, s)),
+    'util.gen_res':
+        _sizes(_gen_res),
+    'simple_nic.bw':
+        _sizes(lambda s: simple_nic.bw(CFG, BW_SPEC, pcie.DIR_BOTH, s)),
+    'niantic.bw':
+        _sizes(lambda s: niantic.bw(CFG, BW_SPEC, pcie.DIR_BOTH, s)),
+    'niantic.bw pmd':
+        _sizes(lambda s: niantic.bw(CFG, BW_SPEC, pcie.DIR_BOTH, s,
+                                    h_opt="PMD")),
+    'niantic.bw (memo)':
+        _sizes(lambda s: niantic.bw(CFG, BW_SPEC, pcie.DIR_BOTH, s)),
+    'eth.pps_ex':
+        _sizes(ETH.pps_ex),
+    'eth.bps_ex':
+        _sizes(ETH.bps_ex),
+    'mem_bw.read_many':
+        _once(lambda: mem_bw.read_many(CFG, BW_SPEC, SIZES)),
+    'niantic.bw_many':
+        _once(lambda: niantic.bw_many(CFG, BW_SPEC, pcie.DIR_BOTH, SIZES)),
+    'pcie.Cfg':
+        _cfgs_cold,
+    'pcie.Cfg (interned)':
+        _cfgs,
+    'import':
+        _import,
+    'pcie_bw.py':
+        _script("pcie_bw.py"),
+    'nic_bw.py':
+        _script("nic_bw.py"),
+    }
+
+def measure(fn, min_time, repeat):
+    """Return the best operations per second of @repeat runs of @fn,
+    each lasting at least @min_time seconds"""
+    best = 0.0
+    for _ in range(repeat):
+        ops = 0
+        elapsed = 0.0
+        while elapsed < min_time:
+            start = time.perf_counter()
+            res = fn()
+            if isinstance(res, tuple):
+                ops += res[0]
+                elapsed += res[1]
+            else:
+                ops += res
+                elapsed += time.perf_counter() - start
+        best = max(best, ops / elapsed)
+    return best
+
+def main():
+    """Main"""
+    usage = """usage: %prog [options] [benchmark ...]
+
+Runs all benchmarks or those whose names contain one of the arguments.
+Available benchmarks: """ + ', '.join(Benchmarks)
+
+    parser = OptionParser(usage)
+    parser.add_option('--min-time', dest='min_time', type="float",
+                      default=0.2, action='store',
+                      help='Minimum time of a run in seconds')
+    parser.add_option('-r', '--repeat', dest='repeat', type="int",
+                      default=3, action='store',
+                      help='Number of runs of each benchmark')
+    parser.add_option('--save', dest='save', default=None, action='store',
+                      help='Save the results as a baseline to this file')
+    parser.add_option('--baseline', dest='baseline', default=None,
+                      action='store',
+                      help='Compare the results with this baseline')
+    parser.add_option('-t', '--threshold', dest='threshold', type="float",
+                      default=0.1, action='store',
+                      help='Slowdown relative to the baseline reported as '
+                      'a regression (default 0.1, i.e. 10%)')
+
+    (options, args) = parser.parse_args()
+
+    names = [n for n in Benchmarks if not args or any(a in n for a in args)]
+    if not names:
+        parser.error("No benchmarks match %s" % ', '.join(args))
+
+    baseline = {}
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = []
+    print("%-20s %14s %14s %8s" % ("Benchmark", "ops/s", "baseline", "change"))
+    for name in names:
+        memo.clear()
+        memo.enable(name.endswith("(memo)"))
+        ops = measure(Benchmarks[name], options.min_time, options.repeat)
+        memo.enable(True)
+        results[name] = ops
+        if name in baseline:
+            change = ops / baseline[name] - 1.0
+            flag = ""
+            if change < -options.threshold:
+                regressions.append(name)
+                flag = " REGRESSION"
+            print("%-20s %14.1f %14.1f %+7.1f%%%s" %
+                  (name, ops, baseline[name], change * 100, flag))
+        else:
+            print("%-20s %14.1f %14s %8s" % (name, ops, "-", "-"))
+        sys.stdout.flush()
+
+    if options.save:
+        with open(options.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if regressions:
+        print("%d regression(s) above %.0f%%: %s" %
+              (len(regressions), options.threshold * 100,
+               ', '.join(regressions)))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,23 @@
 __all__ = [
+    "bottleneck",
+    "cache",
+    "device",
     "eth",
+    "instr",
+    "inverse",
+    "lookup",
+    "mix",
+    "multiq",
     "mem_bw",
+    "memo",
     "niantic",
+    "output",
+    "pareto",
+    "pcap",
     "pcie",
+    "piecewise",
+    "results",
+    "sim",
     "simple_nic",
+    "sweep",
     ]
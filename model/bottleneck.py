@@ -0,0 +1,150 @@
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""Which resource limits the packet rate of a NIC
+
+For each packet size, solve() works out the packet rate allowed by
+each of the resources a NIC depends on and labels the smallest one
+as the bottleneck:
+
+- LIMIT_ETH: The Ethernet line rate (per direction, full duplex)
+- LIMIT_PCIE_RX: PCIe bandwidth towards the device (host writes,
+  completions for device reads)
+- LIMIT_PCIE_TX: PCIe bandwidth from the device (DMA writes, read
+  requests, interrupts)
+- LIMIT_LAT: Optionally, the number of outstanding device reads
+  (tags, non-posted credits) given the completion latency. As in
+  mem_bw.read_lat(), each read request holds a tag for the latency
+  plus the time to receive its completions.
+
+The bytes, TLPs and reads per packet come from the step ledger of the
+device (see device.Device.ledger()). With DIR_BOTH the packet rate is
+that of each direction.
+"""
+
+# pylint: disable=invalid-name
+# pylint: disable=too-many-arguments
+# pylint: disable=too-many-locals
+
+import numpy as np
+
+from . import pcie
+from . import device
+
+LIMIT_ETH = 0
+LIMIT_PCIE_RX = 1
+LIMIT_PCIE_TX = 2
+LIMIT_LAT = 3
+Limits = ['eth', 'pcie_rx', 'pcie_tx', 'latency']
+
+# One record per packet size. Rates are in packets per second, the
+# limit is an index into Limits.
+Bottleneck_dtype = np.dtype([('size', np.int64),
+                             ('pps', np.float64),
+                             ('gbps', np.float64),
+                             ('eth_pps', np.float64),
+                             ('pcie_rx_pps', np.float64),
+                             ('pcie_tx_pps', np.float64),
+                             ('lat_pps', np.float64),
+                             ('limit', np.int8)])
+
+# The NIC models by name
+Devices = {
+    'simple_nic'  : lambda **kwargs: device.SIMPLE_NIC,
+    'niantic'     : device.niantic,
+    'niantic_pmd' : lambda **kwargs: device.niantic(h_opt="PMD", **kwargs),
+    }
+
+def _device(model, **kwargs):
+    if isinstance(model, device.Device):
+        return model
+    if model not in Devices:
+        raise Exception("Unknown NIC model: %s" % model)
+    return Devices[model](**kwargs)
+
+def eth_pps(ethcfg, frame_sizes):
+    """Same as eth.Cfg.pps_ex() for an array of frame sizes"""
+    payload = np.maximum(frame_sizes - ethcfg.hdr_sz - ethcfg.crc_sz,
+                         ethcfg.min_pay)
+    wire_B = ethcfg.pre_sz + ethcfg.hdr_sz + payload + ethcfg.crc_sz + \
+             ethcfg.trail_sz
+    return ethcfg.rate / (wire_B * 8.0)
+
+def solve(pcicfg, ethcfg, model, direction, sizes, bwspec=None, lat=None,
+          tags=pcie.Tags[8], np_credits=None, strip_fcs=True, **kwargs):
+    """
+    Work out the packet rate of a NIC and what limits it.
+
+    @param pcicfg     PCIe configuration
+    @param ethcfg     eth.Cfg of the network link
+    @param model      'simple_nic', 'niantic', 'niantic_pmd' or a
+                      device.Device
+    @param direction  Direction(s) of the traffic. Note, packets
+                      received by a NIC are DIR_TX.
+    @param sizes      Array of Ethernet frame sizes (including the FCS)
+    @param bwspec     Raw PCIe bandwidth available (BW_RAW). Defaults to
+                      the TLP bandwidth of @pcicfg in both directions.
+    @param lat        Completion latency of device reads in ns. No
+                      latency bound if None.
+    @param tags       Number of tags for outstanding reads
+    @param np_credits Non-posted request credits, if more limiting
+    @param strip_fcs  The FCS is not transferred over PCIe
+    @param kwargs     Passed to device.niantic(), e.g. irq_mod
+    @returns A Bottleneck_dtype array with one record per size
+    """
+    if bwspec is None:
+        bwspec = pcie.BW_Spec(pcicfg.TLP_bw, pcicfg.TLP_bw,
+                              pcie.BW_Spec.BW_RAW)
+    if bwspec.type != pcie.BW_Spec.BW_RAW:
+        raise Exception("Need a raw bandwidth specification")
+    sizes = np.asarray(sizes, dtype=np.int64)
+    pkt_sizes = sizes - ethcfg.crc_sz if strip_fcs else sizes
+    ledger = _device(model, **kwargs).ledger(pcicfg, direction, pkt_sizes)
+
+    res = np.zeros(len(sizes), dtype=Bottleneck_dtype)
+    res['size'] = sizes
+    res['eth_pps'] = eth_pps(ethcfg, sizes)
+    # Gb/s over bytes per packet
+    with np.errstate(divide='ignore'):
+        res['pcie_rx_pps'] = bwspec.rx_bw * 1e9 / (8.0 * ledger.rx_B.sum(0))
+        res['pcie_tx_pps'] = bwspec.tx_bw * 1e9 / (8.0 * ledger.tx_B.sum(0))
+    res['lat_pps'] = np.inf
+    if lat is not None:
+        outstanding = tags if np_credits is None else min(tags, np_credits)
+        # ns a tag is in use per packet
+        tag_ns = np.zeros(len(sizes))
+        for i, step in enumerate(ledger.steps):
+            if step.initiator == device.DEV and step.op == device.OP_RD:
+                tag_ns += ledger.tx_tlps[i] * lat + \
+                          ledger.rx_B[i] * 8.0 / bwspec.rx_bw
+        with np.errstate(divide='ignore'):
+            res['lat_pps'] = outstanding * 1e9 / tag_ns
+
+    limits = np.stack([res['eth_pps'], res['pcie_rx_pps'],
+                       res['pcie_tx_pps'], res['lat_pps']])
+    res['limit'] = np.argmin(limits, axis=0)
+    res['pps'] = limits.min(axis=0)
+    res['gbps'] = res['pps'] * sizes * 8 / 1e9
+    return res
+
+def labels(res):
+    """Return the names (see Limits) of the limits of @res"""
+    return np.array(Limits)[res['limit']]
+
+def changes(res):
+    """Return a list of (first size, limit name) for each range of
+    sizes with the same limit"""
+    idx = np.flatnonzero(np.diff(res['limit'])) + 1
+    idx = np.concatenate([[0], idx]) if len(res) else idx
+    return [(int(res['size'][i]), Limits[res['limit'][i]]) for i in idx]
@@ -0,0 +1,265 @@
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""A persistent cache of model results
+
+Cache.call(fn, *args, **kwargs) returns fn(*args, **kwargs), looking
+the result up in a sqlite database first. Results are keyed by the
+model function, a hash of its source and the arguments: pcie.Cfg
+parameters, BW_Spec values, arrays of sizes (by content) and keyword
+arguments such as irq_mod or h_opt. Objects such as device.Device or
+multiq.Queue are keyed by their public attributes.
+
+The source hash covers the module of the model function and all
+modules of this package it uses, directly or indirectly (e.g.
+niantic.py uses device.py, util.py and pcie.py). Results of a model whose source has changed are
+never returned and are removed the first time the model is used. The
+database is limited in size; the least recently used results are
+evicted first.
+
+Results are arrays, pcie.BW_Res objects or tuples of arrays, BW_Res
+and device.Ledger objects (as returned with detail=True). They are
+stored without pickling.
+
+The cache is meant for the vectorised models, where one call covers
+many points. direct() has the same signature as Cache.call() but does
+not cache, so code can be written to use either.
+"""
+
+# pylint: disable=invalid-name
+
+import hashlib
+import io
+import sqlite3
+import sys
+import time
+import types
+
+import numpy as np
+
+from . import pcie
+from . import device
+
+def direct(fn, *args, **kwargs):
+    """Call @fn without caching"""
+    return fn(*args, **kwargs)
+
+def _norm(val):
+    """Return a representation of @val for the cache key"""
+    if isinstance(val, pcie.Cfg):
+        return ('Cfg',) + val.key
+    if isinstance(val, pcie.BW_Spec):
+        return ('BW_Spec', val.rx_bw, val.tx_bw, val.type)
+    if isinstance(val, np.ndarray):
+        val = np.ascontiguousarray(val)
+        return ('ndarray', val.dtype.str, val.shape,
+                hashlib.sha1(val.tobytes()).hexdigest())
+    if isinstance(val, (list, tuple)):
+        return (type(val).__name__,) + tuple(_norm(v) for v in val)
+    if isinstance(val, dict):
+        return ('dict',) + tuple(sorted((k, _norm(v)) for k, v in val.items()))
+    if val is None or isinstance(val, (bool, int, float, str, np.generic)):
+        return val
+    if hasattr(val, '__dict__'):
+        return (type(val).__name__,) + \
+            tuple(sorted((k, _norm(v)) for k, v in vars(val).items()
+                         if not k.startswith('_')))
+    raise Exception("Can not cache argument of type %s" % type(val).__name__)
+
+def _model_name(fn):
+    name = "%s.%s" % (fn.__module__, getattr(fn, '__qualname__', fn.__name__))
+    return name
+
+# Hash of the source of a module and the package modules it uses
+_Versions = {}
+
+def _deps(mod, seen):
+    """Add @mod and the modules of this package it refers to, directly
+    or indirectly, to the set @seen"""
+    if mod in seen or mod not in sys.modules:
+        return
+    seen.add(mod)
+    for val in list(vars(sys.modules[mod]).values()):
+        if isinstance(val, types.ModuleType):
+            name = val.__name__
+        else:
+            name = getattr(val, '__module__', None)
+        if isinstance(name, str) and name.startswith(__package__ + '.'):
+            _deps(name, seen)
+
+def source_hash(fn):
+    """Return a hash of the source code @fn depends on: its module and
+    all modules of this package the module uses, directly or
+    indirectly"""
+    mod = fn.__module__
+    ver = _Versions.get(mod)
+    if ver is None:
+        seen = set()
+        _deps(mod, seen)
+        h = hashlib.sha1()
+        for name in sorted(seen):
+            with open(sys.modules[name].__file__, 'rb') as f:
+                h.update(name.encode())
+                h.update(f.read())
+        ver = h.hexdigest()
+        _Versions[mod] = ver
+    return ver
+
+# Fields of a device.Ledger stored as arrays
+_Ledger_arrays = ['data_B', 'rx_B', 'tx_B', 'rx_tlps', 'tx_tlps']
+
+def _put(arrays, name, val):
+    """Add @val (an array, BW_Res or device.Ledger) to @arrays"""
+    if isinstance(val, pcie.BW_Res):
+        arrays['b' + name] = np.array([val.rx_raw, val.rx_eff,
+                                       val.tx_raw, val.tx_eff])
+    elif isinstance(val, device.Ledger):
+        arrays['l' + name] = np.array(
+            [[st.name, st.path, st.initiator, st.op, str(st.size),
+              str(st.batch)] for st in val.steps], dtype=str).reshape(-1, 6)
+        for field in _Ledger_arrays:
+            arrays['l%s_%s' % (name, field)] = np.asarray(getattr(val, field))
+    else:
+        arr = np.asarray(val)
+        if arr.dtype.hasobject:
+            raise Exception("Can not cache result of type %s" %
+                            type(val).__name__)
+        arrays['r' + name] = arr
+
+def _get(f, name):
+    """Return the value stored by _put() as @name"""
+    if 'r' + name in f.files:
+        return f['r' + name]
+    if 'b' + name in f.files:
+        return pcie.BW_Res(*f['b' + name].tolist())
+    steps = [device.Step(n, path, init, op,
+                         size if size == device.PKT else int(size),
+                         int(batch))
+             for n, path, init, op, size, batch in f['l' + name].tolist()]
+    vals = [f['l%s_%s' % (name, field)] for field in _Ledger_arrays]
+    if not vals[0].ndim:
+        vals[0] = int(vals[0])
+    return device.Ledger(steps, *vals)
+
+def _dumps(res):
+    arrays = {}
+    if isinstance(res, tuple):
+        arrays['n'] = np.array(len(res))
+        for i, val in enumerate(res):
+            _put(arrays, str(i), val)
+    else:
+        _put(arrays, '', res)
+    buf = io.BytesIO()
+    np.savez(buf, **arrays)
+    return buf.getvalue()
+
+def _loads(blob):
+    with np.load(io.BytesIO(blob), allow_pickle=False) as f:
+        if 'n' in f.files:
+            return tuple(_get(f, str(i)) for i in range(int(f['n'])))
+        if 't0' in f.files:
+            # tuples of arrays stored by earlier versions
+            return tuple(f['t%d' % i] for i in range(len(f.files)))
+        return _get(f, '')
+
+
+class Cache():
+    """A persistent cache of model results in the sqlite database @path"""
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS results ("
+                        "key TEXT PRIMARY KEY, model TEXT, version TEXT, "
+                        "value BLOB, size INTEGER, atime REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS results_model "
+                        "ON results (model)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS results_atime "
+                        "ON results (atime)")
+        self.size = self.db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        self.checked = set()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self, model, version):
+        """Remove results of older versions of @model"""
+        if model in self.checked:
+            return
+        cur = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM results "
+                              "WHERE model = ? AND version != ?",
+                              (model, version))
+        self.size -= cur.fetchone()[0]
+        self.db.execute("DELETE FROM results WHERE model = ? AND version != ?",
+                        (model, version))
+        self.checked.add(model)
+
+    def _evict(self):
+        """Remove the least recently used results until the database
+        is 10% below its maximum size"""
+        target = self.max_bytes * 0.9
+        rows = self.db.execute("SELECT key, size FROM results "
+                               "ORDER BY atime").fetchall()
+        victims = []
+        for key, size in rows:
+            if self.size <= target:
+                break
+            victims.append((key,))
+            self.size -= size
+        self.db.executemany("DELETE FROM results WHERE key = ?", victims)
+
+    def call(self, fn, *args, **kwargs):
+        """Return @fn(*@args, **@kwargs), from the cache if possible"""
+        model = _model_name(fn)
+        version = source_hash(fn)
+        self._check_version(model, version)
+        inst = getattr(fn, '__self__', None)
+        key = hashlib.sha1(repr((model, version, _norm(inst), _norm(args),
+                                 _norm(kwargs))).encode()).hexdigest()
+        now = time.time()
+        row = self.db.execute("SELECT value FROM results WHERE key = ?",
+                              (key,)).fetchone()
+        if row is not None:
+            self.hits += 1
+            self.db.execute("UPDATE results SET atime = ? WHERE key = ?",
+                            (now, key))
+            return _loads(row[0])
+
+        self.misses += 1
+        res = fn(*args, **kwargs)
+        blob = _dumps(res)
+        self.db.execute("INSERT OR REPLACE INTO results VALUES (?,?,?,?,?,?)",
+                        (key, model, version, blob, len(blob), now))
+        self.size += len(blob)
+        if self.size > self.max_bytes:
+            self._evict()
+        return res
+
+    def clear(self):
+        """Remove all results"""
+        self.db.execute("DELETE FROM results")
+        self.size = 0
+
+    def close(self):
+        """Close the database"""
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,414 @@
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""Declarative device models
+
+Instead of hand coding the PCIe transactions of a device, a device is
+described as a list of Steps. Each step is a DMA (memory read or write) of a given size,
+initiated by the host or the device, which is performed once every
+'batch' packets on either the packet transmit or receive path.
+
+A Device compiles the steps: The bytes of all steps which do not
+depend on the packet size are worked out once per PCIe configuration,
+the remaining ones are evaluated for arrays of packet sizes. The bytes
+are worked out for a number of packets which is a multiple of all
+batch sizes and util.gen_res() and util.gen_res_many() derive the
+bandwidth from them. pkt_bytes() averages them per packet instead.
+
+SIMPLE_NIC and niantic() describe the devices of simple_nic.py,
+niantic.py and multiq.py, which get their bytes from here. The
+original simple_nic.py and niantic.py models do not count the read
+request of the RX descriptor fetch, only its completion. To keep
+their results, the "D: RX descriptor read" steps are declared with
+req=False and their ledger shows no bytes or TLPs transmitted by the
+device. Counting the request adds one MRd TLP header
+(pcicfg.TLP_MRd_Hdr_Sz bytes) per fetch to the bytes transmitted on
+the receive path.
+
+Device.ledger() breaks the bytes and TLPs down by step, e.g. to see
+how much of the bandwidth goes to doorbells or descriptor fetches.
+"""
+
+# pylint: disable=invalid-name
+# pylint: disable=too-many-arguments
+# pylint: disable=too-few-public-methods
+
+import numbers
+
+import numpy as np
+
+from . import pcie
+from . import util
+
+# Who initiates a step
+HOST = 'host'
+DEV = 'dev'
+
+# Operations
+OP_WR = 'wr'
+OP_RD = 'rd'
+
+# Packet paths: transmit (from the host to the network) and receive
+PATH_TX = 'tx'
+PATH_RX = 'rx'
+
+# Size of a step which transfers the packet
+PKT = 'pkt'
+
+def _is_int(val):
+    """Is @val an integer (including NumPy integers but not bools)?"""
+    return isinstance(val, numbers.Integral) and not isinstance(val, bool)
+
+class Step():
+    """
+    A step of a device interaction (a glorified struct)
+
+    @param name      Description of the step
+    @param path      PATH_TX or PATH_RX
+    @param initiator HOST or DEV
+    @param op        OP_WR or OP_RD
+    @param size      Bytes transferred or PKT for the packet size
+    @param batch     The step is performed once every @batch packets
+    @param req       Count the request TLPs of a read. False leaves them
+                     out, as the NIC models do for the RX descriptor
+                     read.
+    """
+    def __init__(self, name, path, initiator, op, size, batch=1, req=True):
+        if path not in (PATH_TX, PATH_RX):
+            raise Exception("Unknown path: %s" % path)
+        if initiator not in (HOST, DEV):
+            raise Exception("Unknown initiator: %s" % initiator)
+        if op not in (OP_WR, OP_RD):
+            raise Exception("Unknown operation: %s" % op)
+        if size != PKT and (not _is_int(size) or size <= 0):
+            raise Exception("Bad size for %s: %r" % (name, size))
+        if not _is_int(batch) or batch <= 0:
+            raise Exception("Bad batch for %s: %r" % (name, batch))
+        if not req and op != OP_RD:
+            raise Exception("Only reads can leave out requests: %s" % name)
+        self.name = name
+        self.path = path
+        self.initiator = initiator
+        self.op = op
+        self.size = size if size == PKT else int(size)
+        self.batch = int(batch)
+        self.req = req
+
+    def __repr__(self):
+        return "Step(%r, %s, %s, %s, %s, %d%s)" % \
+            (self.name, self.path, self.initiator, self.op, self.size,
+             self.batch, "" if self.req else ", req=False")
+
+def _tlps(pcicfg, step, size):
+    """Return the number of (request, completion) TLPs of a @step"""
+    if step.op == OP_WR:
+        return util.ceil_div(size, pcicfg.mps), 0
+    chunk = pcicfg.rcb if pcicfg.rcb_chunks else pcicfg.mps
+    req = util.ceil_div(size, pcicfg.mrrs)
+    if not step.req:
+        req = req * 0
+    return req, util.ceil_div(size, chunk)
+
+def step_bytes(pcicfg, step, size):
+    """Return the bytes (received, transmitted) by the device for one
+    @step transferring @size bytes (a scalar or an array)"""
+    req, cpl = _tlps(pcicfg, step, size)
+    if step.op == OP_WR:
+        req_B = req * pcicfg.TLP_MWr_Hdr_Sz + size
+        cpl_B = 0
+    else:
+        req_B = req * pcicfg.TLP_MRd_Hdr_Sz
+        cpl_B = cpl * pcicfg.TLP_CplD_Hdr_Sz + size
+    if step.initiator == DEV:
+        return cpl_B, req_B
+    return req_B, cpl_B
+
+def step_tlps(pcicfg, step, size):
+    """Return the TLPs (received, transmitted) by the device for one
+    @step transferring @size bytes (a scalar or an array)"""
+    req, cpl = _tlps(pcicfg, step, size)
+    if step.initiator == DEV:
+        return cpl, req
+    return req, cpl
+
+
+def _read_only(arr):
+    """Return a read-only view of the array @arr"""
+    arr = np.asarray(arr).view()
+    arr.flags.writeable = False
+    return arr
+
+
+class Ledger():
+    """
+    The bytes and TLPs of each step of a Device, per packet and as
+    seen by the device (a glorified struct).
+
+    - steps: The Steps on the packet paths of the direction(s)
+    - data_B: The packet size (a scalar or an array)
+    - rx_B, tx_B: Bytes received and transmitted by the device
+    - rx_tlps, tx_tlps: TLPs received and transmitted by the device
+
+    The per step values are arrays of shape (#steps,) for a single
+    packet size or (#steps, #sizes) for an array of sizes. Steps
+    performed once every n packets count 1/n per packet.
+
+    The arrays are read-only, as ledgers returned by memoised models
+    are shared between callers (see memo.py).
+    """
+    def __init__(self, steps, data_B, rx_B, tx_B, rx_tlps, tx_tlps):
+        self.steps = tuple(steps)
+        if isinstance(data_B, np.ndarray):
+            data_B = _read_only(np.array(data_B))
+        self.data_B = data_B
+        self.rx_B = _read_only(rx_B)
+        self.tx_B = _read_only(tx_B)
+        self.rx_tlps = _read_only(rx_tlps)
+        self.tx_tlps = _read_only(tx_tlps)
+
+    @property
+    def names(self):
+        """Names of the steps"""
+        return [step.name for step in self.steps]
+
+    def bw(self, res):
+        """Split the raw bandwidth of the result @res (a pcie.BW_Res
+        or util.BW_Res_dtype array for the same sizes) between the
+        steps.
+
+        @returns A tuple of arrays (RX Gb/s, TX Gb/s), shaped as rx_B
+        """
+        if isinstance(res, np.ndarray):
+            rx_raw, tx_raw = res['rx_raw'], res['tx_raw']
+        else:
+            rx_raw, tx_raw = res.rx_raw, res.tx_raw
+        out = []
+        for vals, raw in ((self.rx_B, rx_raw), (self.tx_B, tx_raw)):
+            total = vals.sum(axis=0)
+            share = np.divide(vals, total, out=np.zeros_like(vals),
+                              where=total != 0)
+            out.append(share * raw)
+        return tuple(out)
+
+    def pp(self, res=None):
+        """Print the ledger of a single packet size, with the
+        bandwidth of each step if a result @res is given"""
+        if res is not None:
+            rx_bw, tx_bw = self.bw(res)
+        print("%-32s %8s %8s %8s %8s %s" %
+              ("Step", "RX B", "TX B", "RX TLPs", "TX TLPs",
+               "" if res is None else "  RX Gb/s  TX Gb/s"))
+        for i, step in enumerate(self.steps):
+            print("%-32s %8.2f %8.2f %8.3f %8.3f %s" %
+                  (step.name, self.rx_B[i], self.tx_B[i], self.rx_tlps[i],
+                   self.tx_tlps[i], "" if res is None else
+                   "%8.2f %8.2f" % (rx_bw[i], tx_bw[i])))
+        print("%-32s %8.2f %8.2f %8.3f %8.3f" %
+              ("Total", self.rx_B.sum(), self.tx_B.sum(),
+               self.rx_tlps.sum(), self.tx_tlps.sum()))
+
+
+class Device():
+    """A device described by a list of Steps"""
+
+    def __init__(self, name, steps):
+        if not steps:
+            raise Exception("A device needs at least one step")
+        self.name = name
+        self.steps = list(steps)
+        self.batch_mul = 1
+        for step in self.steps:
+            self.batch_mul = util.low_com_mul(self.batch_mul, step.batch)
+        self._pkt_steps = [s for s in self.steps if s.size == PKT]
+        self._fixed = {}
+
+    def _fixed_bytes(self, pcicfg):
+        """Bytes of the steps not depending on the packet size, per
+        batch_mul packets, as a list [tx_rx, tx_tx, rx_rx, rx_tx]"""
+        acc = self._fixed.get(pcicfg)
+        if acc is None:
+            acc = [0, 0, 0, 0]
+            for step in self.steps:
+                if step.size != PKT:
+                    self._add(acc, pcicfg, step, step.size)
+            self._fixed[pcicfg] = acc
+        return acc
+
+    def _add(self, acc, pcicfg, step, size, mul=None):
+        rx_B, tx_B = step_bytes(pcicfg, step, size)
+        if mul is None:
+            mul = self.batch_mul // step.batch
+        i = 0 if step.path == PATH_TX else 2
+        acc[i] = acc[i] + rx_B * mul
+        acc[i + 1] = acc[i + 1] + tx_B * mul
+
+    def bytes(self, pcicfg, pkt_size):
+        """
+        Work out the bytes transferred for batch_mul packets of
+        @pkt_size (a scalar or an array).
+
+        @returns A tuple (data_B, tx_rx_data_B, tx_tx_data_B,
+                 rx_rx_data_B, rx_tx_data_B) as passed to util.gen_res()
+        """
+        acc = list(self._fixed_bytes(pcicfg))
+        for step in self._pkt_steps:
+            self._add(acc, pcicfg, step, pkt_size)
+        return (pkt_size * self.batch_mul,) + tuple(acc)
+
+    def bytes_many(self, pcicfg, pkt_sizes):
+        """Same as bytes() for an array of packet sizes"""
+        return self.bytes(pcicfg, np.asarray(pkt_sizes, dtype=np.int64))
+
+    def pkt_bytes(self, pcicfg, pkt_size):
+        """
+        Work out the bytes transferred per packet of @pkt_size (a
+        scalar or an array), averaging the steps performed once every
+        n packets.
+
+        @returns A tuple (tx_rx_data_B, tx_tx_data_B, rx_rx_data_B,
+                 rx_tx_data_B)
+        """
+        acc = [0.0, 0.0, 0.0, 0.0]
+        for step in self.steps:
+            size = pkt_size if step.size == PKT else step.size
+            self._add(acc, pcicfg, step, size, 1.0 / step.batch)
+        return tuple(acc)
+
+    def bw(self, pcicfg, bwspec, direction, pkt_size):
+        """
+        Estimate the PCIe bandwidth requirements of the device.
+
+        @param pcicfg    PCIe configuration
+        @param bwspec    Bandwidth specification
+        @param direction Direction(s) of the transfer
+        @param pkt_size  Size of the Ethernet frame
+        @returns A BW_Res object
+        """
+        if not direction & pcie.DIR_BOTH:
+            raise Exception("Unknown Direction %d" % direction)
+        return util.gen_res(bwspec, direction, *self.bytes(pcicfg, pkt_size))
+
+    def bw_many(self, pcicfg, bwspec, direction, pkt_sizes):
+        """
+        Same as bw() but for an array of packet sizes.
+
+        @returns A util.BW_Res_dtype array
+        """
+        return util.gen_res_many(bwspec, direction,
+                                 *self.bytes_many(pcicfg, pkt_sizes))
+
+    def ledger(self, pcicfg, direction, pkt_size):
+        """
+        Break down the bytes and TLPs by step.
+
+        @param pcicfg    PCIe configuration
+        @param direction Direction(s) of the transfer. Only the steps
+                         on the paths used are included.
+        @param pkt_size  Size of the Ethernet frame (a scalar or an array)
+        @returns A Ledger
+        """
+        if not direction & pcie.DIR_BOTH:
+            raise Exception("Unknown Direction %d" % direction)
+        # DIR_RX is from the device, i.e. the packet transmit path
+        paths = []
+        if direction & pcie.DIR_RX:
+            paths.append(PATH_TX)
+        if direction & pcie.DIR_TX:
+            paths.append(PATH_RX)
+        steps = [s for s in self.steps if s.path in paths]
+
+        pkt_size = np.asarray(pkt_size)
+        vals = []
+        for step in steps:
+            size = pkt_size if step.size == PKT else step.size
+            vals += step_bytes(pcicfg, step, size)
+            vals += step_tlps(pcicfg, step, size)
+        vals = np.array(np.broadcast_arrays(pkt_size, *vals)[1:],
+                        dtype=np.float64)
+        vals = vals.reshape((len(steps), 4) + pkt_size.shape)
+        batch = np.array([s.batch for s in steps], dtype=np.float64)
+        vals /= batch.reshape((-1, 1) + (1,) * pkt_size.ndim)
+        return Ledger(steps, pkt_size if pkt_size.ndim else int(pkt_size),
+                      vals[:, 0], vals[:, 1], vals[:, 2], vals[:, 3])
+
+
+# Descriptor and pointer sizes of the NICs below
+DESC_SZ = 16
+PTR_SZ = 4
+
+SIMPLE_NIC = Device('simple_nic', [
+    Step("H: TX tail pointer write", PATH_TX, HOST, OP_WR, PTR_SZ),
+    Step("D: TX descriptor read", PATH_TX, DEV, OP_RD, DESC_SZ),
+    Step("D: TX data read", PATH_TX, DEV, OP_RD, PKT),
+    Step("D: TX IRQ", PATH_TX, DEV, OP_WR, pcie.MSI_SIZE),
+    Step("H: TX head pointer read", PATH_TX, HOST, OP_RD, PTR_SZ),
+    Step("H: RX tail pointer write", PATH_RX, HOST, OP_WR, PTR_SZ),
+    Step("D: RX descriptor read", PATH_RX, DEV, OP_RD, DESC_SZ, req=False),
+    Step("D: RX data write", PATH_RX, DEV, OP_WR, PKT),
+    Step("D: RX descriptor write back", PATH_RX, DEV, OP_WR, DESC_SZ),
+    Step("D: RX IRQ", PATH_RX, DEV, OP_WR, pcie.MSI_SIZE),
+    Step("H: RX head pointer read", PATH_RX, HOST, OP_RD, PTR_SZ),
+    ])
+
+# Devices returned by niantic(), by parameters
+_Niantics = {}
+
+def niantic(irq_mod=32, h_opt=None, h_tx_batch=None, h_fl_batch=32,
+            h_rx_batch=8, d_tx_batch=40, d_tx_batch_wb=8, d_rx_batch=1):
+    """Return a Device for a Niantic style NIC. See niantic.bw() for
+    the details and the parameters. The device fetches @d_rx_batch RX
+    descriptors at a time. @h_tx_batch defaults to 1, or 32 with
+    @h_opt="PMD"."""
+    key = (irq_mod, h_opt, h_tx_batch, h_fl_batch, h_rx_batch, d_tx_batch,
+           d_tx_batch_wb, d_rx_batch)
+    dev = _Niantics.get(key)
+    if dev is not None:
+        return dev
+    if h_tx_batch is None:
+        h_tx_batch = 32 if h_opt == "PMD" else 1
+    if h_opt == "PMD":
+        irq_mod = 0
+    steps = [
+        Step("H: TX tail pointer write", PATH_TX, HOST, OP_WR, PTR_SZ,
+             h_tx_batch),
+        Step("D: TX descriptor read", PATH_TX, DEV, OP_RD,
+             DESC_SZ * d_tx_batch, d_tx_batch),
+        Step("D: TX data read", PATH_TX, DEV, OP_RD, PKT),
+        Step("D: TX descriptor write back", PATH_TX, DEV, OP_WR,
+             DESC_SZ * d_tx_batch_wb, d_tx_batch_wb),
+        Step("H: RX tail pointer write", PATH_RX, HOST, OP_WR, PTR_SZ,
+             h_fl_batch),
+        Step("D: RX descriptor read", PATH_RX, DEV, OP_RD,
+             DESC_SZ * d_rx_batch, d_rx_batch, req=False),
+        Step("D: RX data write", PATH_RX, DEV, OP_WR, PKT),
+        Step("D: RX descriptor write back", PATH_RX, DEV, OP_WR, DESC_SZ),
+        ]
+    if h_opt != "PMD":
+        if irq_mod > 0:
+            steps += [
+                Step("D: TX IRQ", PATH_TX, DEV, OP_WR, pcie.MSI_SIZE,
+                     irq_mod),
+                Step("D: RX IRQ", PATH_RX, DEV, OP_WR, pcie.MSI_SIZE,
+                     irq_mod)]
+        steps += [
+            Step("H: TX head pointer read", PATH_TX, HOST, OP_RD, PTR_SZ,
+                 h_tx_batch),
+            Step("H: RX head pointer read", PATH_RX, HOST, OP_RD, PTR_SZ,
+                 h_rx_batch)]
+    dev = Device('niantic_pmd' if h_opt == "PMD" else 'niantic', steps)
+    _Niantics[key] = dev
+    return dev
+
+NIANTIC = niantic()
+NIANTIC_PMD = niantic(h_opt="PMD")
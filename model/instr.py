@@ -0,0 +1,213 @@
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""Opt-in instrumentation of the model entry points
+
+The entry points of the models (mem_bw.*, util.gen_res*,
+simple_nic.bw*, niantic.bw*) are marked with @instrument. The methods
+of eth.Cfg and the construction of pcie.Cfg objects are registered
+when this module is imported, as pcie.py and eth.py can also be run
+on their own.
+
+Instrumentation is off by default and then costs nothing: @instrument
+returns the function unchanged. enable() replaces the registered
+functions in their modules (and classes) with wrappers which count
+and time every call, in total and per PCIe configuration (the first
+pcie.Cfg argument), and pass it to the hooks registered with
+add_hook(). enable(False) puts the original functions back. Calls
+through references taken before enable(), e.g. 'from .util import
+gen_res', are not counted.
+
+Times include the time spent in other instrumented functions called,
+e.g. niantic.bw() includes util.gen_res(). Memoised calls (see
+memo.py) are counted as well.
+
+The counters are per process. sweep.py evaluates shards in worker
+processes, which are set up with worker_init(), return their counters
+with take() and have them added to those of the sweeping process with
+merge(). Hooks can not be called across processes, so they are not
+called for the calls made by the workers of a sweep.
+
+stats() returns the counters, report() prints them and save() writes
+them as JSON.
+"""
+
+# pylint: disable=invalid-name
+# pylint: disable=global-statement
+
+import functools
+import json
+import sys
+import time
+
+from . import pcie
+from . import eth
+
+_On = False
+
+# Instrumented functions: (module or class, attribute, name)
+_Targets = []
+# Original functions replaced while enabled: (owner, attribute, original)
+_Saved = []
+
+# name -> [calls, seconds]
+_Calls = {}
+# (name, pcie.Cfg key) -> [calls, seconds]
+_Cfg_calls = {}
+_Hooks = []
+
+def _call(name, fn, args, kwargs):
+    start = time.perf_counter()
+    res = fn(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+
+    acc = _Calls.get(name)
+    if acc is None:
+        acc = _Calls[name] = [0, 0.0]
+    acc[0] += 1
+    acc[1] += elapsed
+    for arg in args:
+        if isinstance(arg, pcie.Cfg):
+            acc = _Cfg_calls.get((name, arg.key))
+            if acc is None:
+                acc = _Cfg_calls[(name, arg.key)] = [0, 0.0]
+            acc[0] += 1
+            acc[1] += elapsed
+            break
+    for hook in _Hooks:
+        hook(name, args, kwargs, res, elapsed)
+    return res
+
+def _wrap(fn, name):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not _On:
+            return fn(*args, **kwargs)
+        return _call(name, fn, args, kwargs)
+    return wrapper
+
+def instrument(fn):
+    """Decorator registering the module level function @fn (named
+    module.function) for instrumentation. Returns @fn unchanged."""
+    _Targets.append((sys.modules[fn.__module__], fn.__name__,
+                     "%s.%s" % (fn.__module__.rsplit('.', 1)[-1],
+                                fn.__name__)))
+    return fn
+
+def _instrument_class(cls, prefix, methods):
+    for method in methods:
+        _Targets.append((cls, method, "%s.%s" % (prefix, method)))
+
+_instrument_class(eth.Cfg, "eth.Cfg", ["pps", "bps", "pps_ex", "bps_ex",
+                                       "us_ex"])
+_Targets.append((pcie.Cfg, "__new__", "pcie.Cfg"))
+
+def enable(on=True):
+    """Turn instrumentation on or off"""
+    global _On
+    _On = on
+    if on and not _Saved:
+        for owner, attr, name in _Targets:
+            orig = vars(owner)[attr]
+            if isinstance(orig, staticmethod):
+                wrapper = staticmethod(_wrap(orig.__func__, name))
+            else:
+                wrapper = _wrap(orig, name)
+            _Saved.append((owner, attr, orig))
+            setattr(owner, attr, wrapper)
+    elif not on:
+        while _Saved:
+            owner, attr, orig = _Saved.pop()
+            setattr(owner, attr, orig)
+
+def enabled():
+    """Is instrumentation on?"""
+    return _On
+
+def add_hook(hook):
+    """Call @hook(name, args, kwargs, result, seconds) after each
+    instrumented call while instrumentation is enabled"""
+    _Hooks.append(hook)
+
+def remove_hook(hook):
+    """Remove a hook added with add_hook()"""
+    _Hooks.remove(hook)
+
+def reset():
+    """Reset all counters"""
+    _Calls.clear()
+    _Cfg_calls.clear()
+
+def take():
+    """Return the counters and reset them. The result can be passed to
+    another process and added to its counters with merge()."""
+    counts = ({name: tuple(acc) for name, acc in _Calls.items()},
+              {key: tuple(acc) for key, acc in _Cfg_calls.items()})
+    reset()
+    return counts
+
+def merge(counts):
+    """Add the counters @counts returned by take() to the counters"""
+    calls, cfg_calls = counts
+    for table, vals in ((_Calls, calls), (_Cfg_calls, cfg_calls)):
+        for key, (n, t) in vals.items():
+            acc = table.get(key)
+            if acc is None:
+                acc = table[key] = [0, 0.0]
+            acc[0] += n
+            acc[1] += t
+
+def worker_init(on):
+    """Set up instrumentation in a worker process, turning it on if
+    @on. Counters and hooks inherited from the parent process are
+    dropped."""
+    del _Hooks[:]
+    reset()
+    enable(on)
+
+def stats():
+    """
+    Return the counters as a dictionary:
+    - 'calls': name -> {'calls', 'seconds'}
+    - 'cfgs': a list of {'name', 'cfg' (pcie.Cfg parameters), 'calls',
+      'seconds'}, slowest first
+    """
+    cfgs = sorted(_Cfg_calls.items(), key=lambda kv: -kv[1][1])
+    return {
+        'calls': {name: {'calls': n, 'seconds': t}
+                  for name, (n, t) in _Calls.items()},
+        'cfgs': [{'name': name, 'cfg': list(key), 'calls': n,
+                  'seconds': t} for (name, key), (n, t) in cfgs]}
+
+def report(out=sys.stdout, top=10):
+    """Print the counters to @out, with the @top configurations taking
+    the most time"""
+    total = sum(t for _, t in _Calls.values()) or 1.0
+    out.write("%-24s %10s %10s %10s %6s\n" %
+              ("Function", "Calls", "Time (s)", "Mean (us)", "%"))
+    for name, (n, t) in sorted(_Calls.items(), key=lambda kv: -kv[1][1]):
+        out.write("%-24s %10d %10.3f %10.2f %6.1f\n" %
+                  (name, n, t, t * 1e6 / n, 100.0 * t / total))
+    if _Cfg_calls and top:
+        out.write("\n%-24s %-44s %10s %10s\n" %
+                  ("Function", "Configuration", "Calls", "Time (s)"))
+        cfgs = sorted(_Cfg_calls.items(), key=lambda kv: -kv[1][1])
+        for (name, key), (n, t) in cfgs[:top]:
+            out.write("%-24s %-44s %10d %10.3f\n" %
+                      (name, " ".join(str(v) for v in key), n, t))
+
+def save(fname):
+    """Write the counters (see stats()) to @fname as JSON"""
+    with open(fname, "w") as f:
+        json.dump(stats(), f, indent=2)
@@ -0,0 +1,163 @@
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""Find the smallest PCIe configurations sustaining a target rate
+
+A configuration is feasible if, for all given frame sizes, the PCIe
+limits of a NIC model (see bottleneck.solve()) allow at least the
+target packet rate: the Ethernet line rate, or a given data rate.
+
+search() returns the minimal feasible configurations: those for
+which no other feasible configuration has an older or equal version,
+no more lanes and no larger MPS and MRRS. Address width, ECRC and RCB
+are given.
+
+More lanes or a newer version only add bandwidth, so feasibility is
+monotonic in both. For each MPS and MRRS the oldest feasible version
+is found by bisection for each lane width, starting with the widest
+link. With fewer lanes the oldest feasible version can only be newer,
+so each bisection starts where the previous one ended and the search
+stops as soon as no version is feasible. MPS and MRRS are not
+monotonic in general (e.g. the TLP bandwidth changes with MPS) and
+all combinations are tried.
+
+Feasibility is not monotonic in the frame size either: the number of
+TLPs, and with it the overhead, jumps at multiples of MPS. All sizes
+are therefore evaluated (vectorised) rather than bisected;
+crossover() gives the smallest size from which on a configuration
+sustains the target.
+"""
+
+# pylint: disable=invalid-name
+# pylint: disable=too-many-arguments
+# pylint: disable=too-many-locals
+
+import numpy as np
+
+from . import pcie
+from . import bottleneck
+
+# Relative tolerance when comparing rates
+EPS = 1e-9
+
+def _or_all(vals, default):
+    return default if vals is None else vals
+
+def _target(res, gbps):
+    """Target packet rate for each record of @res"""
+    if gbps is None:
+        return res['eth_pps']
+    return gbps * 1e9 / (8.0 * res['size'])
+
+def _pcie_pps(res):
+    return np.minimum(np.minimum(res['pcie_rx_pps'], res['pcie_tx_pps']),
+                      res['lat_pps'])
+
+def sustained(pcicfg, ethcfg, model, direction, sizes, gbps=None, **kwargs):
+    """
+    Which of the frame @sizes does @pcicfg sustain the target rate for?
+
+    @param pcicfg    PCIe configuration
+    @param ethcfg    eth.Cfg of the network link
+    @param model     NIC model (see bottleneck.solve())
+    @param direction Direction(s) of the traffic
+    @param sizes     Array of frame sizes
+    @param gbps      Target data rate in Gb/s. Defaults to the line rate
+                     of @ethcfg.
+    @param kwargs    Passed to bottleneck.solve(), e.g. lat or irq_mod
+    @returns A boolean array, one entry per size
+    """
+    res = bottleneck.solve(pcicfg, ethcfg, model, direction, sizes, **kwargs)
+    return _pcie_pps(res) >= _target(res, gbps) * (1 - EPS)
+
+def feasible(pcicfg, ethcfg, model, direction, sizes, gbps=None, **kwargs):
+    """Does @pcicfg sustain the target rate for all @sizes? See
+    sustained() for the parameters."""
+    return bool(np.all(sustained(pcicfg, ethcfg, model, direction, sizes,
+                                 gbps, **kwargs)))
+
+def crossover(pcicfg, ethcfg, model, direction, sizes, gbps=None, **kwargs):
+    """Return the smallest of the (sorted) @sizes from which on @pcicfg
+    sustains the target rate for all larger sizes, or None. See
+    sustained() for the parameters."""
+    sizes = np.asarray(sizes)
+    ok = sustained(pcicfg, ethcfg, model, direction, sizes, gbps, **kwargs)
+    bad = np.flatnonzero(~ok)
+    if not len(bad):
+        return int(sizes[0]) if len(sizes) else None
+    if bad[-1] == len(sizes) - 1:
+        return None
+    return int(sizes[bad[-1] + 1])
+
+def _dominates(a, b):
+    """Is the configuration @a at most @b in all parameters (and not
+    the same)?"""
+    return a is not b and \
+        pcie.Vers_idx[a.version] <= pcie.Vers_idx[b.version] and \
+        pcie.Laness_idx[a.lanes] <= pcie.Laness_idx[b.lanes] and \
+        a.mps <= b.mps and a.mrrs <= b.mrrs
+
+def search(ethcfg, model, direction, sizes, gbps=None, versions=None,
+           lanes=None, mpss=None, mrrss=None, addr=64, ecrc=0, rcb=64,
+           rcb_chunks=False, **kwargs):
+    """
+    Find the minimal PCIe configurations sustaining the target rate
+    for all frame @sizes.
+
+    @param ethcfg    eth.Cfg of the network link
+    @param model     NIC model (see bottleneck.solve())
+    @param direction Direction(s) of the traffic
+    @param sizes     Array of frame sizes
+    @param gbps      Target data rate in Gb/s. Defaults to the line rate
+                     of @ethcfg.
+    @param versions, lanes, mpss, mrrss  Lists of values to consider,
+                     all legal values by default
+    @param addr, ecrc, rcb, rcb_chunks  Fixed parameters of the
+                     configurations
+    @param kwargs    Passed to bottleneck.solve(), e.g. lat or irq_mod
+    @returns A tuple (list of minimal pcie.Cfg, ordered by raw
+             bandwidth, number of configurations evaluated)
+    """
+    vers = sorted(_or_all(versions, pcie.Vers), key=pcie.Vers_idx.get)
+    laness = sorted(_or_all(lanes, pcie.Laness), key=pcie.Laness_idx.get)
+    sizes = np.asarray(sizes, dtype=np.int64)
+    evals = [0]
+
+    def ok(ver, lns, mps, mrrs):
+        evals[0] += 1
+        cfg = pcie.Cfg(ver, lns, addr, ecrc, mps, mrrs, rcb, rcb_chunks)
+        return feasible(cfg, ethcfg, model, direction, sizes, gbps, **kwargs)
+
+    found = []
+    for mps in _or_all(mpss, pcie.MPSs):
+        for mrrs in _or_all(mrrss, pcie.MRRSs):
+            lo = 0
+            for lns in reversed(laness):
+                # bisect for the oldest feasible version in vers[lo:]
+                hi = len(vers)
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if ok(vers[mid], lns, mps, mrrs):
+                        hi = mid
+                    else:
+                        lo = mid + 1
+                if lo == len(vers):
+                    # no version works, nor will it with fewer lanes
+                    break
+                found.append(pcie.Cfg(vers[lo], lns, addr, ecrc, mps, mrrs,
+                                      rcb, rcb_chunks))
+
+    minimal = [c for c in found if not any(_dominates(o, c) for o in found)]
+    minimal.sort(key=lambda c: (c.RAW_bw, c.mps, c.mrrs))
+    return minimal, evals[0]
@@ -0,0 +1,160 @@
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""A precomputed, memory mapped database of model results
+
+build() evaluates the models (see sweep.Models) for a set of PCIe
+configurations and a contiguous range of sizes and stores the results
+in a directory containing:
+- 'index.json': The models, directions, size range and fields stored
+  and, per model, the hash of its source (see cache.source_hash())
+- 'cfgs.npy': For each pcie.Cfg.id the row in the data array (or -1)
+- 'data.npy': An array of shape (#cfgs, #model/directions, #sizes,
+  #fields)
+
+A DB object memory maps these files and answers queries by computing
+the offset of the result instead of running the model. Opening a
+database built with a different version of a model fails, as its
+results would be stale.
+"""
+
+# pylint: disable=invalid-name
+# pylint: disable=too-many-arguments
+# pylint: disable=too-many-locals
+
+import json
+import os
+
+import numpy as np
+
+from . import pcie
+from . import sweep
+from . import cache
+
+INDEX = "index.json"
+CFGS = "cfgs.npy"
+DATA = "data.npy"
+
+def _versions(models):
+    """Return the source hash of each of the @models, by name"""
+    return {m: cache.source_hash(sweep.Models[m][0]) for m in models}
+
+def build(path, cfgs=None, models=None, min_size=1, max_size=1500,
+          fields=('rx_eff', 'tx_eff'), dtype=np.float32,
+          processes=None, shard_size=64):
+    """Build a database in the directory @path.
+
+    @param cfgs: List of pcie.Cfg argument tuples (see sweep.space()).
+                 Defaults to all legal configurations.
+    @param models: List of model names (see sweep.Models). Defaults to all
+    @param min_size, max_size: Range of sizes to evaluate (inclusive)
+    @param fields: Which of the util.BW_Res_dtype fields to store
+    @param dtype: Type to store the results as
+    @param processes, shard_size: See sweep.run()
+    @returns The number of results stored
+    """
+    if cfgs is None:
+        cfgs = sweep.space()
+    if models is None:
+        models = sweep.Model_names
+    sizes = np.arange(min_size, max_size + 1)
+    model_dirs = [(m, d) for m in models for d in sweep.Models[m][1]]
+
+    os.makedirs(path, exist_ok=True)
+
+    cfg_rows = np.full(pcie.Num_Cfgs, -1, dtype=np.int32)
+    for row, args in enumerate(cfgs):
+        cfg_rows[pcie.Cfg(*args).id] = row
+    np.save(os.path.join(path, CFGS), cfg_rows)
+
+    shape = (len(cfgs), len(model_dirs), len(sizes), len(fields))
+    data = np.lib.format.open_memmap(os.path.join(path, DATA), mode='w+',
+                                     dtype=dtype, shape=shape)
+    row = 0
+    # shards come back in order, with the results for each
+    # configuration grouped by model, direction and size
+    for tbl in sweep.run(cfgs, models, sizes, processes, shard_size):
+        n = len(tbl) // (len(model_dirs) * len(sizes))
+        for i, field in enumerate(fields):
+            data[row:row + n, :, :, i] = \
+                tbl[field].reshape(n, len(model_dirs), len(sizes))
+        row += n
+    data.flush()
+    del data
+
+    index = {'models': [[m, d] for m, d in model_dirs],
+             'min_size': int(min_size),
+             'max_size': int(max_size),
+             'fields': list(fields),
+             'versions': _versions(m for m, _ in model_dirs)}
+    with open(os.path.join(path, INDEX), "w") as f:
+        json.dump(index, f, indent=1)
+    return int(np.prod(shape))
+
+
+class DB():
+    """A database built with build(), opened read-only. Unless @check
+    is False, the models must be the same version as when it was
+    built."""
+
+    def __init__(self, path, check=True):
+        with open(os.path.join(path, INDEX)) as f:
+            index = json.load(f)
+        if check:
+            built = index.get('versions', {})
+            models = sorted(set(m for m, _ in index['models']))
+            stale = [m for m, ver in _versions(models).items()
+                     if built.get(m) != ver]
+            if stale:
+                raise Exception("%s was built with a different version of "
+                                "%s, rebuild it" % (path, ", ".join(stale)))
+        self.model_dirs = {(m, d): i for i, (m, d) in enumerate(index['models'])}
+        self.min_size = index['min_size']
+        self.max_size = index['max_size']
+        self.fields = {field: i for i, field in enumerate(index['fields'])}
+        self.cfg_rows = np.load(os.path.join(path, CFGS), mmap_mode='r')
+        self.data = np.load(os.path.join(path, DATA), mmap_mode='r')
+
+    def _offsets(self, cfg_ids, model, direction, field):
+        rows = self.cfg_rows[cfg_ids]
+        if np.any(rows < 0):
+            raise Exception("Configuration not in database")
+        try:
+            md = self.model_dirs[(model, direction)]
+        except KeyError:
+            raise Exception("Model %s (direction %d) not in database" %
+                            (model, direction))
+        try:
+            fld = self.fields[field]
+        except KeyError:
+            raise Exception("Field %s not in database" % field)
+        return rows, md, fld
+
+    def query(self, pcicfg, model, direction, size, field='tx_eff'):
+        """Return the result @field of @model for the PCIe configuration
+        @pcicfg, @direction and @size"""
+        if not self.min_size <= size <= self.max_size:
+            raise Exception("Size %d not in database" % size)
+        row, md, fld = self._offsets(pcicfg.id, model, direction, field)
+        return float(self.data[row, md, size - self.min_size, fld])
+
+    def query_many(self, cfg_ids, model, direction, sizes, field='tx_eff'):
+        """Vectorised query() for arrays of configuration ids (see
+        pcie.Cfg.id) and sizes (which are broadcast against each other)"""
+        sizes = np.asarray(sizes)
+        if np.any((sizes < self.min_size) | (sizes > self.max_size)):
+            raise Exception("Sizes not in database")
+        rows, md, fld = self._offsets(np.asarray(cfg_ids), model, direction,
+                                      field)
+        return self.data[rows, md, sizes - self.min_size, fld]
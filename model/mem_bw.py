@@ -20,8 +20,14 @@
 # pylint: disable=unused-variable
 
 import math
+import numpy as np
 from . import pcie
+from . import util
+from .memo import memoize
+from .instr import instrument
 
+@instrument
+@memoize
 def write(pcicfg, bwspec, size):
     """
     Calculate the bandwidth a simple continuous PCIe memory write of
@@ -49,6 +55,8 @@ def write(pcicfg, bwspec, size):
 
     return pcie.BW_Res(0.0, 0.0, raw_bw, eff_bw)
 
+@instrument
+@memoize
 def read(pcicfg, bwspec, size):
     """
     Calculate the bandwidth a simple continuous PCIe memory read of
@@ -122,12 +130,17 @@ def read(pcicfg, bwspec, size):
     else: # BW_EFF
         if not bwspec.tx_bw == 0:
             print("Effective TX BW for reads is always 0")
-            bwspec.tx_bw = 0
-        eff_tx_bw = bwspec.tx_bw
+        eff_tx_bw = 0
         eff_rx_bw = bwspec.rx_bw
+        # raw bandwidth for the data and the requests for it
+        num_trans = eff_rx_bw / float(dat_rx_B)
+        req_raw_rx_bw = eff_rx_bw * raw_rx_B / float(dat_rx_B)
+        req_raw_tx_bw = num_trans * raw_tx_B
 
     return pcie.BW_Res(req_raw_rx_bw, eff_rx_bw, req_raw_tx_bw, eff_tx_bw)
 
+@instrument
+@memoize
 def read_write(pcicfg, bwspec, size):
     """
     PCIe read and writes at the same time. read should impact write
@@ -214,3 +227,256 @@ def read_write(pcicfg, bwspec, size):
         req_raw_rx_bw = eff_rx_bw * raw_rx_B / float(eff_data)
 
     return pcie.BW_Res(req_raw_rx_bw, eff_rx_bw, req_raw_tx_bw, eff_tx_bw)
+
+# Which bound limits the bandwidth of reads, see read_lat()
+BOUND_BW = 0
+BOUND_LAT = 1
+
+def _lat_bound(pcicfg, bwspec, size, raw_rx_B, lat, tags, np_credits):
+    """Maximum effective RX bandwidth in Gb/s of reads of @size bytes
+    (scalar or array) given the latency and outstanding requests"""
+    if bwspec.type != pcie.BW_Spec.BW_RAW:
+        raise Exception("Latency bound requires a raw bandwidth specification")
+    outstanding = tags if np_credits is None else min(tags, np_credits)
+    num_reqs = util.ceil_div(size, pcicfg.mrrs)
+    # A request is outstanding for the completion latency plus the
+    # time it takes to receive its completions (bits / Gb/s = ns)
+    req_ns = lat + (raw_rx_B * 8.0 / num_reqs) / bwspec.rx_bw
+    return outstanding * (size * 8.0 / num_reqs) / req_ns
+
+@instrument
+@memoize
+def read_lat(pcicfg, bwspec, size, lat, tags=pcie.Tags[8], np_credits=None):
+    """
+    Calculate the bandwidth of continuous PCIe memory reads of size
+    'size' taking into account the latency of the reads.
+
+    read() assumes that enough reads can be outstanding to use all
+    the available bandwidth. By Little's law the rate of read requests
+    is at most the number of outstanding requests divided by the time
+    each is outstanding. The number of outstanding requests is limited
+    by the number of tags of the requester and the non-posted credits
+    of the completer. A request is outstanding for the completion
+    latency plus the time to receive its completions. If this bound is
+    lower than the bandwidth bound, the bandwidth in both directions
+    is reduced accordingly.
+
+    Only raw bandwidth specifications are supported.
+
+    @param pcicfg    PCIe configuration
+    @param bwspec    Bandwidth specification
+    @param size      Size of payload in bytes
+    @param lat       Completion latency (request sent to first completion
+                     received) in ns
+    @param tags      Number of tags, see pcie.Tags
+    @param np_credits Non-posted header credits of the completer or None
+                     if unlimited. Assumes the completer only returns a
+                     credit once it has completed the request.
+    @returns A tuple (pcie.BW_Res, BOUND_BW or BOUND_LAT)
+    """
+    res = read(pcicfg, bwspec, size)
+    raw_rx_B = res.rx_raw * size / res.rx_eff
+    max_rx_eff = _lat_bound(pcicfg, bwspec, size, raw_rx_B, lat, tags,
+                            np_credits)
+    if max_rx_eff >= res.rx_eff:
+        return res, BOUND_BW
+    scale = max_rx_eff / res.rx_eff
+    return pcie.BW_Res(res.rx_raw * scale, max_rx_eff,
+                       res.tx_raw * scale, res.tx_eff * scale), BOUND_LAT
+
+
+## Vectorised versions of the above. They take an array of sizes
+## instead of a single size and return a structured array of
+## util.BW_Res_dtype with one entry per size.
+##
+## Each is split into working out the bytes transferred
+## (*_bytes_many()), which returns a tuple of arrays (data_B,
+## raw_rx_B, raw_tx_B), and working out the bandwidth from these
+## (*_res_many()).
+
+def write_bytes_many(pcicfg, sizes):
+    """
+    Bytes transferred for writes of @sizes. See write().
+
+    @param pcicfg    PCIe configuration
+    @param sizes     Array of payload sizes in bytes
+    @returns A tuple of arrays (data_B, raw_rx_B, raw_tx_B)
+    """
+    data_bytes = np.asarray(sizes, dtype=np.int64)
+
+    # compute the number of TLPs
+    num_tlps = util.ceil_div(data_bytes, pcicfg.mps)
+    raw_bytes = (num_tlps * pcicfg.TLP_MWr_Hdr_Sz) + data_bytes
+    return data_bytes, np.zeros_like(data_bytes), raw_bytes
+
+def write_res_many(bwspec, data_bytes, _raw_rx_B, raw_bytes):
+    """
+    Bandwidth for writes given the bytes from write_bytes_many()
+
+    @param bwspec    Bandwidth specification
+    @returns A util.BW_Res_dtype array
+    """
+    res = np.zeros(np.shape(data_bytes), dtype=util.BW_Res_dtype)
+    if bwspec.type == pcie.BW_Spec.BW_RAW:
+        res['tx_raw'] = bwspec.tx_bw
+        res['tx_eff'] = data_bytes * bwspec.tx_bw / raw_bytes
+    else:
+        res['tx_eff'] = bwspec.tx_bw
+        res['tx_raw'] = raw_bytes * bwspec.tx_bw / data_bytes
+    return res
+
+@instrument
+def write_many(pcicfg, bwspec, sizes):
+    """
+    Same as write() but for an array of sizes.
+
+    @param pcicfg    PCIe configuration
+    @param bwspec    Bandwidth specification
+    @param sizes     Array of payload sizes in bytes
+    @returns A util.BW_Res_dtype array
+    """
+    return write_res_many(bwspec, *write_bytes_many(pcicfg, sizes))
+
+def read_bytes_many(pcicfg, sizes):
+    """
+    Bytes transferred for reads of @sizes. See read().
+
+    @param pcicfg    PCIe configuration
+    @param sizes     Array of payload sizes in bytes
+    @returns A tuple of arrays (data_B, raw_rx_B, raw_tx_B)
+    """
+    dat_rx_B = np.asarray(sizes, dtype=np.int64)
+
+    # Read requests, broken up according to MRRS
+    tx_num_tlps = util.ceil_div(dat_rx_B, pcicfg.mrrs)
+    raw_tx_B = tx_num_tlps * pcicfg.TLP_MRd_Hdr_Sz
+
+    # Completions with data, chopped up into RCB or MPS sized chunks
+    if pcicfg.rcb_chunks:
+        rx_num_tlps = util.ceil_div(dat_rx_B, pcicfg.rcb)
+    else:
+        rx_num_tlps = util.ceil_div(dat_rx_B, pcicfg.mps)
+    raw_rx_B = (rx_num_tlps * pcicfg.TLP_CplD_Hdr_Sz) + dat_rx_B
+    return dat_rx_B, raw_rx_B, raw_tx_B
+
+def read_res_many(bwspec, dat_rx_B, raw_rx_B, raw_tx_B):
+    """
+    Bandwidth for reads given the bytes from read_bytes_many()
+
+    For a BW_EFF specification the effective TX bandwidth is always 0
+    and the required raw bandwidth in both directions is derived from
+    the number of reads needed to achieve the effective RX bandwidth.
+
+    @param bwspec    Bandwidth specification
+    @returns A util.BW_Res_dtype array
+    """
+    res = np.zeros(np.shape(dat_rx_B), dtype=util.BW_Res_dtype)
+    if bwspec.type == pcie.BW_Spec.BW_RAW:
+        req_raw_rx_bw, req_raw_tx_bw = util.raw_bound_many(bwspec,
+                                                           raw_rx_B, raw_tx_B)
+        res['rx_raw'] = req_raw_rx_bw
+        res['rx_eff'] = dat_rx_B * req_raw_rx_bw / raw_rx_B
+        res['tx_raw'] = req_raw_tx_bw
+    else: # BW_EFF
+        num_trans = bwspec.rx_bw / np.asarray(dat_rx_B, dtype=np.float64)
+        res['rx_eff'] = bwspec.rx_bw
+        res['rx_raw'] = bwspec.rx_bw * raw_rx_B / dat_rx_B
+        res['tx_raw'] = num_trans * raw_tx_B
+    return res
+
+@instrument
+def read_many(pcicfg, bwspec, sizes):
+    """
+    Same as read() but for an array of sizes. See read_res_many() for
+    BW_EFF specifications.
+
+    @param pcicfg    PCIe configuration
+    @param bwspec    Bandwidth specification
+    @param sizes     Array of payload sizes in bytes
+    @returns A util.BW_Res_dtype array
+    """
+    return read_res_many(bwspec, *read_bytes_many(pcicfg, sizes))
+
+def read_write_bytes_many(pcicfg, sizes):
+    """
+    Bytes transferred for simultaneous reads and writes of @sizes. See
+    read_write().
+
+    @param pcicfg    PCIe configuration
+    @param sizes     Array of payload sizes in bytes
+    @returns A tuple of arrays (data_B, raw_rx_B, raw_tx_B)
+    """
+    data_bytes = np.asarray(sizes, dtype=np.int64)
+
+    # Write bytes, all transmitted by the device
+    wr_tx_num_tlps = util.ceil_div(data_bytes, pcicfg.mps)
+    wr_tx_data_B = (wr_tx_num_tlps * pcicfg.TLP_MWr_Hdr_Sz) + data_bytes
+
+    # Read bytes
+    rd_tx_num_tlps = util.ceil_div(data_bytes, pcicfg.mrrs)
+    rd_tx_data_B = rd_tx_num_tlps * pcicfg.TLP_MRd_Hdr_Sz
+    if pcicfg.rcb_chunks:
+        rd_rx_num_tlps = util.ceil_div(data_bytes, pcicfg.rcb)
+    else:
+        rd_rx_num_tlps = util.ceil_div(data_bytes, pcicfg.mps)
+    rd_rx_data_B = (rd_rx_num_tlps * pcicfg.TLP_CplD_Hdr_Sz) + data_bytes
+
+    return data_bytes, rd_rx_data_B, wr_tx_data_B + rd_tx_data_B
+
+def read_write_res_many(bwspec, data_bytes, raw_rx_B, raw_tx_B):
+    """
+    Bandwidth for simultaneous reads and writes given the bytes from
+    read_write_bytes_many()
+
+    @param bwspec    Bandwidth specification
+    @returns A util.BW_Res_dtype array
+    """
+    res = np.zeros(np.shape(data_bytes), dtype=util.BW_Res_dtype)
+    if bwspec.type == pcie.BW_Spec.BW_RAW:
+        req_raw_rx_bw, req_raw_tx_bw = util.raw_bound_many(bwspec,
+                                                           raw_rx_B, raw_tx_B)
+        res['rx_raw'] = req_raw_rx_bw
+        res['rx_eff'] = data_bytes * req_raw_rx_bw / raw_rx_B
+        res['tx_raw'] = req_raw_tx_bw
+        res['tx_eff'] = data_bytes * req_raw_tx_bw / raw_tx_B
+    else: # BW_EFF
+        res['rx_eff'] = bwspec.rx_bw
+        res['tx_eff'] = bwspec.tx_bw
+        res['rx_raw'] = bwspec.rx_bw * raw_rx_B / data_bytes
+        res['tx_raw'] = bwspec.tx_bw * raw_tx_B / data_bytes
+    return res
+
+@instrument
+def read_write_many(pcicfg, bwspec, sizes):
+    """
+    Same as read_write() but for an array of sizes.
+
+    @param pcicfg    PCIe configuration
+    @param bwspec    Bandwidth specification
+    @param sizes     Array of payload sizes in bytes
+    @returns A util.BW_Res_dtype array
+    """
+    return read_write_res_many(bwspec, *read_write_bytes_many(pcicfg, sizes))
+
+@instrument
+def read_lat_many(pcicfg, bwspec, sizes, lat, tags=pcie.Tags[8],
+                  np_credits=None):
+    """
+    Same as read_lat() but for an array of sizes.
+
+    @param pcicfg    PCIe configuration
+    @param bwspec    Bandwidth specification
+    @param sizes     Array of payload sizes in bytes
+    @param lat, tags, np_credits  See read_lat()
+    @returns A tuple of a util.BW_Res_dtype array and an array with
+             BOUND_BW or BOUND_LAT for each size
+    """
+    dat_rx_B, raw_rx_B, raw_tx_B = read_bytes_many(pcicfg, sizes)
+    res = read_res_many(bwspec, dat_rx_B, raw_rx_B, raw_tx_B)
+    max_rx_eff = _lat_bound(pcicfg, bwspec, dat_rx_B, raw_rx_B, lat, tags,
+                            np_credits)
+    bound = np.where(max_rx_eff < res['rx_eff'], BOUND_LAT, BOUND_BW)
+    scale = np.minimum(max_rx_eff / res['rx_eff'], 1.0)
+    for name in res.dtype.names:
+        res[name] *= scale
+    return res, bound
@@ -0,0 +1,128 @@
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""In-process memoisation of the scalar models
+
+The scalar model functions (e.g. mem_bw.read() or niantic.bw()) are
+decorated with @memoize. Calls with the same arguments return the
+result of the first call. pcie.Cfg, pcie.BW_Spec, directions, sizes
+and options such as h_opt are all hashable values. Calls with
+unhashable arguments (e.g. NumPy arrays) are passed through.
+
+Each memoised function keeps at most 'maxsize' results and evicts the
+least recently used one when full. The results are shared between
+callers, which is why pcie.BW_Res objects and the arrays of
+device.Ledger objects (returned with detail=True) are read-only.
+
+stats() returns the hits and misses of all memoised functions,
+clear() drops all results and set_maxsize() changes the bound.
+Memoisation can be turned off with enable(False).
+"""
+
+# pylint: disable=invalid-name
+# pylint: disable=global-statement
+
+import collections
+import functools
+
+# Default number of results kept per function
+MAXSIZE = 4096
+
+# All memoised functions, by name
+_Registry = {}
+_Enabled = True
+
+class Memo():
+    """The results and statistics of one memoised function"""
+
+    def __init__(self, fn, maxsize):
+        self.fn = fn
+        self.maxsize = maxsize
+        self.results = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def call(self, args, kwargs):
+        """Return fn(*@args, **@kwargs), remembering the result"""
+        if not _Enabled or self.maxsize <= 0:
+            return self.fn(*args, **kwargs)
+        key = (args, tuple(sorted(kwargs.items()))) if kwargs else args
+        try:
+            res = self.results[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # unhashable arguments
+            return self.fn(*args, **kwargs)
+        else:
+            self.hits += 1
+            self.results.move_to_end(key)
+            return res
+
+        self.misses += 1
+        res = self.fn(*args, **kwargs)
+        self.results[key] = res
+        if len(self.results) > self.maxsize:
+            self.results.popitem(last=False)
+        return res
+
+    def clear(self):
+        """Drop all results and reset the statistics"""
+        self.results.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        """Return a dictionary with the statistics"""
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self.results), 'maxsize': self.maxsize}
+
+
+def memoize(fn=None, maxsize=None):
+    """Decorator memoising @fn, keeping at most @maxsize results
+    (MAXSIZE by default). Can be used as @memoize or
+    @memoize(maxsize=N). The Memo object is available as fn.memo."""
+    if fn is None:
+        return lambda f: memoize(f, maxsize)
+
+    memo = Memo(fn, MAXSIZE if maxsize is None else maxsize)
+    _Registry["%s.%s" % (fn.__module__, fn.__name__)] = memo
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return memo.call(args, kwargs)
+    wrapper.memo = memo
+    return wrapper
+
+def stats():
+    """Return the statistics (see Memo.info()) of all memoised
+    functions, by name"""
+    return {name: memo.info() for name, memo in _Registry.items()}
+
+def clear():
+    """Drop the results of all memoised functions"""
+    for memo in _Registry.values():
+        memo.clear()
+
+def set_maxsize(maxsize):
+    """Set the number of results kept by all memoised functions"""
+    for memo in _Registry.values():
+        memo.maxsize = maxsize
+        while len(memo.results) > max(maxsize, 0):
+            memo.results.popitem(last=False)
+
+def enable(on=True):
+    """Turn memoisation on or off"""
+    global _Enabled
+    _Enabled = on
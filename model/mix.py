@@ -0,0 +1,178 @@
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""Evaluate the models for a mix of packet sizes
+
+A Mix is a distribution of packet sizes: an array of sizes and the
+fraction of packets of each size. Evaluating a model for a mix works
+out the bytes transferred for each size (vectorised over the sizes),
+averages them weighted by the fraction of packets and derives the
+bandwidth from the averages. This is the bandwidth of a stream of
+packets with the given distribution, not the average of the
+bandwidths of the individual sizes.
+
+Sizes are Ethernet frame sizes including the FCS. As for
+bottleneck.solve() and nic_bw.py, the FCS is not transferred over PCIe
+and is subtracted before the models are evaluated, unless strip_fcs
+is False.
+
+Models are given by name (see piecewise.Models) or as a device.Device.
+"""
+
+# pylint: disable=invalid-name
+# pylint: disable=too-many-arguments
+# pylint: disable=too-few-public-methods
+
+import numpy as np
+
+from . import pcie
+from . import eth
+from . import util
+from . import piecewise
+
+# Some common mixes of Ethernet frame sizes (including CRC) as lists
+# of (size, weight). The simple IMIX uses 40, 576 and 1500 byte IP
+# packets in the ratio 7:4:1.
+Mixes = {
+    'imix'       : [(64, 7), (594, 4), (1518, 1)],
+    'tolly_imix' : [(64, 55), (78, 5), (576, 17), (1518, 23)],
+    }
+
+class Mix():
+    """A distribution of packet sizes.
+
+    - sizes: Array of distinct frame sizes (including the FCS)
+    - weights: Fraction of packets of each size (sums to 1)
+    """
+
+    def __init__(self, sizes, weights, name=None):
+        """Create a mix from arrays of @sizes and @weights (e.g. packet
+        counts of a histogram). Weights are normalised."""
+        sizes = np.asarray(sizes, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float64)
+        if sizes.ndim != 1 or sizes.shape != weights.shape or not len(sizes):
+            raise Exception("Need one weight per size")
+        if np.any(sizes <= 0) or np.any(weights < 0) or weights.sum() <= 0:
+            raise Exception("Sizes and weights must be positive")
+        # merge duplicate sizes
+        self.sizes, idx = np.unique(sizes, return_inverse=True)
+        self.weights = np.bincount(idx, weights) / weights.sum()
+        self.name = name
+
+    @property
+    def avg_size(self):
+        """Average packet size"""
+        return float(np.dot(self.weights, self.sizes))
+
+    def __repr__(self):
+        return "Mix(%s, avg=%.1f, %d sizes)" % (self.name, self.avg_size,
+                                                len(self.sizes))
+
+def preset(name):
+    """Return one of the Mixes by @name"""
+    if name not in Mixes:
+        raise Exception("Unknown mix: %s" % name)
+    sizes, weights = zip(*Mixes[name])
+    return Mix(sizes, weights, name)
+
+def from_samples(sizes, name=None):
+    """Return the Mix of a sequence of packet sizes"""
+    sizes, counts = np.unique(np.asarray(sizes, dtype=np.int64),
+                              return_counts=True)
+    return Mix(sizes, counts, name)
+
+def model_fns(model):
+    """Return the functions to work out the bytes and the bandwidth
+    (see piecewise.Models) for a model name or a device.Device"""
+    if hasattr(model, 'bytes_many'):
+        return model.bytes_many, util.gen_res_many
+    if model not in piecewise.Models:
+        raise Exception("Unknown model: %s" % model)
+    return piecewise.Models[model]
+
+def evaluate_many(pcicfg, bwspec, direction, model, sizes, weights,
+                  strip_fcs=True, **kwargs):
+    """
+    Evaluate @model for a number of mixes over the same @sizes.
+
+    @param pcicfg    PCIe configuration
+    @param bwspec    Bandwidth specification
+    @param direction Direction(s), ignored by the memory models
+    @param model     Model name (see piecewise.Models) or device.Device
+    @param sizes     Array of Ethernet frame sizes (including the FCS)
+    @param weights   Array of shape (#mixes, #sizes) with the fraction of
+                     packets of each size for each mix
+    @param strip_fcs The FCS is not transferred over PCIe
+    @param kwargs    Passed to the model, e.g. irq_mod for niantic
+    @returns A tuple of a util.BW_Res_dtype array and an array with the
+             packets per second, with one entry per mix
+    """
+    bytes_fn, res_fn = model_fns(model)
+    weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+    sizes = np.asarray(sizes, dtype=np.int64)
+    pkt_sizes = sizes - eth.CRC if strip_fcs else sizes
+    if np.any(pkt_sizes <= 0):
+        raise Exception("Frame sizes must be larger than the FCS")
+    cols = np.array(np.broadcast_arrays(*bytes_fn(pcicfg, pkt_sizes,
+                                                  **kwargs)),
+                    dtype=np.float64)
+    avg = weights @ cols.T
+    res = res_fn(bwspec, direction, *avg.T)
+    # The packet rate follows from the effective bandwidth and the
+    # average size of the packets transferred
+    avg_size = weights @ pkt_sizes.astype(np.float64)
+    pps = np.maximum(res['rx_eff'], res['tx_eff']) * 1e9 / (8.0 * avg_size)
+    return res, pps
+
+def evaluate(pcicfg, bwspec, direction, model, m, strip_fcs=True, **kwargs):
+    """
+    Evaluate @model for the Mix @m. See evaluate_many() for the
+    parameters.
+
+    @returns A tuple (pcie.BW_Res, packets per second)
+    """
+    res, pps = evaluate_many(pcicfg, bwspec, direction, model, m.sizes,
+                             m.weights, strip_fcs, **kwargs)
+    r = res[0]
+    return (pcie.BW_Res(float(r['rx_raw']), float(r['rx_eff']),
+                        float(r['tx_raw']), float(r['tx_eff'])),
+            float(pps[0]))
+
+def eth_rate(ethcfg, m):
+    """Return (packets per second, Gb/s of frame data) of a mix @m of
+    frames at the line rate of the eth.Cfg @ethcfg"""
+    # Time on the wire of the average frame, in bytes
+    wire_B = np.maximum(m.sizes - ethcfg.hdr_sz - ethcfg.crc_sz,
+                        ethcfg.min_pay) + ethcfg.hdr_sz + ethcfg.crc_sz + \
+             ethcfg.pre_sz + ethcfg.trail_sz
+    pps = ethcfg.rate / (8.0 * float(np.dot(m.weights, wire_B)))
+    return pps, pps * m.avg_size * 8 / 1e9
+
+def demand(pcicfg, direction, model, m, ethcfg, strip_fcs=True, **kwargs):
+    """
+    PCIe bandwidth required to sustain the mix @m at the line rate of
+    the eth.Cfg @ethcfg in @direction(s). See evaluate_many() for
+    @strip_fcs.
+
+    @returns A pcie.BW_Res with the required raw and effective bandwidth
+    """
+    pps, _ = eth_rate(ethcfg, m)
+    pkt_size = m.avg_size - ethcfg.crc_sz if strip_fcs else m.avg_size
+    gbs = pps * pkt_size * 8 / 1e9
+    rx = gbs if direction & pcie.DIR_RX else 0.0
+    tx = gbs if direction & pcie.DIR_TX else 0.0
+    bwspec = pcie.BW_Spec(rx, tx, pcie.BW_Spec.BW_EFF)
+    res, _ = evaluate(pcicfg, bwspec, direction, model, m, strip_fcs,
+                      **kwargs)
+    return res
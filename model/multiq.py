@@ -0,0 +1,176 @@
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""A model for a multi-queue NIC in the style of Niantic
+
+niantic.bw() assumes a single RX and TX ring with fixed batch sizes.
+With many queues (e.g. RSS spreading flows over cores) each queue
+only sees a share of the packets. Doorbells, descriptor fetches,
+descriptor write backs and interrupts are per queue, so the batches
+they can cover are limited by the number of packets a queue receives
+in a round of host processing. As the number of queues grows the
+batches shrink and the per packet overhead grows.
+
+This is modelled with a 'burst', the number of packets (over all
+queues) handled per round, e.g. the packets arriving within an
+interrupt moderation interval or a poll loop iteration. Queue i with
+share s_i gets floor(s_i * burst) (at least 1) packets per round and
+none of its batches can be larger than that. Without a burst the
+batches are as configured.
+
+The work per packet is that of device.niantic() for the batches of
+each queue, including the RX descriptor fetch batch (of which, as
+for niantic.bw(), only the completion is counted). The bytes are
+averaged per packet (Device.pkt_bytes()) rather than worked out for a
+common multiple of the batch sizes.
+"""
+
+# pylint: disable=invalid-name
+# pylint: disable=too-many-arguments
+# pylint: disable=too-many-locals
+# pylint: disable=too-many-instance-attributes
+# pylint: disable=too-few-public-methods
+
+import numpy as np
+
+from . import pcie
+from . import util
+from . import device
+
+class Queue():
+    """
+    The parameters of a queue pair (a glorified struct)
+
+    @param share         Share of the packets handled by the queue.
+                         Shares are normalised over all queues.
+    @param h_tx_batch    Host updates the TX tail pointer every n packets.
+                         Defaults to 1, or 32 with h_opt="PMD".
+    @param h_fl_batch    Host enqueues n free buffers at a time
+    @param h_rx_batch    Host reads the RX head pointer every n packets
+    @param d_tx_batch    Device fetches up to n TX descriptors at a time
+    @param d_tx_batch_wb Device writes back n TX descriptors at a time
+    @param d_rx_batch    Device fetches up to n RX descriptors at a time
+    @param irq_mod       IRQ every n packets. 0 no IRQ
+    """
+    def __init__(self, share=1.0, h_tx_batch=None, h_fl_batch=32, h_rx_batch=8,
+                 d_tx_batch=40, d_tx_batch_wb=8, d_rx_batch=1, irq_mod=32):
+        self.share = share
+        self.h_tx_batch = h_tx_batch
+        self.h_fl_batch = h_fl_batch
+        self.h_rx_batch = h_rx_batch
+        self.d_tx_batch = d_tx_batch
+        self.d_tx_batch_wb = d_tx_batch_wb
+        self.d_rx_batch = d_rx_batch
+        self.irq_mod = irq_mod
+
+def queues(n, shares=None, **kwargs):
+    """Return a list of @n Queues with the parameters @kwargs.
+    @shares is a list of shares, by default all queues get the same"""
+    if shares is None:
+        shares = [1.0] * n
+    if len(shares) != n:
+        raise Exception("Need %d shares" % n)
+    return [Queue(share=s, **kwargs) for s in shares]
+
+def _queue_bytes(pcicfg, data_B, q, per_round, h_opt):
+    """Bytes per packet (tx_rx, tx_tx, rx_rx, rx_tx) for queue @q which
+    gets @per_round packets per round (None if unlimited). @data_B may
+    be a scalar or an array."""
+    def batch(n):
+        return n if per_round is None else max(1, min(n, per_round))
+    h_fl_batch = batch(q.h_fl_batch)
+    h_tx_batch = q.h_tx_batch
+    if h_tx_batch is None:
+        h_tx_batch = 32 if h_opt == "PMD" else 1
+    irq_mod = 0 if h_opt == "PMD" else q.irq_mod
+    dev = device.niantic(
+        irq_mod=batch(irq_mod) if irq_mod > 0 else 0, h_opt=h_opt,
+        h_tx_batch=batch(h_tx_batch),
+        h_fl_batch=h_fl_batch,
+        h_rx_batch=batch(q.h_rx_batch),
+        d_tx_batch=batch(q.d_tx_batch),
+        d_tx_batch_wb=batch(q.d_tx_batch_wb),
+        # the device can only fetch free buffers the host has made available
+        d_rx_batch=min(batch(q.d_rx_batch), h_fl_batch))
+    return dev.pkt_bytes(pcicfg, data_B)
+
+def _bytes(pcicfg, data_B, qs, burst, h_opt):
+    total = sum(q.share for q in qs)
+    if not qs or total <= 0:
+        raise Exception("Need at least one queue with a share")
+    acc = [0.0, 0.0, 0.0, 0.0]
+    for q in qs:
+        if q.share <= 0:
+            continue
+        share = q.share / total
+        per_round = None if burst is None else int(share * burst)
+        for i, b in enumerate(_queue_bytes(pcicfg, data_B, q, per_round,
+                                           h_opt)):
+            acc[i] = acc[i] + share * b
+    return tuple(acc)
+
+def bw(pcicfg, bwspec, direction, pkt_size, qs, burst=None, h_opt=None):
+    """
+    Estimate the PCIe bandwidth of a multi-queue NIC.
+
+    @param pcicfg    PCIe configuration
+    @param bwspec    Bandwidth specification
+    @param direction Direction(s) of the transfer
+    @param pkt_size  Size of the Ethernet frame
+    @param qs        List of Queue objects
+    @param burst     Packets handled per round over all queues, None if
+                     batches are not limited
+    @param h_opt     Host driver optimisations, "PMD" as for niantic.bw()
+    @returns A BW_Res object
+    """
+    if not direction & pcie.DIR_BOTH:
+        raise Exception("Unknown Direction %d" % direction)
+    return util.gen_res(bwspec, direction, pkt_size,
+                        *_bytes(pcicfg, pkt_size, qs, burst, h_opt))
+
+def bytes_many(pcicfg, pkt_sizes, qs, burst=None, h_opt=None):
+    """
+    Work out the bytes transferred per packet for an array of packet
+    sizes. See bw() for the parameters.
+
+    @returns A tuple of arrays (data_B, tx_rx_data_B, tx_tx_data_B,
+             rx_rx_data_B, rx_tx_data_B) as passed to util.gen_res_many()
+    """
+    data_B = np.asarray(pkt_sizes, dtype=np.int64)
+    return (data_B,) + _bytes(pcicfg, data_B, qs, burst, h_opt)
+
+def bw_many(pcicfg, bwspec, direction, pkt_sizes, qs, burst=None,
+            h_opt=None):
+    """
+    Same as bw() but for an array of packet sizes.
+
+    @returns A util.BW_Res_dtype array
+    """
+    return util.gen_res_many(bwspec, direction,
+                             *bytes_many(pcicfg, pkt_sizes, qs, burst, h_opt))
+
+def scaling(pcicfg, bwspec, direction, pkt_size, num_queues, burst,
+            h_opt=None, **kwargs):
+    """
+    Bandwidth of @pkt_size packets spread evenly over each of
+    @num_queues queues (with parameters @kwargs, see Queue).
+
+    @returns A util.BW_Res_dtype array with an entry per number of queues
+    """
+    res = np.zeros(len(num_queues), dtype=util.BW_Res_dtype)
+    for i, n in enumerate(num_queues):
+        r = bw(pcicfg, bwspec, direction, pkt_size, queues(n, **kwargs),
+               burst, h_opt)
+        res[i] = (r.rx_raw, r.rx_eff, r.tx_raw, r.tx_eff)
+    return res
@@ -16,16 +16,18 @@
 """A model for a Intel Niantic 10G NIC"""
 
 # pylint: disable=invalid-name
-# pylint: disable=bad-whitespace
 # pylint: disable=too-many-arguments
-# pylint: disable=too-many-locals
-# pylint: disable=too-many-statements
 
-import math
 from . import pcie
 from . import util
-
-def bw(pcicfg, bwspec, direction, pkt_size, irq_mod=32, h_opt=None):
+from . import device
+from .memo import memoize
+from .instr import instrument
+
+@instrument
+@memoize
+def bw(pcicfg, bwspec, direction, pkt_size, irq_mod=32, h_opt=None,
+       detail=False, h_tx_batch=None, h_fl_batch=32, h_rx_batch=8):
     """
     This code estimates the PCIe bandwidth requirements for a device
     which looks very much like a Intel Niantic NIC.
@@ -36,7 +38,14 @@ def bw(pcicfg, bwspec, direction, pkt_size, irq_mod=32, h_opt=None):
                      with FCS stripping)
     @param irq_mod   Controls interrupts. IRQ every n packets. 0 no IRQ
     @param h_opt     Host driver optimisations (see below)
-    @returns A BW_Res object
+    @param detail    Also return the bytes and TLPs of each step
+    @param h_tx_batch Host updates the TX tail pointer (and reads the
+                     TX head pointer) every n packets. 1 by default, 32
+                     with @h_opt="PMD"
+    @param h_fl_batch Host en-queues n free buffers at a time
+    @param h_rx_batch Host reads the RX head pointer every n packets
+    @returns A BW_Res object or, with @detail, a tuple (BW_Res,
+             device.Ledger)
 
     The details below are taken from the Intel 82599 10 GbE Controller
     Datasheet, specifically, the following sections:
@@ -99,106 +108,63 @@ def bw(pcicfg, bwspec, direction, pkt_size, irq_mod=32, h_opt=None):
     - RX: Steps 5 and 6 are omitted.  No interrupts are generated on
       receive and the RX Descriptor Done is checked to new packets.
     To enable these optimisations set @h_opt="PMD"
-    """
-    tx_desc_sz    = 16
-    tx_desc_wb_sz = 16
-    rx_desc_sz    = 16
-    rx_desc_wb_sz = 16
-
-    ptr_sz        = 4
-
-    # Niantic can prefetch up to 40 descriptors and write back batches of 8
-    d_tx_batch    = 40
-    d_tx_batch_wb = 8
-
-    # Assumptions about what the host is doing: Update the TX pointer
-    # every @h_tx_batch packets. En-queue @h_fl_batch free buffers at
-    # a time and update the RX head pointer every @h_rx_batch
-    h_tx_batch    = 1
-    h_fl_batch    = 32
-    h_rx_batch    = 8
-
-    if h_opt == "PMD":
-        h_tx_batch = 32
-        irq_mod =  0
-
-    # work out batch size and multiplier for different tasks
-    batch_mul = util.low_com_mul(h_fl_batch, d_tx_batch)
-    d_tx_batch_mul    = batch_mul / d_tx_batch
-    d_tx_batch_wb_mul = batch_mul / d_tx_batch_wb
-    h_tx_batch_mul    = batch_mul / h_tx_batch
-    h_fl_batch_mul    = batch_mul / h_fl_batch
-    h_rx_batch_mul    = batch_mul / h_rx_batch
-    if irq_mod > 0:
-        irq_mul       = batch_mul / irq_mod
-    else:
-        irq_mul       = 0
-
-    # stash the packet size away
-    data_B = pkt_size
 
+    The steps are described by device.niantic(), which works out the
+    bytes. Only the completion of the RX descriptor read in step 2 is
+    counted, not its read request (see device.py).
+    """
     if not direction & pcie.DIR_BOTH:
         raise Exception("Unknown Direction %d" % direction)
 
     # XXX add a check that the batch reads/writes of descriptors do not
     # exceed MPS, MRRS, RCB. It is not handled in this code...
 
-    # Packet TX
-    tx_rx_data_B = 0 # bytes for TX received by the device
-    tx_tx_data_B = 0 # bytes for TX transmitted by the device
-    # H: tail pointer write (once per h_tx_batch)
-    tx_rx_data_B += (ptr_sz + pcicfg.TLP_MWr_Hdr_Sz) * h_tx_batch_mul
-    # D: read descriptor (once per d_tx_batch)
-    _rd_sz = tx_desc_sz * d_tx_batch
-    tlps = int(math.ceil(float(_rd_sz) / float(pcicfg.mrrs)))
-    tx_tx_data_B += (tlps * pcicfg.TLP_MRd_Hdr_Sz) * d_tx_batch_mul
-    if pcicfg.rcb_chunks:
-        tlps = int(math.ceil(float(_rd_sz) / float(pcicfg.rcb)))
-    else:
-        tlps = int(math.ceil(float(_rd_sz) / float(pcicfg.mps)))
-    tx_rx_data_B += ((tlps * pcicfg.TLP_CplD_Hdr_Sz) + _rd_sz) * d_tx_batch_mul
-    # D: data DMA reads (For each packet)
-    tlps = int(math.ceil(float(data_B) / float(pcicfg.mrrs)))
-    tx_tx_data_B += (tlps * pcicfg.TLP_MRd_Hdr_Sz) * batch_mul
-    if pcicfg.rcb_chunks:
-        tlps = int(math.ceil(float(data_B) / float(pcicfg.rcb)))
-    else:
-        tlps = int(math.ceil(float(data_B) / float(pcicfg.mps)))
-    tx_rx_data_B += ((tlps * pcicfg.TLP_CplD_Hdr_Sz) + data_B) * batch_mul
-    # D: Write back descriptors (once per d_tx_batch_wb)
-    _wr_sz = tx_desc_wb_sz * d_tx_batch_wb
-    tlps = int(math.ceil(float(_wr_sz)/float(pcicfg.mps)))
-    tx_tx_data_B += ((tlps * pcicfg.TLP_MWr_Hdr_Sz) + _wr_sz) *d_tx_batch_wb_mul
-    if not h_opt == "PMD":
-        # D: send IRQ (depending on setting)
-        tx_tx_data_B += (pcie.MSI_SIZE + pcicfg.TLP_MWr_Hdr_Sz) * irq_mul
-        # H: read head pointer (once per h_tx_batch)
-        tx_rx_data_B += pcicfg.TLP_MRd_Hdr_Sz * h_tx_batch_mul
-        tx_tx_data_B += (ptr_sz + pcicfg.TLP_CplD_Hdr_Sz) * h_tx_batch_mul
-    # done
-
-    # Packet RX
-    rx_rx_data_B = 0 # bytes for RX received by the device
-    rx_tx_data_B = 0 # bytes for RX transmitted by the device
-    # H: tail pointer write (once per h_fl_batch)
-    rx_rx_data_B += (ptr_sz + pcicfg.TLP_MWr_Hdr_Sz) * h_fl_batch_mul
-    # D: read descriptors (For each packet)
-    rx_tx_data_B += pcicfg.TLP_MRd_Hdr_Sz * batch_mul
-    rx_rx_data_B += (rx_desc_sz + pcicfg.TLP_CplD_Hdr_Sz) * batch_mul
-    # D: DMA write (For each packet)
-    tlps = int(math.ceil(float(data_B) / float(pcicfg.mps)))
-    rx_tx_data_B = ((tlps * pcicfg.TLP_MWr_Hdr_Sz) + data_B) * batch_mul
-    # D: Write back descriptors (For each packet)
-    rx_tx_data_B += (rx_desc_wb_sz + pcicfg.TLP_MWr_Hdr_Sz) * batch_mul
-    if not h_opt == "PMD":
-        # D: send IRQ (Depending on setting)
-        rx_tx_data_B += (pcie.MSI_SIZE + pcicfg.TLP_MWr_Hdr_Sz) * irq_mul
-        # H: read head pointer (once per packet)
-        rx_rx_data_B += pcicfg.TLP_MRd_Hdr_Sz * h_rx_batch_mul
-        rx_tx_data_B += (ptr_sz + pcicfg.TLP_CplD_Hdr_Sz) * h_rx_batch_mul
-    # done
-
-    # we now know how many bytes are transfered in each direction for
-    # both RX and TX for a batch. Lets work out how much we can transfer etc.
-    return util.gen_res(bwspec, direction, data_B * batch_mul,
-                        tx_rx_data_B, tx_tx_data_B, rx_rx_data_B, rx_tx_data_B)
+    dev = device.niantic(irq_mod=irq_mod, h_opt=h_opt, h_tx_batch=h_tx_batch,
+                         h_fl_batch=h_fl_batch, h_rx_batch=h_rx_batch)
+    res = util.gen_res(bwspec, direction, *dev.bytes(pcicfg, pkt_size))
+    if detail:
+        return res, dev.ledger(pcicfg, direction, pkt_size)
+    return res
+
+def bytes_many(pcicfg, pkt_sizes, irq_mod=32, h_opt=None, h_tx_batch=None,
+               h_fl_batch=32, h_rx_batch=8):
+    """
+    Work out the bytes transferred per batch of packets for an array of
+    packet sizes. See bw() for the details and the parameters.
+
+    @param pcicfg    PCIe configuration
+    @param pkt_sizes Array of Ethernet frame sizes
+    @param irq_mod   Controls interrupts. IRQ every n packets. 0 no IRQ
+    @param h_opt     Host driver optimisations
+    @param h_tx_batch, h_fl_batch, h_rx_batch  Host batching (see bw())
+    @returns A tuple of arrays (data_B, tx_rx_data_B, tx_tx_data_B,
+             rx_rx_data_B, rx_tx_data_B) as passed to util.gen_res_many()
+    """
+    dev = device.niantic(irq_mod=irq_mod, h_opt=h_opt, h_tx_batch=h_tx_batch,
+                         h_fl_batch=h_fl_batch, h_rx_batch=h_rx_batch)
+    return dev.bytes_many(pcicfg, pkt_sizes)
+
+@instrument
+def bw_many(pcicfg, bwspec, direction, pkt_sizes, irq_mod=32, h_opt=None,
+            detail=False, h_tx_batch=None, h_fl_batch=32, h_rx_batch=8):
+    """
+    Same as bw() but for an array of packet sizes.
+
+    @param pcicfg    PCIe configuration
+    @param bwspec    Bandwidth specification
+    @param direction Direction(s) of the transfer
+    @param pkt_sizes Array of Ethernet frame sizes
+    @param irq_mod   Controls interrupts. IRQ every n packets. 0 no IRQ
+    @param h_opt     Host driver optimisations (see bw())
+    @param detail    Also return the bytes and TLPs of each step
+    @param h_tx_batch, h_fl_batch, h_rx_batch  Host batching (see bw())
+    @returns A util.BW_Res_dtype array or, with @detail, a tuple of it
+             and a device.Ledger with one column per size
+    """
+    dev = device.niantic(irq_mod=irq_mod, h_opt=h_opt, h_tx_batch=h_tx_batch,
+                         h_fl_batch=h_fl_batch, h_rx_batch=h_rx_batch)
+    res = util.gen_res_many(bwspec, direction, *dev.bytes_many(pcicfg,
+                                                               pkt_sizes))
+    if detail:
+        return res, dev.ledger(pcicfg, direction, pkt_sizes)
+    return res
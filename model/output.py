@@ -0,0 +1,305 @@
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""Writing of results in different formats
+
+Results are produced as a stream of blocks. A block is a dictionary
+mapping column names to equally sized NumPy arrays. A writer is
+created with the list of columns, (name, label) tuples, and consumes
+the blocks one at a time.  Blocks may omit trailing columns, e.g. if
+they are not defined for some rows.  The text writer omits them in the
+output while the other writers fill them with NaN.
+
+Supported formats are:
+- 'dat': Space separated text with a header line of quoted labels, as
+         used by gnuplot
+- 'csv': Comma separated values with a header line of column names
+- 'npy': A NumPy structured array with one field per column
+- 'npz': A NumPy .npz file with one array per column
+- 'col': A directory with one raw binary file per column and a JSON
+         description which can be memory mapped with load_columnar()
+
+All writers stream the blocks to disk as they arrive, so the memory
+used does not grow with the number of rows. The .npy writers put a
+header in front of the data which is rewritten with the number of
+rows when the writer is closed. The 'npz' writer streams each column
+to a temporary .npy file next to the output and stores these in the
+(uncompressed) .npz archive when it is closed.
+"""
+
+# pylint: disable=invalid-name
+# pylint: disable=too-few-public-methods
+
+import json
+import os
+import re
+import shutil
+import struct
+import tempfile
+import zipfile
+
+import numpy as np
+
+Formats = ['dat', 'csv', 'npy', 'npz', 'col']
+
+class Writer():
+    """Base class for all writers"""
+
+    def __init__(self, fname, columns):
+        self.fname = fname
+        self.columns = columns
+        self.names = [name for name, _ in columns]
+
+    def _cols(self, block):
+        """The columns present in @block, in order"""
+        return [name for name in self.names if name in block]
+
+    def _full(self, block):
+        """@block with absent columns filled with NaN"""
+        n = len(block[self.names[0]])
+        return {name: block[name] if name in block else np.full(n, np.nan)
+                for name in self.names}
+
+    def write(self, block):
+        """Write a block of results"""
+        raise NotImplementedError
+
+    def close(self):
+        """Finish writing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TextWriter(Writer):
+    """gnuplot style text output. @fmt is a printf style format for a
+    complete row (without newline)."""
+
+    def __init__(self, fname, columns, fmt):
+        Writer.__init__(self, fname, columns)
+        # split the format into one piece (incl. separator) per column
+        self.fmts = re.findall(r'\s*%[-+ #0-9.]*[a-zA-Z]', fmt)
+        if len(self.fmts) != len(columns):
+            raise Exception("Format does not match columns: %s" % fmt)
+        self.f = open(fname, "w")
+        self.f.write("".join("\"%s\" " % label for _, label in columns) + "\n")
+
+    def write(self, block):
+        names = self._cols(block)
+        fmt = "".join(self.fmts[:len(names)]) + "\n"
+        cols = [block[name].tolist() for name in names]
+        self.f.write("".join(fmt % row for row in zip(*cols)))
+
+    def close(self):
+        self.f.close()
+
+
+class CsvWriter(Writer):
+    """CSV output with full precision"""
+
+    def __init__(self, fname, columns):
+        Writer.__init__(self, fname, columns)
+        self.f = open(fname, "w")
+        self.f.write(",".join(self.names) + "\n")
+
+    def write(self, block):
+        block = self._full(block)
+        cols = [block[name].tolist() for name in self.names]
+        self.f.write("".join(",".join(map(str, row)) + "\n"
+                             for row in zip(*cols)))
+
+    def close(self):
+        self.f.close()
+
+
+# Largest number of rows the header of a .npy file leaves room for
+_MAX_ROWS = 2**63 - 1
+
+def _npy_header(dtype, n):
+    """The header (format version 2.0) of a .npy file holding @n
+    records of @dtype. It has the same length for any @n, so it can
+    be rewritten once the number of records is known."""
+    hdr = repr({'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                'fortran_order': False,
+                'shape': (n,)})
+    # magic and version, header length, header and a newline padded
+    # to a multiple of ARRAY_ALIGN
+    size = 8 + 4 + len(hdr) - len(str(n)) + len(str(_MAX_ROWS)) + 1
+    size = -(-size // np.lib.format.ARRAY_ALIGN) * np.lib.format.ARRAY_ALIGN
+    hdr = hdr.ljust(size - 8 - 4 - 1) + "\n"
+    return (np.lib.format.magic(2, 0) + struct.pack("<I", len(hdr)) +
+            hdr.encode('latin1'))
+
+
+class _NpyStream():
+    """A .npy file of a one dimensional array written in pieces. The
+    dtype is that of the first piece."""
+
+    def __init__(self, fname):
+        self.f = open(fname, "wb")
+        self.dtype = None
+        self.n = 0
+
+    def append(self, arr):
+        """Append the array @arr"""
+        if self.dtype is None:
+            self.dtype = arr.dtype
+            self.f.write(_npy_header(self.dtype, 0))
+        self.f.write(np.ascontiguousarray(arr, dtype=self.dtype).tobytes())
+        self.n += len(arr)
+
+    def close(self, dtype):
+        """Write the final header. @dtype is used if nothing was
+        appended."""
+        if self.dtype is None:
+            self.dtype = np.dtype(dtype)
+        self.f.seek(0)
+        self.f.write(_npy_header(self.dtype, self.n))
+        self.f.close()
+
+
+class NpyWriter(Writer):
+    """NumPy .npy output of a structured array with one field per
+    column. As np.save(), '.npy' is appended to @fname if missing."""
+
+    def __init__(self, fname, columns):
+        if not fname.endswith('.npy'):
+            fname += '.npy'
+        Writer.__init__(self, fname, columns)
+        self.out = _NpyStream(fname)
+
+    def write(self, block):
+        block = self._full(block)
+        if self.out.dtype is None:
+            dtype = [(name, block[name].dtype) for name in self.names]
+        else:
+            dtype = self.out.dtype
+        rec = np.empty(len(block[self.names[0]]), dtype=dtype)
+        for name in self.names:
+            rec[name] = block[name]
+        self.out.append(rec)
+
+    def close(self):
+        self.out.close([(name, np.float64) for name in self.names])
+
+
+class NpzWriter(Writer):
+    """NumPy .npz output with one array per column. As np.savez(),
+    '.npz' is appended to @fname if missing."""
+
+    def __init__(self, fname, columns):
+        if not fname.endswith('.npz'):
+            fname += '.npz'
+        Writer.__init__(self, fname, columns)
+        self.tmp = tempfile.mkdtemp(prefix=".npz-",
+                                    dir=os.path.dirname(os.path.abspath(fname)))
+        self.outs = [_NpyStream(os.path.join(self.tmp, "%d.npy" % i))
+                     for i in range(len(self.names))]
+
+    def write(self, block):
+        block = self._full(block)
+        for out, name in zip(self.outs, self.names):
+            out.append(block[name])
+
+    def close(self):
+        try:
+            with zipfile.ZipFile(self.fname, "w", zipfile.ZIP_STORED,
+                                 allowZip64=True) as zf:
+                for out, name in zip(self.outs, self.names):
+                    out.close(np.float64)
+                    zf.write(out.f.name, name + ".npy")
+        finally:
+            shutil.rmtree(self.tmp)
+
+
+class ColumnarWriter(Writer):
+    """One raw binary file per column in the directory @fname, plus a
+    JSON description. Blocks are streamed straight to the files."""
+
+    META = "columns.json"
+
+    def __init__(self, fname, columns):
+        Writer.__init__(self, fname, columns)
+        os.makedirs(fname, exist_ok=True)
+        self.files = None
+        self.dtypes = None
+        self.n = 0
+
+    def write(self, block):
+        block = self._full(block)
+        if self.files is None:
+            self.dtypes = [block[name].dtype for name in self.names]
+            self.files = [open(os.path.join(self.fname, "%d.bin" % i), "wb")
+                          for i in range(len(self.names))]
+        for f, name, dtype in zip(self.files, self.names, self.dtypes):
+            f.write(np.ascontiguousarray(block[name], dtype=dtype).tobytes())
+        self.n += len(block[self.names[0]])
+
+    def close(self):
+        for f in self.files or []:
+            f.close()
+        meta = {'length': self.n,
+                'columns': [{'name': name, 'label': label,
+                             'file': "%d.bin" % i,
+                             'dtype': np.dtype(self.dtypes[i]).str
+                                      if self.dtypes else '<f8'}
+                            for i, (name, label) in enumerate(self.columns)]}
+        with open(os.path.join(self.fname, self.META), "w") as f:
+            json.dump(meta, f, indent=1)
+
+
+def load_columnar(fname):
+    """Memory map the columns written by a ColumnarWriter to @fname.
+    Returns a dictionary of column name to (read-only) array."""
+    with open(os.path.join(fname, ColumnarWriter.META)) as f:
+        meta = json.load(f)
+    cols = {}
+    for col in meta['columns']:
+        if meta['length'] == 0:
+            cols[col['name']] = np.empty(0, dtype=col['dtype'])
+            continue
+        cols[col['name']] = np.memmap(os.path.join(fname, col['file']),
+                                      dtype=col['dtype'], mode='r',
+                                      shape=(meta['length'],))
+    return cols
+
+
+def writer(fmt, fname, columns, text_fmt=None):
+    """Create a writer for format @fmt (see Formats).
+    @text_fmt is the row format used by the 'dat' format."""
+    if fmt == 'dat':
+        return TextWriter(fname, columns, text_fmt)
+    if fmt == 'csv':
+        return CsvWriter(fname, columns)
+    if fmt == 'npy':
+        return NpyWriter(fname, columns)
+    if fmt == 'npz':
+        return NpzWriter(fname, columns)
+    if fmt == 'col':
+        return ColumnarWriter(fname, columns)
+    raise Exception("Unknown output format: %s" % fmt)
+
+
+def write_all(blocks, out):
+    """Pipe all @blocks into the writer @out and close it.
+    Returns the number of rows written."""
+    n = 0
+    with out:
+        for block in blocks:
+            out.write(block)
+            n += len(next(iter(block.values())))
+    return n
@@ -0,0 +1,274 @@
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""Trade-offs between PCIe configurations and Niantic driver batching
+
+explore() evaluates the Niantic model (see niantic.py) for every
+combination of PCIe configuration (version, lanes, MPS, MRRS), host
+batching knobs (irq_mod, h_tx_batch, h_fl_batch, h_rx_batch) and frame
+size. For each point it works out the packet rate, limited by the
+Ethernet line rate and the PCIe bandwidth in either direction (as in
+bottleneck.solve()), and the costs:
+
+- lanes: The number of PCIe lanes
+- irq_rate: Interrupts per second
+- batch_us: How long a packet may wait for its batch (of TX doorbells,
+  RX interrupts or RX head pointer reads) to complete at this packet
+  rate, in us. The timers drivers use to bound this are not modelled.
+
+The knobs only change how often some steps of device.niantic() are
+performed, so the bytes per packet are the bytes of the other steps
+plus those of each of these steps divided by its knob. The ledger of
+each configuration is worked out once and the knobs are applied to
+all sizes at once.
+
+frontier() returns the points not dominated by any other point for the
+same frame size, i.e. with no other point at least as good in all
+objectives and better in one. The points are sorted
+lexicographically, so a point can only be dominated by an earlier one,
+and compared in blocks against the frontier found so far.
+"""
+
+# pylint: disable=invalid-name
+# pylint: disable=too-many-arguments
+# pylint: disable=too-many-locals
+
+import itertools
+
+import numpy as np
+
+from . import pcie
+from . import device
+from . import bottleneck
+
+Knobs = ['irq_mod', 'h_tx_batch', 'h_fl_batch', 'h_rx_batch']
+
+# Knob values explored by default. irq_mod 0 means no interrupts.
+Knob_vals = {
+    'irq_mod'    : [0, 1, 2, 4, 8, 16, 32, 64, 128],
+    'h_tx_batch' : [1, 2, 4, 8, 16, 32, 64],
+    'h_fl_batch' : [8, 16, 32, 64],
+    'h_rx_batch' : [1, 2, 4, 8, 16, 32],
+    }
+
+# Steps of device.niantic() performed once every <knob> packets
+_Knob_steps = {
+    "H: TX tail pointer write" : 'h_tx_batch',
+    "H: TX head pointer read"  : 'h_tx_batch',
+    "H: RX tail pointer write" : 'h_fl_batch',
+    "H: RX head pointer read"  : 'h_rx_batch',
+    "D: TX IRQ"                : 'irq_mod',
+    "D: RX IRQ"                : 'irq_mod',
+    }
+
+# One record per point
+Pareto_dtype = np.dtype([('size', np.int64),
+                         ('version', np.int8),
+                         ('lanes', np.int8),
+                         ('mps', np.int16),
+                         ('mrrs', np.int16),
+                         ('irq_mod', np.int32),
+                         ('h_tx_batch', np.int32),
+                         ('h_fl_batch', np.int32),
+                         ('h_rx_batch', np.int32),
+                         ('pps', np.float64),
+                         ('gbps', np.float64),
+                         ('irq_rate', np.float64),
+                         ('batch_us', np.float64)])
+
+# Objectives of frontier() by default
+MAXIMIZE = ('gbps',)
+MINIMIZE = ('lanes', 'irq_rate', 'batch_us')
+
+# Points compared at a time by non_dominated()
+BLOCK = 512
+
+def _or_all(vals, default):
+    return default if vals is None else vals
+
+def _knob_bytes(ledger):
+    """Split the bytes per packet of a ledger of device.niantic(), with
+    all knobs 1, into those of the other steps and those of the steps
+    performed once every <knob> packets.
+
+    @returns A tuple (rx, tx, rx_knob, tx_knob) with arrays of shape
+             (#sizes,) and (len(Knobs), #sizes)
+    """
+    shape = ledger.rx_B.shape[1:]
+    rx, tx = np.zeros(shape), np.zeros(shape)
+    rx_knob = np.zeros((len(Knobs),) + shape)
+    tx_knob = np.zeros((len(Knobs),) + shape)
+    for i, step in enumerate(ledger.steps):
+        knob = _Knob_steps.get(step.name)
+        if knob is None:
+            rx += ledger.rx_B[i]
+            tx += ledger.tx_B[i]
+        else:
+            rx_knob[Knobs.index(knob)] += ledger.rx_B[i]
+            tx_knob[Knobs.index(knob)] += ledger.tx_B[i]
+    return rx, tx, rx_knob, tx_knob
+
+def explore(ethcfg, direction, sizes, versions=None, lanes=None, mpss=None,
+            mrrss=None, addr=64, ecrc=0, rcb=64, rcb_chunks=False,
+            knobs=None, strip_fcs=True):
+    """
+    Evaluate the Niantic model for all combinations of PCIe
+    configuration, knobs and frame sizes.
+
+    @param ethcfg    eth.Cfg of the network link
+    @param direction Direction(s) of the traffic. Note, packets
+                     received by a NIC are DIR_TX.
+    @param sizes     Array of Ethernet frame sizes (including the FCS)
+    @param versions, lanes, mpss, mrrss  Lists of values to consider,
+                     all legal values by default
+    @param addr, ecrc, rcb, rcb_chunks  Fixed parameters of the
+                     configurations
+    @param knobs     Dictionary of lists of values for some Knobs.
+                     Knob_vals for the others.
+    @param strip_fcs The FCS is not transferred over PCIe
+    @returns A Pareto_dtype array with one record per point
+    """
+    if not direction & pcie.DIR_BOTH:
+        raise Exception("Unknown Direction %d" % direction)
+    vals = dict(Knob_vals)
+    vals.update(knobs or {})
+    for knob in vals:
+        if knob not in Knobs:
+            raise Exception("Unknown knob: %s" % knob)
+        if min(vals[knob]) < (0 if knob == 'irq_mod' else 1):
+            raise Exception("Bad values for %s: %r" % (knob, vals[knob]))
+    grid = np.array(list(itertools.product(*[vals[k] for k in Knobs])),
+                    dtype=np.int64).reshape(-1, len(Knobs))
+    # steps per packet, no IRQs for irq_mod 0
+    per_pkt = np.divide(1.0, grid, out=np.zeros(grid.shape), where=grid > 0)
+
+    sizes = np.asarray(sizes, dtype=np.int64)
+    pkt_sizes = sizes - ethcfg.crc_sz if strip_fcs else sizes
+    eth_pps = bottleneck.eth_pps(ethcfg, sizes)
+    unit = device.niantic(irq_mod=1, h_tx_batch=1, h_fl_batch=1,
+                          h_rx_batch=1)
+
+    # The batches a packet waits for and the paths with interrupts
+    waits = []
+    paths = 0
+    if direction & pcie.DIR_RX:
+        waits.append(Knobs.index('h_tx_batch'))
+        paths += 1
+    if direction & pcie.DIR_TX:
+        waits += [Knobs.index('irq_mod'), Knobs.index('h_rx_batch')]
+        paths += 1
+    wait = np.maximum(grid[:, waits].max(axis=1), 1)[:, None] - 1
+
+    cfgs = list(itertools.product(
+        _or_all(versions, pcie.Vers), _or_all(lanes, pcie.Laness),
+        _or_all(mpss, pcie.MPSs), _or_all(mrrss, pcie.MRRSs)))
+    n = len(grid) * len(sizes)
+    res = np.zeros(len(cfgs) * n, dtype=Pareto_dtype)
+    for i, (ver, lns, mps, mrrs) in enumerate(cfgs):
+        cfg = pcie.Cfg(ver, lns, addr, ecrc, mps, mrrs, rcb, rcb_chunks)
+        rx, tx, rx_knob, tx_knob = _knob_bytes(
+            unit.ledger(cfg, direction, pkt_sizes))
+        # bytes per packet, one row per combination of knobs
+        rx = rx + per_pkt.dot(rx_knob)
+        tx = tx + per_pkt.dot(tx_knob)
+        with np.errstate(divide='ignore'):
+            pps = np.minimum(np.minimum(cfg.TLP_bw * 1e9 / (8.0 * rx),
+                                        cfg.TLP_bw * 1e9 / (8.0 * tx)),
+                             eth_pps)
+
+        out = res[i * n:(i + 1) * n]
+        out['size'] = np.tile(sizes, len(grid))
+        out['version'] = pcie.Vers_idx[ver] + 1
+        out['lanes'] = pcie.Laness_mul[pcie.Laness_idx[lns]]
+        out['mps'] = mps
+        out['mrrs'] = mrrs
+        for k, knob in enumerate(Knobs):
+            out[knob] = np.repeat(grid[:, k], len(sizes))
+        out['pps'] = pps.ravel()
+        out['gbps'] = (pps * sizes * 8 / 1e9).ravel()
+        out['irq_rate'] = (pps * per_pkt[:, [Knobs.index('irq_mod')]] *
+                           paths).ravel()
+        out['batch_us'] = (wait / pps * 1e6).ravel()
+    return res
+
+def non_dominated(costs):
+    """
+    Which of the points are not dominated by another point?
+
+    @param costs Array of shape (#points, #objectives) of values to
+                 minimise
+    @returns A boolean array, one entry per point. Points with the
+             same costs are all kept or all dropped.
+    """
+    costs = np.asarray(costs, dtype=np.float64)
+    if not len(costs):
+        return np.zeros(0, dtype=bool)
+    # sort the rows: a point can only be dominated by an earlier one
+    order = np.lexsort(costs.T[::-1])
+    costs = costs[order]
+    first = np.ones(len(costs), dtype=bool)
+    first[1:] = np.any(costs[1:] != costs[:-1], axis=1)
+    uniq = costs[first]
+
+    keep = np.zeros(len(uniq), dtype=bool)
+    front = uniq[:0]
+    for start in range(0, len(uniq), BLOCK):
+        block = uniq[start:start + BLOCK]
+        # dominated by a point of the frontier so far
+        dom = np.zeros(len(block), dtype=bool)
+        for fstart in range(0, len(front), BLOCK):
+            cand = np.flatnonzero(~dom)
+            if not len(cand):
+                break
+            chunk = front[fstart:fstart + BLOCK]
+            dom[cand] = np.any(np.all(chunk[None, :, :] <=
+                                      block[cand][:, None, :], axis=2),
+                               axis=1)
+        # or by an earlier point of the block
+        cand = np.flatnonzero(~dom)
+        sub = block[cand]
+        le = np.all(sub[None, :, :] <= sub[:, None, :], axis=2)
+        dom[cand] = np.tril(le, -1).any(axis=1)
+        keep[start:start + len(block)] = ~dom
+        front = np.concatenate([front, block[~dom]])
+
+    mask = np.zeros(len(costs), dtype=bool)
+    mask[order] = keep[np.cumsum(first) - 1]
+    return mask
+
+def frontier(res, maximize=MAXIMIZE, minimize=MINIMIZE, by='size'):
+    """
+    Return the Pareto frontier of the points @res.
+
+    @param res      A Pareto_dtype array, see explore()
+    @param maximize Fields to maximise
+    @param minimize Fields to minimise
+    @param by       Field of the points to compare separately, None to
+                    compare all points
+    @returns The points of @res not dominated by another point with
+             the same @by, sorted by @by and the first objective
+    """
+    costs = np.stack([-res[f].astype(np.float64) for f in maximize] +
+                     [res[f].astype(np.float64) for f in minimize], axis=1)
+    mask = np.zeros(len(res), dtype=bool)
+    if by is None:
+        mask = non_dominated(costs)
+    else:
+        for val in np.unique(res[by]):
+            idx = np.flatnonzero(res[by] == val)
+            mask[idx] = non_dominated(costs[idx])
+    idx = np.flatnonzero(mask)
+    order = np.lexsort((costs[idx, 0],) +
+                       ((res[by][idx],) if by is not None else ()))
+    return res[idx[order]]
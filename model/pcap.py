@@ -0,0 +1,296 @@
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""PCIe demand of packet captures over time
+
+A capture file (classic pcap or pcapng) is memory mapped and read as a
+stream of chunks of packet timestamps and lengths (read()). The
+packets are bucketed into fixed time windows (windows()) and for each
+window the bandwidth a NIC model needs to handle the packets is worked
+out (timeline()).
+
+The per packet bytes of a model only depend on the packet size, so
+they are computed once per size and summed per window. The effective
+bandwidth of a window is the packet data received in it divided by the
+window length, and the model gives the raw PCIe bandwidth required for
+it in each direction. Utilisation and headroom are relative to the TLP
+bandwidth of the PCIe configuration.
+
+Only the original packet length is used, the link type is ignored.
+Lengths are those of the frames on the wire as captured, i.e.
+typically without the FCS, which matches the packet sizes the NIC
+models expect.
+"""
+
+# pylint: disable=invalid-name
+# pylint: disable=too-many-arguments
+# pylint: disable=too-many-locals
+
+import mmap
+import struct
+
+import numpy as np
+
+from . import pcie
+from . import mix
+
+# classic pcap magic numbers, as read little endian
+PCAP_MAGIC_US = 0xa1b2c3d4
+PCAP_MAGIC_NS = 0xa1b23c4d
+# pcapng block types
+PCAPNG_SHB = 0x0a0d0d0a
+PCAPNG_IDB = 0x00000001
+PCAPNG_PB = 0x00000002
+PCAPNG_SPB = 0x00000003
+PCAPNG_EPB = 0x00000006
+PCAPNG_BOM = 0x1a2b3c4d
+PCAPNG_OPT_TSRESOL = 9
+
+# Number of packets per chunk
+CHUNK = 65536
+
+def _pcap(buf, chunk):
+    """Read a classic pcap file from @buf"""
+    magic, = struct.unpack_from("<I", buf, 0)
+    if magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+        endian = "<"
+    else:
+        endian = ">"
+        magic, = struct.unpack_from(">I", buf, 0)
+    frac_ns = 1 if magic == PCAP_MAGIC_NS else 1000
+    rec = struct.Struct(endian + "IIII")
+    off = 24
+    end = len(buf)
+    ts = []
+    lens = []
+    while off + 16 <= end:
+        sec, frac, incl, orig = rec.unpack_from(buf, off)
+        ts.append(sec * 1000000000 + frac * frac_ns)
+        lens.append(orig)
+        off += 16 + incl
+        if len(ts) == chunk:
+            yield np.array(ts, dtype=np.int64), np.array(lens, dtype=np.int64)
+            ts = []
+            lens = []
+    if ts:
+        yield np.array(ts, dtype=np.int64), np.array(lens, dtype=np.int64)
+
+def _tsresol(buf, off, end, endian):
+    """Return the timestamp resolution (units per second) from the
+    options of an IDB between @off and @end"""
+    hdr = struct.Struct(endian + "HH")
+    while off + 4 <= end:
+        code, length = hdr.unpack_from(buf, off)
+        if code == 0:
+            break
+        if code == PCAPNG_OPT_TSRESOL:
+            val = buf[off + 4]
+            return 2 ** (val & 0x7f) if val & 0x80 else 10 ** val
+        off += 4 + (length + 3) // 4 * 4
+    return 1000000
+
+def _pcapng(buf, chunk):
+    """Read a pcapng file from @buf"""
+    end = len(buf)
+    off = 0
+    endian = "<"
+    resols = []
+    ts = []
+    lens = []
+    while off + 12 <= end:
+        btype, = struct.unpack_from(endian + "I", buf, off)
+        if btype == PCAPNG_SHB:
+            bom, = struct.unpack_from("<I", buf, off + 8)
+            endian = "<" if bom == PCAPNG_BOM else ">"
+            resols = []
+        blen, = struct.unpack_from(endian + "I", buf, off + 4)
+        if blen < 12:
+            raise Exception("Corrupt pcapng block at offset %d" % off)
+        if btype == PCAPNG_IDB:
+            resols.append(_tsresol(buf, off + 16, off + blen - 4, endian))
+        elif btype in (PCAPNG_EPB, PCAPNG_PB):
+            if btype == PCAPNG_EPB:
+                ifc, hi, lo, _, orig = struct.unpack_from(endian + "IIIII",
+                                                          buf, off + 8)
+            else:
+                ifc, _, hi, lo, _, orig = struct.unpack_from(endian + "HHIIII",
+                                                             buf, off + 8)
+            resol = resols[ifc] if ifc < len(resols) else 1000000
+            units = (hi << 32) | lo
+            if resol == 1000000000:
+                ts.append(units)
+            else:
+                ts.append(units * 1000000000 // resol)
+            lens.append(orig)
+        elif btype == PCAPNG_SPB:
+            # no timestamp, count it with the previous packet
+            orig, = struct.unpack_from(endian + "I", buf, off + 8)
+            ts.append(ts[-1] if ts else 0)
+            lens.append(orig)
+        off += blen
+        if len(ts) >= chunk:
+            yield np.array(ts, dtype=np.int64), np.array(lens, dtype=np.int64)
+            ts = []
+            lens = []
+    if ts:
+        yield np.array(ts, dtype=np.int64), np.array(lens, dtype=np.int64)
+
+def read(fname, chunk=CHUNK):
+    """Read the capture file @fname (pcap or pcapng). Yields tuples of
+    arrays (timestamps in ns, packet lengths) of up to @chunk packets.
+    The file is memory mapped rather than read into memory."""
+    with open(fname, "rb") as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            return
+        with buf:
+            if len(buf) < 4:
+                raise Exception("Not a capture file: %s" % fname)
+            magic, = struct.unpack_from("<I", buf, 0)
+            if magic == PCAPNG_SHB:
+                gen = _pcapng(buf, chunk)
+            elif magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS) or \
+                 struct.unpack_from(">I", buf, 0)[0] in (PCAP_MAGIC_US,
+                                                         PCAP_MAGIC_NS):
+                gen = _pcap(buf, chunk)
+            else:
+                raise Exception("Not a capture file: %s" % fname)
+            yield from gen
+
+
+class _PerPacket():
+    """Per packet bytes (data_B, tx_rx, tx_tx, rx_rx, rx_tx) of a model
+    for all sizes up to the largest seen so far"""
+
+    def __init__(self, pcicfg, model, **kwargs):
+        self.pcicfg = pcicfg
+        self.bytes_fn, self.res_fn = mix.model_fns(model)
+        self.kwargs = kwargs
+        self.table = np.zeros((5, 1))
+
+    def __call__(self, sizes):
+        top = int(sizes.max()) if len(sizes) else 0
+        if top >= self.table.shape[1]:
+            all_sizes = np.arange(1, max(top + 1, 2 * self.table.shape[1]))
+            cols = np.array(np.broadcast_arrays(
+                *self.bytes_fn(self.pcicfg, all_sizes, **self.kwargs)),
+                            dtype=np.float64)
+            # the NIC models return the bytes for a batch of packets
+            cols *= all_sizes / cols[0]
+            self.table = np.concatenate([np.zeros((cols.shape[0], 1)), cols],
+                                        axis=1)
+        return self.table[:, sizes]
+
+
+def windows(chunks, window_ns, per_packet):
+    """Bucket packets into windows of @window_ns.
+
+    @param chunks      Iterable of (timestamps, lengths) as from read()
+    @param window_ns   Length of a window in ns
+    @param per_packet  Function returning an array of shape (#columns,
+                       #packets) of per packet values for an array of
+                       lengths
+    @returns Yields tuples (index of the first window, packet counts,
+             sums) where sums has the shape (#columns, #windows). Windows
+             are numbered from the first packet. Packets earlier than an
+             already completed window are counted in the oldest open one.
+    """
+    if window_ns <= 0:
+        raise Exception("Window must be positive: %r" % window_ns)
+    t0 = None
+    base = 0
+    counts = np.zeros(0)
+    sums = None
+    for ts, lens in chunks:
+        if not len(ts):
+            continue
+        if t0 is None:
+            t0 = int(ts[0])
+        idx = np.maximum((ts - t0) // window_ns - base, 0)
+        n = int(idx.max()) + 1
+        vals = per_packet(lens)
+        if sums is None:
+            sums = np.zeros((vals.shape[0], 0))
+        if n > len(counts):
+            counts = np.concatenate([counts, np.zeros(n - len(counts))])
+            sums = np.concatenate([sums,
+                                   np.zeros((sums.shape[0],
+                                             n - sums.shape[1]))], axis=1)
+        counts += np.bincount(idx, minlength=len(counts))
+        for i in range(vals.shape[0]):
+            sums[i] += np.bincount(idx, vals[i], minlength=len(counts))
+        # all but the last window are complete
+        done = len(counts) - 1
+        if done > 0:
+            yield base, counts[:done], sums[:, :done]
+            base += done
+            counts = counts[done:]
+            sums = sums[:, done:]
+    if len(counts):
+        yield base, counts, sums
+
+
+# Columns of the timeline, for output.Writer
+Columns = [('time',        "Time (s)"),
+           ('pkts',        "Packets"),
+           ('gbps',        "Data (Gb/s)"),
+           ('rx_raw',      "PCIe RX (Gb/s)"),
+           ('tx_raw',      "PCIe TX (Gb/s)"),
+           ('rx_util',     "PCIe RX Utilisation"),
+           ('tx_util',     "PCIe TX Utilisation"),
+           ('rx_headroom', "PCIe RX Headroom (Gb/s)"),
+           ('tx_headroom', "PCIe TX Headroom (Gb/s)")]
+Text_fmt = "%.6f %d %.3f %.3f %.3f %.3f %.3f %.3f %.3f"
+
+def timeline(chunks, pcicfg, model, direction, window_ns=1000000, **kwargs):
+    """
+    Work out the PCIe bandwidth needed by @model for the packets of a
+    capture per time window.
+
+    @param chunks    Iterable of (timestamps, lengths) as from read()
+    @param pcicfg    PCIe configuration
+    @param model     Model name (see piecewise.Models) or device.Device
+    @param direction Direction(s) of the traffic. Note, packets received
+                     by a NIC are DIR_TX.
+    @param window_ns Length of a window in ns
+    @param kwargs    Passed to the model, e.g. irq_mod for niantic
+    @returns Yields blocks (dictionaries of arrays, see Columns) with one
+             row per window
+    """
+    per_packet = _PerPacket(pcicfg, model, **kwargs)
+    # The required raw bandwidth is proportional to the effective
+    # bandwidth, so evaluate for 1 Gb/s and scale per window.
+    unit = pcie.BW_Spec(1.0, 1.0, pcie.BW_Spec.BW_EFF)
+    avail = pcicfg.TLP_bw
+    for base, counts, sums in windows(chunks, window_ns, per_packet):
+        busy = counts > 0
+        # bits per ns = Gb/s
+        gbps = sums[0] * 8.0 / window_ns
+        raw_rx = np.zeros(len(counts))
+        raw_tx = np.zeros(len(counts))
+        if np.any(busy):
+            res = per_packet.res_fn(unit, direction, *sums[:, busy])
+            raw_rx[busy] = res['rx_raw'] * gbps[busy]
+            raw_tx[busy] = res['tx_raw'] * gbps[busy]
+        yield {'time': (base + np.arange(len(counts))) * window_ns / 1e9,
+               'pkts': counts.astype(np.int64),
+               'gbps': gbps,
+               'rx_raw': raw_rx,
+               'tx_raw': raw_tx,
+               'rx_util': raw_rx / avail,
+               'tx_util': raw_tx / avail,
+               'rx_headroom': avail - raw_rx,
+               'tx_headroom': avail - raw_tx}
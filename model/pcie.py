@@ -37,23 +37,12 @@ GTs = {'gen1' : 2.5,
        'gen7' : 128.0}
 
 # Either 8b/10b, 128b/130b, 242b/256b symbol encoding
-Gbs = {}
-for ver in GTs.keys():
+def _encoding(ver):
     if ver in ['gen1', 'gen2']:
-        Gbs[ver] = (8.0/10.0) * GTs[ver]
-    elif ver in ['gen3', 'gen4', 'gen5']:
-        Gbs[ver] = (128.0/130.0) * GTs[ver]
-    elif ver in ['gen6', 'gen7']:
-        Gbs[ver] = (242/256) * GTs[ver]
-
-# Raw bandwidth Gbs * Lanes
-Raw = {}
-for ver in Vers:
-    for lanes in Laness:
-        if not ver in Raw:
-            Raw[ver] = {}
-        Raw[ver][lanes] = Gbs[ver] * \
-                          Laness_mul[Laness.index(lanes)]
+        return 8.0/10.0
+    if ver in ['gen3', 'gen4', 'gen5']:
+        return 128.0/130.0
+    return 242/256
 
 # Maximum Payload Size
 MPSs = [128, 256, 512, 1024, 2048, 4096]
@@ -64,128 +53,66 @@ RCBs = [64, 128, 256, 512]
 
 # FC Update Rate,
 # see PCIe Base Spec rev 5.0 Table 2-46, 2-47, and 2-48
+# One row per lane configuration (Laness) and one column per MPS (MPSs).
+# Gen4 and gen5 use the same values as gen3. Gen6/gen7 are guesses,
+# just copied from gen5
 FC_Size = 8 # 2 B Phys + 4 B DLLP + 2B DLLP CRC
-FC_Guide = {
-    'gen1' : {
-        'x1'  : {128: 237, 256: 416, 512: 559, 1024: 1071, 2048: 2095, 4096: 4143},
-        'x2'  : {128: 128, 256: 217, 512: 289, 1024:  545, 2048: 1057, 4096: 2081},
-        'x4'  : {128:  73, 256: 118, 512: 154, 1024:  282, 2048:  538, 4096: 1050},
-        'x8'  : {128:  67, 256: 107, 512:  86, 1024:  150, 2048:  278, 4096:  534},
-        'x16' : {128:  48, 256:  72, 512:  86, 1024:  150, 2048:  278, 4096:  534},
-        'x32' : {128:  33, 256:  45, 512:  52, 1024:   84, 2048:  248, 4096:  276},
-        },
-    'gen2' : {
-        'x1'  : {128: 288, 256: 467, 512: 610, 1024: 1122, 2048: 2146, 4096: 4194},
-        'x2'  : {128: 179, 256: 268, 512: 340, 1024:  596, 2048: 1108, 4096: 2132},
-        'x4'  : {128: 124, 256: 169, 512: 205, 1024:  333, 2048:  589, 4096: 1101},
-        'x8'  : {128: 118, 256: 158, 512: 137, 1024:  201, 2048:  329, 4096:  585},
-        'x16' : {128:  99, 256: 123, 512: 137, 1024:  201, 2048:  329, 4096:  585},
-        'x32' : {128:  84, 256:  96, 512: 103, 1024:  135, 2048:  199, 4096:  327},
-        },
-    'gen3' : {
-        'x1'  : {128: 333, 256: 512, 512: 655, 1024: 1167, 2048: 2191, 4096: 4239},
-        'x2'  : {128: 224, 256: 313, 512: 385, 1024:  641, 2048: 1153, 4096: 2177},
-        'x4'  : {128: 169, 256: 214, 512: 250, 1024:  378, 2048:  634, 4096: 1146},
-        'x8'  : {128: 163, 256: 203, 512: 182, 1024:  246, 2048:  374, 4096:  630},
-        'x16' : {128: 144, 256: 168, 512: 182, 1024:  246, 2048:  374, 4096:  630},
-        'x32' : {128: 129, 256: 141, 512: 148, 1024:  180, 2048:  244, 4096:  372},
-        },
-    'gen4' : {
-        'x1'  : {128: 333, 256: 512, 512: 655, 1024: 1167, 2048: 2191, 4096: 4239},
-        'x2'  : {128: 224, 256: 313, 512: 385, 1024:  641, 2048: 1153, 4096: 2177},
-        'x4'  : {128: 169, 256: 214, 512: 250, 1024:  378, 2048:  634, 4096: 1146},
-        'x8'  : {128: 163, 256: 203, 512: 182, 1024:  246, 2048:  374, 4096:  630},
-        'x16' : {128: 144, 256: 168, 512: 182, 1024:  246, 2048:  374, 4096:  630},
-        'x32' : {128: 129, 256: 141, 512: 148, 1024:  180, 2048:  244, 4096:  372},
-        },
-    'gen5' : {
-        'x1'  : {128: 333, 256: 512, 512: 655, 1024: 1167, 2048: 2191, 4096: 4239},
-        'x2'  : {128: 224, 256: 313, 512: 385, 1024:  641, 2048: 1153, 4096: 2177},
-        'x4'  : {128: 169, 256: 214, 512: 250, 1024:  378, 2048:  634, 4096: 1146},
-        'x8'  : {128: 163, 256: 203, 512: 182, 1024:  246, 2048:  374, 4096:  630},
-        'x16' : {128: 144, 256: 168, 512: 182, 1024:  246, 2048:  374, 4096:  630},
-        'x32' : {128: 129, 256: 141, 512: 148, 1024:  180, 2048:  244, 4096:  372},
-        },
-    # Gen6/gen7 are guesses, just copied from gen5
-    'gen6' : {
-        'x1'  : {128: 333, 256: 512, 512: 655, 1024: 1167, 2048: 2191, 4096: 4239},
-        'x2'  : {128: 224, 256: 313, 512: 385, 1024:  641, 2048: 1153, 4096: 2177},
-        'x4'  : {128: 169, 256: 214, 512: 250, 1024:  378, 2048:  634, 4096: 1146},
-        'x8'  : {128: 163, 256: 203, 512: 182, 1024:  246, 2048:  374, 4096:  630},
-        'x16' : {128: 144, 256: 168, 512: 182, 1024:  246, 2048:  374, 4096:  630},
-        'x32' : {128: 129, 256: 141, 512: 148, 1024:  180, 2048:  244, 4096:  372},
-        },
-    'gen7' : {
-        'x1'  : {128: 333, 256: 512, 512: 655, 1024: 1167, 2048: 2191, 4096: 4239},
-        'x2'  : {128: 224, 256: 313, 512: 385, 1024:  641, 2048: 1153, 4096: 2177},
-        'x4'  : {128: 169, 256: 214, 512: 250, 1024:  378, 2048:  634, 4096: 1146},
-        'x8'  : {128: 163, 256: 203, 512: 182, 1024:  246, 2048:  374, 4096:  630},
-        'x16' : {128: 144, 256: 168, 512: 182, 1024:  246, 2048:  374, 4096:  630},
-        'x32' : {128: 129, 256: 141, 512: 148, 1024:  180, 2048:  244, 4096:  372},
-        },
+_FC_Guide = {
+    'gen1' : (
+        ( 237,  416,  559, 1071, 2095, 4143),  # x1
+        ( 128,  217,  289,  545, 1057, 2081),  # x2
+        (  73,  118,  154,  282,  538, 1050),  # x4
+        (  67,  107,   86,  150,  278,  534),  # x8
+        (  48,   72,   86,  150,  278,  534),  # x16
+        (  33,   45,   52,   84,  248,  276),  # x32
+        ),
+    'gen2' : (
+        ( 288,  467,  610, 1122, 2146, 4194),  # x1
+        ( 179,  268,  340,  596, 1108, 2132),  # x2
+        ( 124,  169,  205,  333,  589, 1101),  # x4
+        ( 118,  158,  137,  201,  329,  585),  # x8
+        (  99,  123,  137,  201,  329,  585),  # x16
+        (  84,   96,  103,  135,  199,  327),  # x32
+        ),
+    'gen3' : (
+        ( 333,  512,  655, 1167, 2191, 4239),  # x1
+        ( 224,  313,  385,  641, 1153, 2177),  # x2
+        ( 169,  214,  250,  378,  634, 1146),  # x4
+        ( 163,  203,  182,  246,  374,  630),  # x8
+        ( 144,  168,  182,  246,  374,  630),  # x16
+        ( 129,  141,  148,  180,  244,  372),  # x32
+        ),
     }
 
 # Ack Limit,
 # see PCIe Base Spec rev 5.0 Table 3-7, 3-8, and 3-9
+# Same layout as _FC_Guide
 Ack_Size = 8 # 2 B Phys + 4 B DLLP + 2B DLLP CRC
-Ack_Limits = {
-    'gen1' : {
-        'x1'  : {128: 237, 256: 416, 512: 559, 1024: 1071, 2048: 2095, 4096: 4143},
-        'x2'  : {128: 128, 256: 217, 512: 289, 1024:  545, 2048: 1057, 4096: 2081},
-        'x4'  : {128:  73, 256: 118, 512: 154, 1024:  282, 2048:  538, 4096: 1050},
-        'x8'  : {128:  67, 256: 107, 512:  86, 1024:  150, 2048:  278, 4096:  534},
-        'x16' : {128:  48, 256:  72, 512:  86, 1024:  150, 2048:  278, 4096:  534},
-        'x32' : {128:  33, 256:  45, 512:  52, 1024:   84, 2048:  148, 4096:  276},
-        },
-    'gen2' : {
-        'x1'  : {128: 288, 256: 467, 512: 610, 1024: 1122, 2048: 2146, 4096: 4194},
-        'x2'  : {128: 179, 256: 268, 512: 340, 1024:  596, 2048: 1108, 4096: 2132},
-        'x4'  : {128: 124, 256: 169, 512: 205, 1024:  333, 2048:  589, 4096: 1101},
-        'x8'  : {128: 118, 256: 158, 512: 137, 1024:  201, 2048:  329, 4096:  585},
-        'x16' : {128:  99, 256: 123, 512: 137, 1024:  201, 2048:  329, 4096:  585},
-        'x32' : {128:  84, 256:  96, 512: 103, 1024:  135, 2048:  199, 4096:  237},
-        },
-    'gen3' : {
-        'x1'  : {128: 333, 256: 512, 512: 655, 1024: 1167, 2048: 2191, 4096: 4239},
-        'x2'  : {128: 224, 256: 313, 512: 385, 1024:  641, 2048: 1153, 4096: 2177},
-        'x4'  : {128: 169, 256: 214, 512: 250, 1024:  378, 2048:  634, 4096: 1146},
-        'x8'  : {128: 163, 256: 203, 512: 182, 1024:  246, 2048:  374, 4096:  630},
-        'x16' : {128: 144, 256: 168, 512: 182, 1024:  246, 2048:  374, 4096:  630},
-        'x32' : {128: 129, 256: 141, 512: 148, 1024:  180, 2048:  244, 4096:  372},
-        },
-    'gen4' : {
-        'x1'  : {128: 333, 256: 512, 512: 655, 1024: 1167, 2048: 2191, 4096: 4239},
-        'x2'  : {128: 224, 256: 313, 512: 385, 1024:  641, 2048: 1153, 4096: 2177},
-        'x4'  : {128: 169, 256: 214, 512: 250, 1024:  378, 2048:  634, 4096: 1146},
-        'x8'  : {128: 163, 256: 203, 512: 182, 1024:  246, 2048:  374, 4096:  630},
-        'x16' : {128: 144, 256: 168, 512: 182, 1024:  246, 2048:  374, 4096:  630},
-        'x32' : {128: 129, 256: 141, 512: 148, 1024:  180, 2048:  244, 4096:  372},
-        },
-    'gen5' : {
-        'x1'  : {128: 333, 256: 512, 512: 655, 1024: 1167, 2048: 2191, 4096: 4239},
-        'x2'  : {128: 224, 256: 313, 512: 385, 1024:  641, 2048: 1153, 4096: 2177},
-        'x4'  : {128: 169, 256: 214, 512: 250, 1024:  378, 2048:  634, 4096: 1146},
-        'x8'  : {128: 163, 256: 203, 512: 182, 1024:  246, 2048:  374, 4096:  630},
-        'x16' : {128: 144, 256: 168, 512: 182, 1024:  246, 2048:  374, 4096:  630},
-        'x32' : {128: 129, 256: 141, 512: 148, 1024:  180, 2048:  244, 4096:  372},
-        },
-    # Gen6/gen7 are guesses, just copied from gen5
-    'gen6' : {
-        'x1'  : {128: 333, 256: 512, 512: 655, 1024: 1167, 2048: 2191, 4096: 4239},
-        'x2'  : {128: 224, 256: 313, 512: 385, 1024:  641, 2048: 1153, 4096: 2177},
-        'x4'  : {128: 169, 256: 214, 512: 250, 1024:  378, 2048:  634, 4096: 1146},
-        'x8'  : {128: 163, 256: 203, 512: 182, 1024:  246, 2048:  374, 4096:  630},
-        'x16' : {128: 144, 256: 168, 512: 182, 1024:  246, 2048:  374, 4096:  630},
-        'x32' : {128: 129, 256: 141, 512: 148, 1024:  180, 2048:  244, 4096:  372},
-        },
-    'gen7' : {
-        'x1'  : {128: 333, 256: 512, 512: 655, 1024: 1167, 2048: 2191, 4096: 4239},
-        'x2'  : {128: 224, 256: 313, 512: 385, 1024:  641, 2048: 1153, 4096: 2177},
-        'x4'  : {128: 169, 256: 214, 512: 250, 1024:  378, 2048:  634, 4096: 1146},
-        'x8'  : {128: 163, 256: 203, 512: 182, 1024:  246, 2048:  374, 4096:  630},
-        'x16' : {128: 144, 256: 168, 512: 182, 1024:  246, 2048:  374, 4096:  630},
-        'x32' : {128: 129, 256: 141, 512: 148, 1024:  180, 2048:  244, 4096:  372},
-        },
+_Ack_Limits = {
+    'gen1' : (
+        ( 237,  416,  559, 1071, 2095, 4143),  # x1
+        ( 128,  217,  289,  545, 1057, 2081),  # x2
+        (  73,  118,  154,  282,  538, 1050),  # x4
+        (  67,  107,   86,  150,  278,  534),  # x8
+        (  48,   72,   86,  150,  278,  534),  # x16
+        (  33,   45,   52,   84,  148,  276),  # x32
+        ),
+    'gen2' : (
+        ( 288,  467,  610, 1122, 2146, 4194),  # x1
+        ( 179,  268,  340,  596, 1108, 2132),  # x2
+        ( 124,  169,  205,  333,  589, 1101),  # x4
+        ( 118,  158,  137,  201,  329,  585),  # x8
+        (  99,  123,  137,  201,  329,  585),  # x16
+        (  84,   96,  103,  135,  199,  237),  # x32
+        ),
+    'gen3' : (
+        ( 333,  512,  655, 1167, 2191, 4239),  # x1
+        ( 224,  313,  385,  641, 1153, 2177),  # x2
+        ( 169,  214,  250,  378,  634, 1146),  # x4
+        ( 163,  203,  182,  246,  374,  630),  # x8
+        ( 144,  168,  182,  246,  374,  630),  # x16
+        ( 129,  141,  148,  180,  244,  372),  # x32
+        ),
     }
 
 # SKIP ordered sets for clock compensation (inserted on all lanes)
@@ -194,25 +121,96 @@ SKIP_Length = 4
 # DLLP header (6 bytes) plus start and end symbol at Phys layer
 DLLP_Hdr = 8
 
-# Maximum Bandwidth usable at TLP layer. This takes into account the
-# recommended rates for ACKs and FC updates as per spec as well as the SKIP
-# ordered sets for clock compensation. The Bandwidth can be further reduced
-# due to bit errors or different chipset configurations
-TLP_bw = {}
-for ver in Vers:
-    for lanes in Laness:
-        for mps in MPSs:
-            if not ver in TLP_bw:
-                TLP_bw[ver] = {}
-            if not lanes in TLP_bw[ver]:
-                TLP_bw[ver][lanes] = {}
-
-            ack_overhead = float(Ack_Size) / float(Ack_Limits[ver][lanes][mps])
-            fc_overhead = float(FC_Size) / float(FC_Guide[ver][lanes][mps])
-            skip_overhead = float(SKIP_Length) / float(SKIP_Interval)
-            overheads = ack_overhead + fc_overhead + skip_overhead
-            # deduct overheads for ACKs and FC updates
-            TLP_bw[ver][lanes][mps] = Raw[ver][lanes] - Raw[ver][lanes] * overheads
+##
+## Integer indices for versions, lanes and MPS. These index the dense
+## tables below, e.g. Dense_TLP_bw[GEN3, X8, MPS_256]
+##
+GEN1, GEN2, GEN3, GEN4, GEN5, GEN6, GEN7 = range(len(Vers))
+X1, X2, X4, X8, X16, X32 = range(len(Laness))
+MPS_128, MPS_256, MPS_512, MPS_1024, MPS_2048, MPS_4096 = range(len(MPSs))
+Vers_idx = {ver: i for i, ver in enumerate(Vers)}
+Laness_idx = {lanes: i for i, lanes in enumerate(Laness)}
+MPSs_idx = {mps: i for i, mps in enumerate(MPSs)}
+
+##
+## Accessors for the per version/lanes/MPS values. Values are only
+## computed when needed, typically once per (interned) Cfg.
+##
+_Lanes_mul = dict(zip(Laness, Laness_mul))
+
+# The version whose values from the spec tables apply to a version
+_Spec_vers = {ver: ver if ver in _FC_Guide else 'gen3' for ver in Vers}
+
+def gbs(ver):
+    """Bandwidth per lane in Gb/s after symbol encoding"""
+    return _encoding(ver) * GTs[ver]
+
+def raw_bw(ver, lanes):
+    """Raw bandwidth (Gbs * Lanes) in Gb/s"""
+    return gbs(ver) * _Lanes_mul[lanes]
+
+def fc_guide(ver, lanes, mps):
+    """Recommended FC update interval in bytes"""
+    return _FC_Guide[_Spec_vers[ver]][Laness_idx[lanes]][MPSs_idx[mps]]
+
+def ack_limit(ver, lanes, mps):
+    """Ack limit in bytes"""
+    return _Ack_Limits[_Spec_vers[ver]][Laness_idx[lanes]][MPSs_idx[mps]]
+
+def tlp_bw(ver, lanes, mps):
+    """Maximum Bandwidth usable at TLP layer in Gb/s.
+
+    This takes into account the recommended rates for ACKs and FC
+    updates as per spec as well as the SKIP ordered sets for clock
+    compensation. The Bandwidth can be further reduced due to bit
+    errors or different chipset configurations
+    """
+    raw = raw_bw(ver, lanes)
+    ack_overhead = float(Ack_Size) / float(ack_limit(ver, lanes, mps))
+    fc_overhead = float(FC_Size) / float(fc_guide(ver, lanes, mps))
+    skip_overhead = float(SKIP_Length) / float(SKIP_Interval)
+    overheads = ack_overhead + fc_overhead + skip_overhead
+    # deduct overheads for ACKs and FC updates
+    return raw - raw * overheads
+
+# The above as nested dictionaries, e.g. TLP_bw['gen3']['x8'][256], and
+# as dense, read-only NumPy arrays indexed by the integer indices
+# above, e.g. Dense_TLP_bw[GEN3, X8, MPS_256]. The latter allow to
+# look up values for many configurations at once with fancy indexing.
+# These are only built when first accessed (see __getattr__).
+_Tables = {
+    'Gbs'              : lambda: {ver: gbs(ver) for ver in Vers},
+    'Raw'              : lambda: {ver: {lanes: raw_bw(ver, lanes)
+                                        for lanes in Laness} for ver in Vers},
+    'FC_Guide'         : lambda: _nested(fc_guide),
+    'Ack_Limits'       : lambda: _nested(ack_limit),
+    'TLP_bw'           : lambda: _nested(tlp_bw),
+    'Dense_Raw'        : lambda: _dense(
+        [[raw_bw(ver, lanes) for lanes in Laness] for ver in Vers], 'f8'),
+    'Dense_FC_Guide'   : lambda: _dense(_nested(fc_guide, list), 'i4'),
+    'Dense_Ack_Limits' : lambda: _dense(_nested(ack_limit, list), 'i4'),
+    'Dense_TLP_bw'     : lambda: _dense(_nested(tlp_bw, list), 'f8'),
+    }
+
+def _nested(fn, kind=dict):
+    if kind is dict:
+        return {ver: {lanes: {mps: fn(ver, lanes, mps) for mps in MPSs}
+                      for lanes in Laness} for ver in Vers}
+    return [[[fn(ver, lanes, mps) for mps in MPSs]
+             for lanes in Laness] for ver in Vers]
+
+def _dense(vals, dtype):
+    import numpy as np # pylint: disable=import-outside-toplevel
+    arr = np.array(vals, dtype=dtype)
+    arr.flags.writeable = False
+    return arr
+
+def __getattr__(name):
+    if name in _Tables:
+        val = _Tables[name]()
+        globals()[name] = val
+        return val
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 
 # TLP Types
@@ -250,12 +248,84 @@ TLP_CplD_Hdr_Szs = {
 # SIze of a sending a MSI
 MSI_SIZE = 4
 
+# Number of outstanding non-posted requests a requester can have, by
+# tag field width. With 10-bit tags, tag values with the upper two
+# bits 0 are not used, leaving 768.
+Tags = {5: 32, 8: 256, 10: 768}
+
+# Sets of legal values for quick validation of configurations
+_Vers_set = frozenset(Vers)
+_Laness_set = frozenset(Laness)
+_MPSs_set = frozenset(MPSs)
+_MRRSs_set = frozenset(MRRSs)
+_RCBs_set = frozenset(RCBs)
+
+# All configurations created so far, indexed by Cfg.key
+_Cfg_registry = {}
+
+# Legal values of each configuration parameter in the order of
+# Cfg.key. Used to give each configuration a unique, dense integer id.
+_Cfg_params = (Vers, Laness, [32, 64], [0, 1], MPSs, MRRSs, RCBs,
+               [False, True])
+# Number of legal configurations
+Num_Cfgs = 1
+for _vals in _Cfg_params:
+    Num_Cfgs *= len(_vals)
+
+def cfg_from_id(cfg_id):
+    """Return the configuration with the id @cfg_id (see Cfg.id)"""
+    if not 0 <= cfg_id < Num_Cfgs:
+        raise Exception("Unknown configuration id: %d" % cfg_id)
+    key = []
+    for vals in reversed(_Cfg_params):
+        cfg_id, idx = divmod(cfg_id, len(vals))
+        key.append(vals[idx])
+    return Cfg(*reversed(key))
+
+def cfg_idx_many(cfg_ids):
+    """Decode an array of configuration ids (see Cfg.id).
+
+    Returns a tuple of arrays with the index of each parameter into its
+    list of legal values, in the order of Cfg.key, i.e.: version (see
+    Vers), lanes (Laness), addr ([32, 64]), ecrc, mps (MPSs), mrrs
+    (MRRSs), rcb (RCBs) and rcb_chunks. The first, second and fifth
+    can be used to index the dense tables, e.g.:
+
+        ver, lanes, _, _, mps, _, _, _ = cfg_idx_many(ids)
+        tlp_bws = Dense_TLP_bw[ver, lanes, mps]
+    """
+    import numpy as np # pylint: disable=import-outside-toplevel
+    cfg_ids = np.asarray(cfg_ids, dtype=np.int64)
+    idx = []
+    for vals in reversed(_Cfg_params):
+        cfg_ids, i = np.divmod(cfg_ids, len(vals))
+        idx.append(i)
+    return tuple(reversed(idx))
+
 class Cfg():
-    """A glorified struct to represent a specific PCIe device configuration"""
+    """A glorified struct to represent a specific PCIe device configuration
+
+    Configurations are immutable and interned: Creating a Cfg with the
+    same parameters as an existing one returns the existing object.
+    They can therefore be compared and hashed cheaply and be used as
+    keys in dictionaries.
+
+    Each configuration also has a unique integer id (Cfg.id) in the
+    range [0, Num_Cfgs), which can be used to refer to it in arrays.
+    See cfg_from_id() and cfg_idx_many().  The indices of the version,
+    lanes and MPS into the dense tables are available as Cfg.ver_idx,
+    Cfg.lanes_idx and Cfg.mps_idx.
+    """
+
+    __slots__ = ('version', 'lanes', 'addr', 'ecrc',
+                 'mps', 'mrrs', 'rcb', 'rcb_chunks', 'key', 'id',
+                 'ver_idx', 'lanes_idx', 'mps_idx',
+                 'TLP_MWr_Hdr_Sz', 'TLP_MRd_Hdr_Sz', 'TLP_CplD_Hdr_Sz',
+                 'TLP_bw', 'RAW_bw')
 
-    def __init__(self, version, lanes, addr, ecrc,
-                 mps, mrrs, rcb, rcb_chunks=False):
-        """Use this class as a struct for the PCI configuration
+    def __new__(cls, version, lanes, addr, ecrc,
+                mps, mrrs, rcb, rcb_chunks=False):
+        """Look up or create a PCI configuration
         @param version: String, 'gen1', 'gen2' 'gen3', 'gen4', 'gen5'
         @param lanes: String, 'x1', 'x2', 'x4, 'x8', 'x16', 'x32'
         @param addr: either 32 or 64. What type of addresses to use
@@ -265,36 +335,68 @@ class Cfg():
         @param rcb: Read Completion Boundaries
         @param rcb_chunks: Boolean, are read requests chopped into RCB or MPS
         """
-        if version not in Vers:
+        key = (version, lanes, addr, ecrc, mps, mrrs, rcb, bool(rcb_chunks))
+        self = _Cfg_registry.get(key)
+        if self is not None:
+            return self
+
+        if version not in _Vers_set:
             raise Exception("Unknown PCIe version: %s" % version)
-        self.version = version
-        if lanes not in Laness:
+        if lanes not in _Laness_set:
             raise Exception("Unknown Lane configuration: %s" % lanes)
-        self.lanes = lanes
-        if addr not in [32, 64]:
+        if addr not in (32, 64):
             raise Exception("Unknown address lenght: %d" % addr)
-        self.addr = addr
-        if ecrc not in [0, 1]:
+        if ecrc not in (0, 1):
             raise Exception("Unknown ECRC value: %d" % ecrc)
-        self.ecrc = ecrc
-        if mps not in MPSs:
+        if mps not in _MPSs_set:
             raise Exception("Unknown MPS value: %d" % mps)
-        self.mps = mps
-        if mrrs not in MRRSs:
-            raise Exception("Unknown MRRS value: %d" % mps)
-        self.mrrs = mrrs
-        if rcb not in RCBs:
-            raise Exception("Unknown RCB value: %d" % mps)
-        self.rcb = rcb
-        self.rcb_chunks = rcb_chunks
+        if mrrs not in _MRRSs_set:
+            raise Exception("Unknown MRRS value: %d" % mrrs)
+        if rcb not in _RCBs_set:
+            raise Exception("Unknown RCB value: %d" % rcb)
+
+        self = object.__new__(cls)
+        init = lambda name, val: object.__setattr__(self, name, val)
+        init('version', version)
+        init('lanes', lanes)
+        init('addr', addr)
+        init('ecrc', ecrc)
+        init('mps', mps)
+        init('mrrs', mrrs)
+        init('rcb', rcb)
+        init('rcb_chunks', key[-1])
+        init('key', key)
+        cfg_id = 0
+        for val, vals in zip(key, _Cfg_params):
+            cfg_id = cfg_id * len(vals) + vals.index(val)
+        init('id', cfg_id)
+        init('ver_idx', Vers_idx[version])
+        init('lanes_idx', Laness_idx[lanes])
+        init('mps_idx', MPSs_idx[mps])
 
         # derive Header Sizes for Memory Write, Read and Completion
-        self.TLP_MWr_Hdr_Sz = TLP_MWr_Hdr_Szs[addr][ecrc]
-        self.TLP_MRd_Hdr_Sz = TLP_MRd_Hdr_Szs[addr][ecrc]
-        self.TLP_CplD_Hdr_Sz = TLP_CplD_Hdr_Szs[ecrc]
+        init('TLP_MWr_Hdr_Sz', TLP_MWr_Hdr_Szs[addr][ecrc])
+        init('TLP_MRd_Hdr_Sz', TLP_MRd_Hdr_Szs[addr][ecrc])
+        init('TLP_CplD_Hdr_Sz', TLP_CplD_Hdr_Szs[ecrc])
+
+        init('TLP_bw', tlp_bw(version, lanes, mps))
+        init('RAW_bw', raw_bw(version, lanes))
+
+        _Cfg_registry[key] = self
+        return self
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PCIe configurations are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("PCIe configurations are immutable")
+
+    def __reduce__(self):
+        # Make sure copies and unpickled objects are interned too
+        return (Cfg, self.key)
 
-        self.TLP_bw = TLP_bw[version][lanes][mps]
-        self.RAW_bw = Raw[version][lanes]
+    def __repr__(self):
+        return "pcie.Cfg%r" % (self.key,)
 
     def pp(self):
         """Print the configuration"""
@@ -329,20 +431,40 @@ class BW_Spec():
     Bandwidth is specified in both direction, RX and TX, from the device
     perspective.
 
-    This is basically a glorified struct.
+    This is basically a glorified struct. Like Cfg it is an immutable
+    value: specifications with the same bandwidths and type compare
+    equal and hash the same, so they can be used as dictionary keys.
     """
 
     BW_RAW = 0
     BW_EFF = 1
 
     def __init__(self, rx_bw=0.0, tx_bw=0.0, bw_type=0):
-        self.rx_bw = rx_bw
-        self.tx_bw = tx_bw
         if bw_type not in [self.BW_RAW, self.BW_EFF]:
             raise Exception("Unknown BW type")
-        self.type = bw_type
+        object.__setattr__(self, 'rx_bw', rx_bw)
+        object.__setattr__(self, 'tx_bw', tx_bw)
+        object.__setattr__(self, 'type', bw_type)
         return
 
+    def __setattr__(self, name, value):
+        raise AttributeError("Bandwidth specifications are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Bandwidth specifications are immutable")
+
+    def __eq__(self, other):
+        if not isinstance(other, BW_Spec):
+            return NotImplemented
+        return (self.rx_bw, self.tx_bw, self.type) == \
+            (other.rx_bw, other.tx_bw, other.type)
+
+    def __hash__(self):
+        return hash((self.rx_bw, self.tx_bw, self.type))
+
+    def __repr__(self):
+        return "pcie.BW_Spec(%r, %r, %r)" % (self.rx_bw, self.tx_bw, self.type)
+
 class BW_Res():
     """
     A Bandwidth result object returned by all functions. Contains the
@@ -350,13 +472,24 @@ class BW_Res():
     direction.  RX and TX are always seen from the PCIe peer
     initiating the transfer.
 
-    Another glorified struct
+    Another glorified struct. Results may be shared between callers
+    (see memo.py), so they are read-only.
     """
     def __init__(self, rx_raw, rx_eff, tx_raw, tx_eff):
-        self.rx_raw = rx_raw
-        self.rx_eff = rx_eff
-        self.tx_raw = tx_raw
-        self.tx_eff = tx_eff
+        object.__setattr__(self, 'rx_raw', rx_raw)
+        object.__setattr__(self, 'rx_eff', rx_eff)
+        object.__setattr__(self, 'tx_raw', tx_raw)
+        object.__setattr__(self, 'tx_eff', tx_eff)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Bandwidth results are read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError("Bandwidth results are read-only")
+
+    def __repr__(self):
+        return "pcie.BW_Res(%r, %r, %r, %r)" % \
+            (self.rx_raw, self.rx_eff, self.tx_raw, self.tx_eff)
 
 if __name__ == '__main__':
     # Print out some useful data
@@ -366,5 +499,5 @@ if __name__ == '__main__':
             print("Lanes Phys BW (Gb/s) Data BW (Gb/s) MPS=%d" % mps)
             for lanes in Laness:
                 print("%5s %6.2f %6.2f" % \
-                      (lanes, Raw[ver][lanes],
-                       TLP_bw[ver][lanes][mps]))
+                      (lanes, raw_bw(ver, lanes),
+                       tlp_bw(ver, lanes, mps)))
@@ -0,0 +1,135 @@
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""Piecewise evaluation of the models
+
+The number of bytes the models transfer only changes shape where the
+number of TLPs changes, i.e. where ceil(size / mps), ceil(size / mrrs)
+or ceil(size / rcb) step. In between, all byte counts are linear in
+the size.  A Piecewise object stores the breakpoints of a model for a
+PCIe configuration and, for each segment, the byte counts as
+c0 + c1 * size. The bandwidth for any size is then computed in closed
+form from these without working out TLP counts.
+
+For a 1-1500 byte range with MPS=256, MRRS=512 this is a handful of
+segments and the cost of building it does not depend on the size of
+the range.
+"""
+
+# pylint: disable=invalid-name
+# pylint: disable=too-many-arguments
+
+import numpy as np
+
+from . import util
+from . import mem_bw
+from . import simple_nic
+from . import niantic
+
+def _mem_res(fn):
+    return lambda bwspec, _direction, *cols: fn(bwspec, *cols)
+
+# name -> (function to work out the bytes transferred for sizes, function
+# to work out the bandwidth from these). The names are the same as for
+# sweep.Models. The first column of the bytes is always the data bytes.
+Models = {
+    'mem_write'      : (mem_bw.write_bytes_many,
+                        _mem_res(mem_bw.write_res_many)),
+    'mem_read'       : (mem_bw.read_bytes_many,
+                        _mem_res(mem_bw.read_res_many)),
+    'mem_read_write' : (mem_bw.read_write_bytes_many,
+                        _mem_res(mem_bw.read_write_res_many)),
+    'simple_nic'     : (simple_nic.bytes_many, util.gen_res_many),
+    'niantic'        : (niantic.bytes_many, util.gen_res_many),
+    'niantic_pmd'    : (lambda pcicfg, sizes: niantic.bytes_many(
+        pcicfg, sizes, h_opt="PMD"), util.gen_res_many),
+    }
+
+def _stack(cols):
+    """Stack the byte counts returned by a bytes function (some of which
+    may be scalars) into a 2D array"""
+    return np.array(np.broadcast_arrays(*cols), dtype=np.float64)
+
+def breakpoints(pcicfg, min_size, max_size):
+    """Return the sorted array of sizes in [@min_size, @max_size] at
+    which a new linear segment starts for @pcicfg"""
+    steps = {pcicfg.mps, pcicfg.mrrs}
+    if pcicfg.rcb_chunks:
+        steps.add(pcicfg.rcb)
+    starts = [np.array([min_size])]
+    for step in steps:
+        # a new TLP is needed at k * step + 1
+        first = util.ceil_div(min_size, step) * step + 1
+        starts.append(np.arange(first, max_size + 1, step))
+    return np.unique(np.concatenate(starts))
+
+
+class Piecewise():
+    """Piecewise linear byte counts of a model for a PCIe configuration.
+
+    - lo, hi: Arrays with the first and last size of each segment
+    - c0, c1: Arrays of shape (#columns, #segments) with the byte counts
+              at size s being c0 + c1 * s
+    """
+
+    def __init__(self, pcicfg, model, min_size=1, max_size=1500, **kwargs):
+        """Work out the segments of @model (see Models) for @pcicfg
+        between @min_size and @max_size. @kwargs are passed to the
+        model's bytes function, e.g. irq_mod for niantic."""
+        if model not in Models:
+            raise Exception("Unknown model: %s" % model)
+        if min_size > max_size:
+            raise Exception("Empty size range")
+        self.pcicfg = pcicfg
+        self.model = model
+        bytes_fn, self._res_fn = Models[model]
+
+        self.lo = breakpoints(pcicfg, min_size, max_size)
+        self.hi = np.append(self.lo[1:] - 1, max_size)
+        # Sample each segment at its first two sizes to get the slope.
+        # Single size segments have a slope of 0.
+        nxt = np.minimum(self.lo + 1, self.hi)
+        at_lo = _stack(bytes_fn(pcicfg, self.lo, **kwargs))
+        at_nxt = _stack(bytes_fn(pcicfg, nxt, **kwargs))
+        self.c1 = np.where(nxt > self.lo, at_nxt - at_lo, 0.0)
+        self.c0 = at_lo - self.c1 * self.lo
+
+    def __len__(self):
+        return len(self.lo)
+
+    def segment(self, sizes):
+        """Return the index of the segment for each of @sizes"""
+        sizes = np.asarray(sizes)
+        if np.any((sizes < self.lo[0]) | (sizes > self.hi[-1])):
+            raise Exception("Sizes outside of range %d-%d" %
+                            (self.lo[0], self.hi[-1]))
+        return np.searchsorted(self.lo, sizes, side='right') - 1
+
+    def bytes(self, sizes):
+        """Return the byte counts for @sizes, as the model's bytes
+        function would"""
+        sizes = np.asarray(sizes)
+        seg = self.segment(sizes)
+        return tuple(self.c0[:, seg] + self.c1[:, seg] * sizes)
+
+    def evaluate(self, bwspec, direction, sizes):
+        """Return a util.BW_Res_dtype array with the results of the
+        model for @sizes. @direction is ignored by the memory models."""
+        return self._res_fn(bwspec, direction, *self.bytes(sizes))
+
+    def segments(self, bwspec, direction):
+        """Return the results at the start and end of each segment as
+        a tuple of two util.BW_Res_dtype arrays"""
+        return (self.evaluate(bwspec, direction, self.lo),
+                self.evaluate(bwspec, direction, self.hi))
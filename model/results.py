@@ -0,0 +1,180 @@
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""A columnar container for model results"""
+
+# pylint: disable=invalid-name
+# pylint: disable=too-many-arguments
+
+import numpy as np
+
+from . import pcie
+
+# The columns of a BW_Table and their types. The configuration is
+# stored as its pcie.Cfg.id and the model as an index into the
+# table's list of model names.
+Columns = [('size',      np.uint32),
+           ('cfg_id',    np.uint32),
+           ('model',     np.uint8),
+           ('direction', np.uint8),
+           ('rx_raw',    np.float64),
+           ('rx_eff',    np.float64),
+           ('tx_raw',    np.float64),
+           ('tx_eff',    np.float64)]
+Column_names = [name for name, _ in Columns]
+
+# The equivalent record (array of structs) type, e.g. for exporting
+Record_dtype = np.dtype(Columns)
+
+class BW_Table():
+    """
+    A table of bandwidth results stored as one NumPy array per column
+    (see Columns).  Results of the vectorised models are added in bulk
+    with append().
+
+    Indexing a table with a slice returns a new table sharing the
+    column arrays (no copy).  Indexing it with a boolean mask or an
+    index array returns a table with copies.  Indexing it with a column
+    name returns the column array.
+    """
+
+    def __init__(self, model_names=None, capacity=1024):
+        """Create an empty table
+        @param model_names: List of model names. Further names are
+                            added as they are appended.
+        @param capacity: Number of rows to allocate initially
+        """
+        self.model_names = list(model_names) if model_names else []
+        self._cols = {name: np.empty(capacity, dtype=typ)
+                      for name, typ in Columns}
+        self._len = 0
+
+    @classmethod
+    def _from_cols(cls, model_names, cols):
+        tbl = cls(model_names, capacity=0)
+        tbl._cols = cols
+        tbl._len = len(cols['size'])
+        return tbl
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._cols[key][:self._len]
+        cols = {name: col[:self._len][key] for name, col in self._cols.items()}
+        return BW_Table._from_cols(self.model_names, cols)
+
+    def _reserve(self, n):
+        """Make sure there is space for @n more rows"""
+        cap = len(self._cols['size'])
+        if self._len + n <= cap:
+            return
+        cap = max(2 * cap, self._len + n)
+        for name, col in self._cols.items():
+            new = np.empty(cap, dtype=col.dtype)
+            new[:self._len] = col[:self._len]
+            self._cols[name] = new
+
+    def model_id(self, model):
+        """Return the index of the model name @model"""
+        if model not in self.model_names:
+            self.model_names.append(model)
+        return self.model_names.index(model)
+
+    def append(self, pcicfg, model, direction, sizes, res):
+        """Append results in bulk
+        @param pcicfg: PCIe configuration the results are for
+        @param model: Name of the model
+        @param direction: Direction of the transfer
+        @param sizes: Array of sizes
+        @param res: util.BW_Res_dtype array with the results for @sizes
+        """
+        n = len(res)
+        self._reserve(n)
+        rows = slice(self._len, self._len + n)
+        self._cols['size'][rows] = sizes
+        self._cols['cfg_id'][rows] = pcicfg.id
+        self._cols['model'][rows] = self.model_id(model)
+        self._cols['direction'][rows] = direction
+        for name in res.dtype.names:
+            self._cols[name][rows] = res[name]
+        self._len += n
+
+    def extend(self, other):
+        """Append all rows of the BW_Table @other"""
+        n = len(other)
+        self._reserve(n)
+        rows = slice(self._len, self._len + n)
+        for name in Column_names:
+            self._cols[name][rows] = other[name]
+        # model ids may differ between tables
+        ids = np.array([self.model_id(m) for m in other.model_names] or [0],
+                       dtype=np.uint8)
+        self._cols['model'][rows] = ids[other['model']]
+        self._len += n
+
+    def filter(self, pcicfg=None, model=None, direction=None,
+               min_size=None, max_size=None):
+        """Return a table with the rows matching all the given criteria"""
+        mask = np.ones(self._len, dtype=bool)
+        if pcicfg is not None:
+            mask &= self['cfg_id'] == pcicfg.id
+        if model is not None:
+            if model not in self.model_names:
+                mask[:] = False
+            else:
+                mask &= self['model'] == self.model_names.index(model)
+        if direction is not None:
+            mask &= self['direction'] == direction
+        if min_size is not None:
+            mask &= self['size'] >= min_size
+        if max_size is not None:
+            mask &= self['size'] <= max_size
+        return self[mask]
+
+    def cfgs(self):
+        """Return the list of PCIe configurations in the table"""
+        return [pcie.cfg_from_id(int(i)) for i in np.unique(self['cfg_id'])]
+
+    def to_records(self):
+        """Return the table as a Record_dtype array"""
+        rec = np.empty(self._len, dtype=Record_dtype)
+        for name in Column_names:
+            rec[name] = self[name]
+        return rec
+
+    def save(self, fname):
+        """Save the table to a NumPy .npz file"""
+        np.savez(fname, model_names=np.array(self.model_names),
+                 **{name: self[name] for name in Column_names})
+
+    @classmethod
+    def load(cls, fname):
+        """Load a table saved with save()"""
+        with np.load(fname) as f:
+            cols = {name: f[name] for name in Column_names}
+            model_names = [str(m) for m in f['model_names']]
+        return cls._from_cols(model_names, cols)
+
+    def save_csv(self, fname):
+        """Save the table as a CSV file with the model names spelled out"""
+        names = np.array(self.model_names or [''])[self['model']]
+        with open(fname, "w") as f:
+            f.write(",".join(Column_names) + "\n")
+            for row in zip(self['size'].tolist(), self['cfg_id'].tolist(),
+                           names.tolist(), self['direction'].tolist(),
+                           self['rx_raw'].tolist(), self['rx_eff'].tolist(),
+                           self['tx_raw'].tolist(), self['tx_eff'].tolist()):
+                f.write("%d,%d,%s,%d,%.6f,%.6f,%.6f,%.6f\n" % row)
@@ -0,0 +1,515 @@
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""A discrete event, TLP level simulator of a PCIe link
+
+The analytic models assume steady state. This simulator replays DMA
+workloads TLP by TLP over a link described by a pcie.Cfg to show
+where queuing, credit stalls and latency make a difference.
+
+The link has a serializer per direction, transmitting at the raw
+bandwidth (pcie.Cfg.RAW_bw). Each serializer sends, in order of
+priority:
+- SKIP ordered sets, every SKIP_Interval symbol times (between packets)
+- DLLPs: ACKs and FC updates, for TLPs received on the other direction
+- TLPs: Completions and requests, round robin, if the receiver has
+  advertised enough flow control credits
+
+The receiver of TLPs sends an ACK DLLP every Ack_Limit bytes and an
+UpdateFC DLLP per TLP type (posted, non-posted, completion) every
+FC_Guide bytes of that type received (see pcie.ack_limit() and
+pcie.fc_guide()). Both are also sent when the receiver has not seen
+more TLPs for the time it takes to receive Ack_Limit bytes. As in the
+analytic models, the limits are interpreted as bytes. ACKs only
+consume bandwidth, the replay buffer is assumed to be large enough.
+
+Workloads are sequences of DMA operations for the device and
+optionally the host. An operation is a tuple (op, size) or (op, size,
+time): op is OP_WR (memory write) or OP_RD (memory read), size is a
+positive number of bytes and time, in ns, is the earliest time the operation can start.
+Without a time, operations are issued back to back. Writes are split
+into MPS sized MWr TLPs, reads into MRRS sized MRd TLPs (each using a
+tag) answered with RCB or MPS sized completions, as in mem_bw.
+
+Time is in ns throughout. Operations may be given as generators, the
+simulator only pulls them as they are issued.
+"""
+
+# pylint: disable=invalid-name
+# pylint: disable=too-many-arguments
+# pylint: disable=too-many-instance-attributes
+# pylint: disable=too-few-public-methods
+
+import heapq
+import numbers
+from collections import deque
+
+from . import pcie
+from . import util
+
+OP_WR = 0
+OP_RD = 1
+
+# TLP types for flow control
+FC_P = 0    # Posted (memory writes)
+FC_NP = 1   # Non-posted (memory reads)
+FC_CPL = 2  # Completions
+FC_Types = [FC_P, FC_NP, FC_CPL]
+
+# Kinds of packets on the wire, also used to account the link time
+PKT_TLP = 0
+PKT_ACK = 1
+PKT_FC = 2
+PKT_SKIP = 3
+Pkt_names = ['tlp', 'ack', 'fc', 'skip']
+
+# Size of a flow control data credit
+FC_Unit = 16
+
+def default_credits(pcicfg, intervals=4):
+    """Return the credits a receiver advertises for @pcicfg, as a list
+    indexed by FC_Types of [header credits, data credits], or None for
+    infinite credits.
+
+    Posted and non-posted pools hold @intervals FC update intervals
+    worth of bytes. Completion credits are infinite, as endpoints must
+    advertise them.
+    """
+    pool_B = intervals * pcie.fc_guide(pcicfg.version, pcicfg.lanes,
+                                       pcicfg.mps)
+    hdrs = util.ceil_div(pool_B, pcicfg.TLP_MRd_Hdr_Sz)
+    return [[hdrs, util.ceil_div(pool_B, FC_Unit)],
+            [hdrs, 0],
+            None]
+
+
+class Sim():
+    """The event queue. Events are (time, sequence number, function,
+    argument) tuples."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.events = []
+        self.seq = 0
+
+    def at(self, t, fn, arg=None):
+        """Call @fn(@arg) at time @t"""
+        self.seq += 1
+        heapq.heappush(self.events, (t, self.seq, fn, arg))
+
+    def run(self):
+        """Process events until there are none left"""
+        events = self.events
+        pop = heapq.heappop
+        while events:
+            t, _, fn, arg = pop(events)
+            self.now = t
+            fn(arg)
+
+
+class Port():
+    """The transmitter of one direction of the link and the receiver at
+    the other end of it"""
+
+    def __init__(self, sim, pcicfg, direction, credits, lat, timer_ns):
+        self.sim = sim
+        self.direction = direction
+        self.lat = lat
+        self.byte_ns = 8.0 / pcicfg.RAW_bw
+        lanes = pcie.Laness_mul[pcie.Laness_idx[pcicfg.lanes]]
+        self.skip_B = pcie.SKIP_Length * lanes
+        self.skip_ns = pcie.SKIP_Interval * lanes * self.byte_ns
+        self.skip_due = self.skip_ns
+        self.ack_limit = pcie.ack_limit(pcicfg.version, pcicfg.lanes,
+                                        pcicfg.mps)
+        self.fc_guide = pcie.fc_guide(pcicfg.version, pcicfg.lanes,
+                                      pcicfg.mps)
+        self.timer_ns = timer_ns
+        self.reverse = None     # Port for the other direction
+        self.initiator = None   # Initiator sending requests on this port
+        self.completer = None   # Initiator receiving requests on this port
+
+        self.busy = False
+        self.dllps = deque()
+        self.cpls = deque()
+        self.rr = False
+        # credits advertised by the receiver, available to the transmitter
+        self.credits = [None if c is None else list(c) for c in credits]
+        self.stalled = None
+
+        # receiver state: bytes not acked yet, credits to return
+        self.unacked = 0
+        self.fc_pending = [[0, 0, 0] for _ in FC_Types]
+        self.timer = None
+        self.last_rx = 0.0
+
+        # statistics
+        self.wire_B = [0] * len(Pkt_names)
+        self.data_B = 0
+        self.tlps = 0
+        self.stall_ns = 0.0
+
+    def kick(self, _arg=None):
+        """Start the next transmission, if the link is idle"""
+        if self.busy:
+            return
+        now = self.sim.now
+        if now >= self.skip_due:
+            # SKIPs due while the link was idle cost nothing
+            missed = int((now - self.skip_due) / self.skip_ns)
+            self.skip_due += (missed + 1) * self.skip_ns
+            self._send((PKT_SKIP, self.skip_B, 0, None, None))
+            return
+        if self.dllps:
+            self._send(self.dllps.popleft())
+            return
+
+        req = self.initiator.head() if self.initiator else None
+        cpl = self.cpls[0] if self.cpls else None
+        if cpl is not None and not self._has_credits(cpl):
+            cpl = None
+        if req is not None and not self._has_credits(req):
+            req = None
+            if self.stalled is None:
+                self.stalled = now
+        if req is not None and (cpl is None or self.rr):
+            self.initiator.take()
+            pkt = req
+            if self.stalled is not None:
+                self.stall_ns += now - self.stalled
+                self.stalled = None
+        elif cpl is not None:
+            self.cpls.popleft()
+            pkt = cpl
+        else:
+            return
+        self.rr = not self.rr
+        self._take_credits(pkt)
+        self.tlps += 1
+        self.data_B += pkt[2]
+        self._send(pkt)
+
+    def _has_credits(self, pkt):
+        cred = self.credits[pkt[3]]
+        if cred is None:
+            return True
+        return cred[0] >= 1 and cred[1] >= util.ceil_div(pkt[2], FC_Unit)
+
+    def _take_credits(self, pkt):
+        cred = self.credits[pkt[3]]
+        if cred is not None:
+            cred[0] -= 1
+            cred[1] -= util.ceil_div(pkt[2], FC_Unit)
+
+    def _send(self, pkt):
+        self.busy = True
+        self.wire_B[pkt[0]] += pkt[1]
+        end = self.sim.now + pkt[1] * self.byte_ns
+        self.sim.at(end, self._done)
+        if pkt[0] != PKT_SKIP:
+            self.sim.at(end + self.lat, self._arrive, pkt)
+
+    def _done(self, _arg):
+        self.busy = False
+        self.kick()
+
+    def _arrive(self, pkt):
+        """A packet arrives at the receiver"""
+        kind = pkt[0]
+        if kind == PKT_ACK:
+            return
+        if kind == PKT_FC:
+            # returned credits for the reverse direction
+            _, _, _, typ, (hdrs, data) = pkt
+            cred = self.reverse.credits[typ]
+            cred[0] += hdrs
+            cred[1] += data
+            self.reverse.kick()
+            return
+
+        _, wire, payload, typ, info = pkt
+        rev = self.reverse
+        self.unacked += wire
+        if self.unacked >= self.ack_limit:
+            self._ack()
+        if self.credits[typ] is not None:
+            pend = self.fc_pending[typ]
+            pend[0] += 1
+            pend[1] += util.ceil_div(payload, FC_Unit)
+            pend[2] += wire
+            if pend[2] >= self.fc_guide:
+                self._update_fc(typ)
+        self.last_rx = self.sim.now
+        if self.timer is None:
+            self.timer = self.sim.now + self.timer_ns
+            self.sim.at(self.timer, self._flush)
+        rev.kick()
+
+        if typ == FC_P:
+            info[0].write_done(info, payload)
+        elif typ == FC_NP:
+            self.completer.complete(info)
+        else:
+            info[0].read_done(info, payload)
+
+    def _ack(self):
+        self.reverse.dllps.append((PKT_ACK, pcie.Ack_Size, 0, None, None))
+        self.unacked = 0
+
+    def _update_fc(self, typ):
+        pend = self.fc_pending[typ]
+        self.reverse.dllps.append((PKT_FC, pcie.FC_Size, 0, typ,
+                                   (pend[0], pend[1])))
+        pend[:] = [0, 0, 0]
+
+    def _flush(self, _arg):
+        """Send outstanding ACKs and FC updates if no TLPs arrived"""
+        due = self.last_rx + self.timer_ns
+        if due > self.sim.now:
+            self.timer = due
+            self.sim.at(due, self._flush)
+            return
+        self.timer = None
+        if self.unacked:
+            self._ack()
+        for typ in FC_Types:
+            if self.fc_pending[typ][2]:
+                self._update_fc(typ)
+        self.reverse.kick()
+
+
+class Initiator():
+    """Issues the DMA operations of one side of the link as TLPs on
+    @port and completes read requests received from the other side"""
+
+    def __init__(self, sim, pcicfg, port, ops, tags, cpl_lat):
+        self.sim = sim
+        self.cfg = pcicfg
+        self.port = port
+        self.ops = iter(ops)
+        self.tags = tags
+        self.cpl_lat = cpl_lat
+        self.chunk = pcicfg.rcb if pcicfg.rcb_chunks else pcicfg.mps
+        self.cur = None     # [op, bytes left to issue, record]
+        self.next = None    # next TLP to send
+        self.waiting = False
+
+        # statistics
+        self.ops_started = 0
+        self.ops_done = 0
+        self.lat_sum = 0.0
+        self.lat_max = 0.0
+        self.last = 0.0
+
+    def head(self):
+        """Return the next TLP to send (without taking it) or None"""
+        if self.next is not None:
+            return self.next
+        if self.waiting:
+            return None
+        cur = self.cur
+        if cur is None or cur[1] == 0:
+            cur = self._next_op()
+            if cur is None:
+                return None
+        rec = cur[2]
+        if cur[0] == OP_WR:
+            n = min(self.cfg.mps, cur[1])
+            self.next = (PKT_TLP, self.cfg.TLP_MWr_Hdr_Sz + n, n, FC_P,
+                         (self, rec))
+        else:
+            if self.tags == 0:
+                return None
+            n = min(self.cfg.mrrs, cur[1])
+            self.next = (PKT_TLP, self.cfg.TLP_MRd_Hdr_Sz, 0, FC_NP,
+                         [self, rec, n])
+        return self.next
+
+    def take(self):
+        """The TLP returned by head() is being sent"""
+        pkt = self.next
+        self.next = None
+        if pkt[3] == FC_P:
+            self.cur[1] -= pkt[2]
+        else:
+            self.cur[1] -= pkt[4][2]
+            self.tags -= 1
+
+    def _next_op(self):
+        op = next(self.ops, None)
+        if op is None:
+            return None
+        now = self.sim.now
+        start = op[2] if len(op) > 2 else now
+        if op[0] not in (OP_WR, OP_RD):
+            raise Exception("Unknown operation: %r" % (op,))
+        if (not isinstance(op[1], numbers.Integral) or
+                isinstance(op[1], bool) or op[1] <= 0):
+            raise Exception("Bad size for operation: %r" % (op,))
+        # record: [start time, bytes to arrive]
+        self.cur = [op[0], op[1], [start, op[1]]]
+        self.ops_started += 1
+        if start > now:
+            self.waiting = True
+            self.sim.at(start, self._wake)
+            return None
+        return self.cur
+
+    def _wake(self, _arg):
+        self.waiting = False
+        self.port.kick()
+
+    def _op_done(self, rec):
+        lat = self.sim.now - rec[0]
+        self.ops_done += 1
+        self.lat_sum += lat
+        self.lat_max = max(self.lat_max, lat)
+        self.last = self.sim.now
+
+    def write_done(self, info, payload):
+        """A MWr TLP arrived at the other side"""
+        rec = info[1]
+        rec[1] -= payload
+        if rec[1] == 0:
+            self._op_done(rec)
+
+    def read_done(self, info, payload):
+        """A completion for a MRd arrived"""
+        rec = info[1]
+        rec[1] -= payload
+        info[2] -= payload
+        if info[2] == 0:
+            self.tags += 1
+            self.port.kick()
+        if rec[1] == 0:
+            self._op_done(rec)
+
+    def complete(self, info):
+        """Answer a MRd @info from the other side after the completion
+        latency"""
+        self.sim.at(self.sim.now + self.cpl_lat, self._complete, info)
+
+    def _complete(self, info):
+        hdr = self.cfg.TLP_CplD_Hdr_Sz
+        left = info[2]
+        cpls = self.port.cpls
+        while left:
+            n = min(self.chunk, left)
+            cpls.append((PKT_TLP, hdr + n, n, FC_CPL, info))
+            left -= n
+        self.port.kick()
+
+
+class Sim_Res():
+    """Results of a simulation run.
+
+    - duration: Time from 0 to the completion of the last operation (ns)
+    - ops: Number of operations completed
+    - mean_lat, max_lat: Latency of the operations, from the time they
+                         could start until the last byte arrived (ns)
+    - bw: pcie.BW_Res with the raw (TLP) and effective (payload)
+          bandwidth in Gb/s in each direction
+    - wire: For DIR_RX and DIR_TX, dictionaries of the bytes
+            transmitted by kind of packet (see Pkt_names)
+    - tlps: For DIR_RX and DIR_TX the number of TLPs sent
+    - stall: For DIR_RX and DIR_TX the time (ns) requests waited for
+             credits
+    - util: For DIR_RX and DIR_TX the fraction of time the link was busy
+    - events: Number of events processed
+
+    Another glorified struct
+    """
+
+    def __init__(self, sim, ports, inits):
+        ops = sum(i.ops_done for i in inits)
+        self.duration = max(i.last for i in inits)
+        self.ops = ops
+        self.mean_lat = sum(i.lat_sum for i in inits) / ops if ops else 0.0
+        self.max_lat = max(i.lat_max for i in inits)
+        self.events = sim.seq
+        self.wire = {}
+        self.tlps = {}
+        self.stall = {}
+        self.util = {}
+        dur = self.duration or 1.0
+        bw = {}
+        for d, port in ports.items():
+            self.wire[d] = dict(zip(Pkt_names, port.wire_B))
+            self.tlps[d] = port.tlps
+            self.stall[d] = port.stall_ns
+            self.util[d] = min(1.0, sum(port.wire_B) * port.byte_ns / dur)
+            # bytes per ns = Gb/s / 8
+            bw[d] = (port.wire_B[PKT_TLP] * 8.0 / dur, port.data_B * 8.0 / dur)
+        self.bw = pcie.BW_Res(bw[pcie.DIR_RX][0], bw[pcie.DIR_RX][1],
+                              bw[pcie.DIR_TX][0], bw[pcie.DIR_TX][1])
+
+
+def run(pcicfg, dev_ops, host_ops=(), lat=0.0, cpl_lat=0.0, tags=256,
+        credits=None, timer_ns=None):
+    """Simulate the DMA operations of a device (and the host)
+
+    @param pcicfg: PCIe configuration
+    @param dev_ops: Operations issued by the device (see module doc)
+    @param host_ops: Operations issued by the host, e.g. doorbells
+    @param lat: One way latency of the link in ns
+    @param cpl_lat: Time in ns the completer takes to answer a read
+    @param tags: Maximum number of outstanding reads per requester
+    @param credits: Credits advertised by receivers (see default_credits())
+    @param timer_ns: Time after which ACKs and FC updates are sent if no
+                     more TLPs arrive. Defaults to the time it takes to
+                     receive Ack_Limit bytes.
+    @returns a Sim_Res object. Raises an exception if the operations
+             can not all complete, e.g. because the credits are too
+             few for a TLP.
+    """
+    if credits is None:
+        credits = default_credits(pcicfg)
+    if timer_ns is None:
+        timer_ns = (pcie.ack_limit(pcicfg.version, pcicfg.lanes, pcicfg.mps) *
+                    8.0 / pcicfg.RAW_bw)
+    sim = Sim()
+    # The device transmits on DIR_TX and receives on DIR_RX
+    up = Port(sim, pcicfg, pcie.DIR_TX, credits, lat, timer_ns)
+    down = Port(sim, pcicfg, pcie.DIR_RX, credits, lat, timer_ns)
+    up.reverse, down.reverse = down, up
+    dev = Initiator(sim, pcicfg, up, dev_ops, tags, cpl_lat)
+    host = Initiator(sim, pcicfg, down, host_ops, tags, cpl_lat)
+    up.initiator, up.completer = dev, host
+    down.initiator, down.completer = host, dev
+    sim.at(0.0, up.kick)
+    sim.at(0.0, down.kick)
+    sim.run()
+    # With no events left, anything not done can never be done
+    pending = [i.ops_started - i.ops_done for i in (dev, host)]
+    queued = [(up.initiator.next is not None) + len(up.cpls),
+              (down.initiator.next is not None) + len(down.cpls)]
+    if any(pending) or any(queued):
+        raise Exception("Simulation deadlocked at %.1f ns: %d device and %d "
+                        "host operations incomplete, %d TLPs stuck upstream "
+                        "and %d downstream (too few credits for a TLP?)" %
+                        (sim.now, pending[0], pending[1], queued[0],
+                         queued[1]))
+    return Sim_Res(sim, {pcie.DIR_RX: down, pcie.DIR_TX: up}, [dev, host])
+
+
+def ops(op, size, n, rate=None):
+    """Generate @n operations @op of @size bytes. With @rate (operations
+    per second) they start at fixed intervals, otherwise back to back."""
+    if rate is None:
+        for _ in range(n):
+            yield (op, size)
+    else:
+        gap = 1e9 / rate
+        for i in range(n):
+            yield (op, size, i * gap)
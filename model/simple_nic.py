@@ -15,14 +15,17 @@
 
 """A simple NIC model"""
 
-import math
 from . import pcie
 from . import util
+from . import device
+from .memo import memoize
+from .instr import instrument
 
 # pylint: disable=invalid-name
-# pylint: disable=bad-whitespace
 
-def bw(pcicfg, bwspec, direction, pkt_size):
+@instrument
+@memoize
+def bw(pcicfg, bwspec, direction, pkt_size, detail=False):
     """
     This code estimates the PCIe bandwidth requirements for a very simple NIC.
 
@@ -30,7 +33,9 @@ def bw(pcicfg, bwspec, direction, pkt_size):
     @param bwspec    Bandwidth specification
     @param pkt_size  Size of the Ethernet frame (subtract 4 to calculate
                      with FCS stripping)
-    @returns A BW_Res object
+    @param detail    Also return the bytes and TLPs of each step
+    @returns A BW_Res object or, with @detail, a tuple (BW_Res,
+             device.Ledger)
 
     We assume that descriptors are 128bit in size and a single RX and TX ring.
 
@@ -49,69 +54,45 @@ def bw(pcicfg, bwspec, direction, pkt_size):
     5. Device generates interrupt                        (PCIe write: tx)
     6. Host reads RX queue head pointer                  (PCIe read:  rx/tx)
 
-    We assume these steps are performed for every packet.
+    We assume these steps are performed for every packet. The steps
+    are described by device.SIMPLE_NIC, which works out the bytes.
+    Only the completion of the RX descriptor read in step 2 is counted,
+    not its read request (see device.py).
     """
-    tx_desc_sz    = 16
-    rx_desc_sz    = 16
-    rx_desc_wb_sz = 16
-
-    ptr_sz        = 4
-
     if not direction & pcie.DIR_BOTH:
         raise Exception("Unknown Direction %d" % direction)
+    res = util.gen_res(bwspec, direction,
+                       *device.SIMPLE_NIC.bytes(pcicfg, pkt_size))
+    if detail:
+        return res, device.SIMPLE_NIC.ledger(pcicfg, direction, pkt_size)
+    return res
 
-    data_B = pkt_size
+def bytes_many(pcicfg, pkt_sizes):
+    """
+    Work out the bytes transferred per packet for an array of packet
+    sizes.  See bw() for the steps involved.
 
-    # Packet TX
-    tx_rx_data_B = 0 # bytes for TX received by the device
-    tx_tx_data_B = 0 # bytes for TX transmitted by the device
-    # H: tail pointer write
-    tx_rx_data_B += ptr_sz + pcicfg.TLP_MWr_Hdr_Sz
-    # D: read descriptor
-    _rd_sz = tx_desc_sz
-    tlps = int(math.ceil(float(_rd_sz) / float(pcicfg.mrrs)))
-    tx_tx_data_B += tlps * pcicfg.TLP_MRd_Hdr_Sz
-    if pcicfg.rcb_chunks:
-        tlps = int(math.ceil(float(_rd_sz) / float(pcicfg.rcb)))
-    else:
-        tlps = int(math.ceil(float(_rd_sz) / float(pcicfg.mps)))
-    tx_rx_data_B += (tlps * pcicfg.TLP_CplD_Hdr_Sz) + _rd_sz
-    # D: data DMA reads
-    tlps = int(math.ceil(float(data_B) / float(pcicfg.mrrs)))
-    tx_tx_data_B += tlps * pcicfg.TLP_MRd_Hdr_Sz
-    if pcicfg.rcb_chunks:
-        tlps = int(math.ceil(float(data_B) / float(pcicfg.rcb)))
-    else:
-        tlps = int(math.ceil(float(data_B) / float(pcicfg.mps)))
-    tx_rx_data_B += (tlps * pcicfg.TLP_CplD_Hdr_Sz) + data_B
-    # D: send IRQ
-    tx_tx_data_B += pcie.MSI_SIZE + pcicfg.TLP_MWr_Hdr_Sz
-    # H: read head pointer
-    tx_rx_data_B += pcicfg.TLP_MRd_Hdr_Sz
-    tx_tx_data_B += ptr_sz + pcicfg.TLP_CplD_Hdr_Sz
-    # done
+    @param pcicfg    PCIe configuration
+    @param pkt_sizes Array of Ethernet frame sizes
+    @returns A tuple of arrays (data_B, tx_rx_data_B, tx_tx_data_B,
+             rx_rx_data_B, rx_tx_data_B) as passed to util.gen_res_many()
+    """
+    return device.SIMPLE_NIC.bytes_many(pcicfg, pkt_sizes)
 
-    # Packet RX
-    rx_rx_data_B = 0 # bytes for RX received by the device
-    rx_tx_data_B = 0 # bytes for RX transmitted by the device
-    # H: tail pointer write
-    rx_rx_data_B += ptr_sz + pcicfg.TLP_MWr_Hdr_Sz
-    # D: read descriptors
-    rx_tx_data_B += pcicfg.TLP_MRd_Hdr_Sz
-    rx_rx_data_B += rx_desc_sz + pcicfg.TLP_CplD_Hdr_Sz
-    # D: DMA write
-    tlps = int(math.ceil(float(data_B) / float(pcicfg.mps)))
-    rx_tx_data_B = (tlps * pcicfg.TLP_MWr_Hdr_Sz) + data_B
-    # D: Write back descriptors
-    rx_tx_data_B += rx_desc_wb_sz + pcicfg.TLP_MWr_Hdr_Sz
-    # D: send IRQ (Depending on setting)
-    rx_tx_data_B += pcie.MSI_SIZE + pcicfg.TLP_MWr_Hdr_Sz
-    # H: read head pointer
-    rx_rx_data_B += pcicfg.TLP_MRd_Hdr_Sz
-    rx_tx_data_B += ptr_sz + pcicfg.TLP_CplD_Hdr_Sz
-    # done
+@instrument
+def bw_many(pcicfg, bwspec, direction, pkt_sizes, detail=False):
+    """
+    Same as bw() but for an array of packet sizes.
 
-    # we now know how many bytes are transfered in each direction for
-    # both RX and TX. Lets work out how much we can transfer etc.
-    return util.gen_res(bwspec, direction, data_B,
-                        tx_rx_data_B, tx_tx_data_B, rx_rx_data_B, rx_tx_data_B)
+    @param pcicfg    PCIe configuration
+    @param bwspec    Bandwidth specification
+    @param direction Direction(s) of the transfer
+    @param pkt_sizes Array of Ethernet frame sizes
+    @param detail    Also return the bytes and TLPs of each step
+    @returns A util.BW_Res_dtype array or, with @detail, a tuple of it
+             and a device.Ledger with one column per size
+    """
+    res = util.gen_res_many(bwspec, direction, *bytes_many(pcicfg, pkt_sizes))
+    if detail:
+        return res, device.SIMPLE_NIC.ledger(pcicfg, direction, pkt_sizes)
+    return res
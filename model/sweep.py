@@ -0,0 +1,304 @@
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""Sweep models across the PCIe configuration space
+
+A sweep is split into shards of configurations which are evaluated by
+a pool of worker processes. run_to_file() can checkpoint the sweep:
+each completed shard is saved to a checkpoint directory and a sweep
+which was interrupted is resumed by running it again with the same
+parameters, evaluating only the shards which are missing. A manifest
+in the directory records the parameters so that checkpoints of a
+different sweep are not mixed in.
+
+If instrumentation is enabled (see instr.py) the workers count the
+calls they make and the counters are added to those of the sweeping
+process as shards complete. Hooks are not called for these calls.
+"""
+
+# pylint: disable=invalid-name
+# pylint: disable=too-many-arguments
+# pylint: disable=too-many-locals
+
+import itertools
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from . import pcie
+from . import mem_bw
+from . import simple_nic
+from . import niantic
+from . import results
+from . import instr
+
+def _mem_write(pcicfg, bwspec, _direction, sizes):
+    return mem_bw.write_many(pcicfg, bwspec, sizes)
+
+def _mem_read(pcicfg, bwspec, _direction, sizes):
+    return mem_bw.read_many(pcicfg, bwspec, sizes)
+
+def _mem_read_write(pcicfg, bwspec, _direction, sizes):
+    return mem_bw.read_write_many(pcicfg, bwspec, sizes)
+
+def _simple_nic(pcicfg, bwspec, direction, sizes):
+    return simple_nic.bw_many(pcicfg, bwspec, direction, sizes)
+
+def _niantic(pcicfg, bwspec, direction, sizes):
+    return niantic.bw_many(pcicfg, bwspec, direction, sizes)
+
+def _niantic_pmd(pcicfg, bwspec, direction, sizes):
+    return niantic.bw_many(pcicfg, bwspec, direction, sizes, h_opt="PMD")
+
+_NIC_DIRS = [pcie.DIR_RX, pcie.DIR_TX, pcie.DIR_BOTH]
+
+# The models which can be swept: name -> (function, directions). The
+# functions take (pcicfg, bwspec, direction, sizes) and return a
+# util.BW_Res_dtype array. The memory models only have one direction.
+Models = {
+    'mem_write'      : (_mem_write,         [pcie.DIR_TX]),
+    'mem_read'       : (_mem_read,          [pcie.DIR_RX]),
+    'mem_read_write' : (_mem_read_write,    [pcie.DIR_BOTH]),
+    'simple_nic'     : (_simple_nic,        _NIC_DIRS),
+    'niantic'        : (_niantic,           _NIC_DIRS),
+    'niantic_pmd'    : (_niantic_pmd,       _NIC_DIRS),
+    }
+Model_names = list(Models.keys())
+
+def _or_all(vals, default):
+    return default if vals is None else vals
+
+def space(versions=None, lanes=None, addrs=None, ecrcs=None,
+          mpss=None, mrrss=None, rcbs=None, rcb_chunks=None):
+    """Enumerate the cartesian product of PCIe configuration parameters.
+
+    Each argument is a list of values to consider. If omitted all legal
+    values are used.
+
+    @returns A list of tuples which can be passed to pcie.Cfg()
+    """
+    return list(itertools.product(
+        _or_all(versions, pcie.Vers),
+        _or_all(lanes, pcie.Laness),
+        _or_all(addrs, [32, 64]),
+        _or_all(ecrcs, [0, 1]),
+        _or_all(mpss, pcie.MPSs),
+        _or_all(mrrss, pcie.MRRSs),
+        _or_all(rcbs, pcie.RCBs),
+        _or_all(rcb_chunks, [False, True])))
+
+def num_points(cfgs, models, sizes):
+    """Number of records a sweep of @cfgs, @models and @sizes produces"""
+    n_dirs = sum(len(Models[m][1]) for m in models)
+    return len(cfgs) * n_dirs * len(sizes)
+
+def eval_cfgs(cfgs, models, sizes):
+    """Evaluate @models for all configurations in @cfgs (a list of
+    pcie.Cfg argument tuples) and @sizes.
+
+    The PCIe bandwidth is taken to be the TLP bandwidth of the
+    configuration in both directions.
+
+    @returns A results.BW_Table
+    """
+    sizes = np.asarray(sizes, dtype=np.int64)
+    tbl = results.BW_Table(Model_names,
+                           capacity=num_points(cfgs, models, sizes))
+    for args in cfgs:
+        cfg = pcie.Cfg(*args)
+        bwspec = pcie.BW_Spec(cfg.TLP_bw, cfg.TLP_bw, pcie.BW_Spec.BW_RAW)
+        for model in models:
+            fn, dirs = Models[model]
+            for direction in dirs:
+                tbl.append(cfg, model, direction, sizes,
+                           fn(cfg, bwspec, direction, sizes))
+    return tbl
+
+def _eval_shard(shard):
+    """Pool worker: evaluate one shard, also returning the
+    instrumentation counters if enabled"""
+    res = eval_cfgs(*shard)
+    return res, instr.take() if instr.enabled() else None
+
+def _eval_numbered(item):
+    """Pool worker: evaluate one numbered shard"""
+    i, shard = item
+    res, counts = _eval_shard(shard)
+    return i, res.to_records(), counts
+
+def _pool(processes):
+    """A pool of workers, instrumented if the caller is"""
+    return multiprocessing.Pool(processes, instr.worker_init,
+                                (instr.enabled(),))
+
+def shards(cfgs, models, sizes, shard_size):
+    """Split the sweep into shards of @shard_size configurations"""
+    for i in range(0, len(cfgs), shard_size):
+        yield (cfgs[i:i + shard_size], models, sizes)
+
+def run(cfgs, models, sizes, processes=None, shard_size=64):
+    """Sweep @models over the configurations @cfgs and @sizes.
+
+    The sweep is split into shards of @shard_size configurations which
+    are evaluated by a pool of @processes worker processes (defaults
+    to the number of CPUs).  Results are yielded as results.BW_Table
+    objects, one per shard, in order.
+    """
+    for m in models:
+        if m not in Models:
+            raise Exception("Unknown model: %s" % m)
+
+    with _pool(processes) as pool:
+        for res, counts in pool.imap(_eval_shard,
+                                     shards(cfgs, models, sizes, shard_size)):
+            if counts:
+                instr.merge(counts)
+            yield res
+
+class _Progress():
+    """Report the progress of a sweep to a @progress function"""
+    def __init__(self, progress, total, done=0):
+        self.progress = progress
+        self.total = total
+        self.done = done
+        self.new = 0
+        self.start = time.time()
+
+    def add(self, n):
+        """@n more points have been computed"""
+        self.done += n
+        self.new += n
+        if self.progress:
+            elapsed = time.time() - self.start
+            rate = self.new / elapsed if elapsed > 0 else 0.0
+            self.progress(self.done, self.total, rate)
+
+def _shard_file(ckpt_dir, i):
+    return os.path.join(ckpt_dir, "shard-%06d.npy" % i)
+
+def _manifest(ckpt_dir, cfgs, models, sizes, shard_size):
+    """Create the manifest of a checkpointed sweep in @ckpt_dir or
+    check that an existing one matches the sweep. An existing directory
+    without a manifest must be empty."""
+    manifest = json.loads(json.dumps({
+        'cfgs': cfgs,
+        'models': models,
+        'sizes': np.asarray(sizes).tolist(),
+        'shard_size': shard_size}))
+    path = os.path.join(ckpt_dir, "manifest.json")
+    if os.path.exists(path):
+        with open(path) as f:
+            if json.load(f) != manifest:
+                raise Exception("%s holds checkpoints of a different sweep" %
+                                ckpt_dir)
+        return
+    if os.path.isdir(ckpt_dir) and os.listdir(ckpt_dir):
+        raise Exception("%s is not empty and holds no checkpoints" %
+                        ckpt_dir)
+    os.makedirs(ckpt_dir, exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+def _remove_checkpoints(ckpt_dir, files):
+    """Remove the shard @files and the manifest from @ckpt_dir, and the
+    directory if nothing else is left in it"""
+    for fname in files + [os.path.join(ckpt_dir, "manifest.json")]:
+        for path in (fname, fname + ".tmp"):
+            if os.path.exists(path):
+                os.remove(path)
+    if not os.listdir(ckpt_dir):
+        os.rmdir(ckpt_dir)
+
+def run_checkpointed(ckpt_dir, cfgs, models, sizes, processes=None,
+                     shard_size=64, progress=None):
+    """Sweep @models over @cfgs and @sizes, saving each shard to the
+    directory @ckpt_dir as it completes. Shards already saved by an
+    earlier, interrupted run of the same sweep are skipped.
+
+    @param progress  Optional function called with (points done, total
+                     points, points per second) after each shard. The
+                     rate only counts the points computed by this run.
+    @returns The list of shard files, in order
+    """
+    for m in models:
+        if m not in Models:
+            raise Exception("Unknown model: %s" % m)
+    _manifest(ckpt_dir, cfgs, models, sizes, shard_size)
+
+    todo = []
+    done = 0
+    files = []
+    for i, shard in enumerate(shards(cfgs, models, sizes, shard_size)):
+        files.append(_shard_file(ckpt_dir, i))
+        if os.path.exists(files[-1]):
+            done += num_points(shard[0], models, sizes)
+        else:
+            todo.append((i, shard))
+
+    prog = _Progress(progress, num_points(cfgs, models, sizes), done)
+    if todo:
+        with _pool(processes) as pool:
+            for i, recs, counts in pool.imap_unordered(_eval_numbered, todo):
+                if counts:
+                    instr.merge(counts)
+                # write then rename so a shard file is always complete
+                tmp = files[i] + ".tmp"
+                with open(tmp, "wb") as f:
+                    np.save(f, recs)
+                os.replace(tmp, files[i])
+                prog.add(len(recs))
+    return files
+
+def run_to_file(fname, cfgs, models, sizes, processes=None, shard_size=64,
+                ckpt_dir=None, progress=None):
+    """Sweep @models over @cfgs and @sizes and stream the results to
+    the file @fname as they become available.
+
+    The file is a NumPy .npy file containing a results.Record_dtype
+    array. It can be loaded with numpy.load(fname, mmap_mode='r'). The
+    model field is an index into Model_names.
+
+    If @ckpt_dir is given, the sweep is checkpointed there (see
+    run_checkpointed()) and @fname is only written once all shards are
+    complete, after which the checkpoints (and the directory, if empty)
+    are removed. @progress is as
+    for run_checkpointed().
+
+    @returns The number of records written
+    """
+    total = num_points(cfgs, models, sizes)
+    header = {'descr': np.lib.format.dtype_to_descr(results.Record_dtype),
+              'fortran_order': False,
+              'shape': (total,)}
+    if ckpt_dir:
+        files = run_checkpointed(ckpt_dir, cfgs, models, sizes, processes,
+                                 shard_size, progress)
+        with open(fname, "wb") as f:
+            np.lib.format.write_array_header_2_0(f, header)
+            for shard_file in files:
+                f.write(np.load(shard_file, mmap_mode='r').tobytes())
+        _remove_checkpoints(ckpt_dir, files)
+        return total
+
+    prog = _Progress(progress, total)
+    with open(fname, "wb") as f:
+        np.lib.format.write_array_header_2_0(f, header)
+        for res in run(cfgs, models, sizes, processes, shard_size):
+            f.write(res.to_records().tobytes())
+            prog.add(len(res))
+    return total
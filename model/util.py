@@ -15,12 +15,57 @@
 
 """Utility functions"""
 
+import numpy as np
 from . import pcie
+from .instr import instrument
 
 # pylint: disable=invalid-name
 # pylint: disable=too-many-arguments
 # pylint: disable=too-many-locals
 
+# Result of the vectorised (*_many) model functions: One entry per
+# evaluated point with the same fields as a pcie.BW_Res object.
+BW_Res_dtype = np.dtype([('rx_raw', np.float64),
+                         ('rx_eff', np.float64),
+                         ('tx_raw', np.float64),
+                         ('tx_eff', np.float64)])
+
+def ceil_div(x, y):
+    """Integer division of @x by @y rounding up. Works on scalars as
+    well as on NumPy integer arrays.
+    """
+    return -(-x // y)
+
+def raw_bound_many(bwspec, raw_rx_B, raw_tx_B):
+    """Vectorised RX-limited vs TX-limited solve for a BW_RAW @bwspec.
+
+    @raw_rx_B and @raw_tx_B are arrays with the number of raw bytes
+    received and transmitted by the device per transaction (or batch).
+    Assume the RX direction is maxed out and fall back to a maxed out TX
+    direction for the points where the TX bandwidth would be exceeded.
+
+    Returns a tuple of arrays (req_raw_rx_bw, req_raw_tx_bw) in Gb/s.
+    """
+    raw_rx_B, raw_tx_B = np.broadcast_arrays(raw_rx_B, raw_tx_B)
+    raw_tx_b = raw_tx_B * 8
+    raw_rx_b = raw_rx_B * 8
+    avail_raw_tx_bw_b = bwspec.tx_bw * (10**9)
+    avail_raw_rx_bw_b = bwspec.rx_bw * (10**9)
+    # work out how many transactions the RX can cope with
+    max_trans = avail_raw_rx_bw_b / raw_rx_b.astype(np.float64)
+    # assume we can support the RX data rate with TX for requests
+    req_raw_tx_bw_b = max_trans * raw_tx_b
+    req_raw_rx_bw_b = np.full(req_raw_tx_bw_b.shape, float(avail_raw_rx_bw_b))
+
+    # where we'd run out of TX bandwidth assume TX is maxed out and
+    # work out the new rx bandwidth from the number of requests
+    tx_bound = req_raw_tx_bw_b > avail_raw_tx_bw_b
+    max_trans = avail_raw_tx_bw_b / raw_tx_b[tx_bound].astype(np.float64)
+    req_raw_tx_bw_b[tx_bound] = avail_raw_tx_bw_b
+    req_raw_rx_bw_b[tx_bound] = max_trans * raw_rx_b[tx_bound]
+
+    return req_raw_rx_bw_b / float(10**9), req_raw_tx_bw_b / float(10**9)
+
 def low_com_mul(x, y):
     """Find the lowest common multiplier of two numbers
     """
@@ -50,6 +95,7 @@ def low_com_mul(x, y):
     lcm = find_lcm(x, y, gcf)
     return lcm
 
+@instrument
 def gen_res(bwspec, direction, data_sz,
             tx_rx_data_B, tx_tx_data_B, rx_rx_data_B, rx_tx_data_B):
     """Work out the result based on the available bandwidth (@bwspec),
@@ -135,3 +181,57 @@ def gen_res(bwspec, direction, data_sz,
             req_raw_rx_bw = eff_rx_bw * raw_rx_B / float(data_sz)
 
     return pcie.BW_Res(req_raw_rx_bw, eff_rx_bw, req_raw_tx_bw, eff_tx_bw)
+
+@instrument
+def gen_res_many(bwspec, direction, data_sz,
+                 tx_rx_data_B, tx_tx_data_B, rx_rx_data_B, rx_tx_data_B):
+    """Vectorised version of gen_res().
+
+    @data_sz and the four byte counts are arrays (or scalars which
+    broadcast) with one entry per point. @direction may be a single
+    direction or an array of directions, one per point.
+
+    Returns a BW_Res_dtype array with one entry per point.
+    """
+    direction = np.asarray(direction)
+    if np.any((direction & pcie.DIR_BOTH) == 0):
+        raise Exception("Unknown Direction %s" % direction)
+    dir_tx = (direction & pcie.DIR_TX) != 0
+    dir_rx = (direction & pcie.DIR_RX) != 0
+
+    data_sz, tx_rx_data_B, tx_tx_data_B, rx_rx_data_B, rx_tx_data_B, \
+        dir_tx, dir_rx = np.broadcast_arrays(data_sz,
+                                             tx_rx_data_B, tx_tx_data_B,
+                                             rx_rx_data_B, rx_tx_data_B,
+                                             dir_tx, dir_rx)
+
+    # Work out overall bytes in each direction per batch. DIR_TX is
+    # from the device, so we look at rx_??_data_B and vice versa
+    raw_rx_B = np.where(dir_tx, rx_rx_data_B, 0) + \
+               np.where(dir_rx, tx_rx_data_B, 0)
+    raw_tx_B = np.where(dir_tx, rx_tx_data_B, 0) + \
+               np.where(dir_rx, tx_tx_data_B, 0)
+
+    res = np.zeros(data_sz.shape, dtype=BW_Res_dtype)
+    if bwspec.type == pcie.BW_Spec.BW_RAW:
+        req_raw_rx_bw, req_raw_tx_bw = raw_bound_many(bwspec,
+                                                      raw_rx_B, raw_tx_B)
+        res['rx_raw'] = req_raw_rx_bw
+        res['tx_raw'] = req_raw_tx_bw
+        np.divide(data_sz * req_raw_tx_bw, raw_tx_B,
+                  out=res['tx_eff'], where=dir_tx)
+        np.divide(data_sz * req_raw_rx_bw, raw_rx_B,
+                  out=res['rx_eff'], where=dir_rx)
+
+    else: # BW_EFF
+        res['tx_eff'] = np.where(dir_tx, bwspec.tx_bw, 0.0)
+        res['rx_eff'] = np.where(dir_rx, bwspec.rx_bw, 0.0)
+        # Without traffic in one direction, the number of batches per
+        # second of the other direction determines the raw bandwidth
+        res['tx_raw'] = np.where(dir_tx,
+                                 bwspec.tx_bw * raw_tx_B / data_sz,
+                                 bwspec.rx_bw / data_sz * raw_tx_B)
+        res['rx_raw'] = np.where(dir_rx,
+                                 bwspec.rx_bw * raw_rx_B / data_sz,
+                                 bwspec.tx_bw / data_sz * raw_rx_B)
+    return res
@@ -18,14 +18,94 @@
 """A script to generate performance estimates for NICs"""
 
 import sys
+from optparse import OptionParser
 
-from model import pcie, eth, mem_bw, simple_nic, niantic
+import numpy as np
+
+from model import pcie, eth, mem_bw, simple_nic, niantic, output, cache
 
 # pylint: disable=bad-whitespace
 # pylint: disable=too-many-locals
 
+OUT_FILE = "nic_bw"
+
+# Output columns and the row format for text output
+COLUMNS = [('size',          "Packet Size(Bytes)"),
+           ('w_bw',          "Max. Write Bandwidth"),
+           ('rw_bw',         "Max. R/W Bandwidth"),
+           ('eth_bw',        "40Gb/s Line Rate (- FCS)"),
+           ('simple_nic_bi', "Simplistic NIC Bi-directional"),
+           ('simple_nic_tx', "Simplistic NIC TX only"),
+           ('simple_nic_rx', "Simplistic NIC RX only"),
+           ('kernel_nic_bi', "kernel NIC Bi-directional"),
+           ('kernel_nic_tx', "kernel NIC TX only"),
+           ('kernel_nic_rx', "kernel NIC RX only"),
+           ('pmd_nic_bi',    "DPDK NIC Bi-directional"),
+           ('pmd_nic_tx',    "DPDK NIC TX only"),
+           ('pmd_nic_rx',    "DPDK NIC RX only")]
+TEXT_FMT = "%d %.2f %.2f   %.2f   %.2f %.2f %.2f   %.2f %.2f %.2f   %.2f %.2f %.2f"
+
+# Number of sizes computed per block
+BLOCK_SZ = 4096
+
+def gen_blocks(cfg, ethcfg, bw_spec, sizes, call=cache.direct):
+    """Generate blocks of output columns for @sizes. The models are
+    evaluated with @call (see cache.Cache.call())"""
+    for start in range(0, len(sizes), BLOCK_SZ):
+        yield gen_block(cfg, ethcfg, bw_spec, sizes[start:start + BLOCK_SZ],
+                        call)
+
+def gen_block(cfg, ethcfg, bw_spec, sizes, call=cache.direct):
+    """Compute the output columns for @sizes"""
+    # Typically do not transfer the FCS
+    pkt_sizes = sizes - 4
+
+    # Remember NIC RX is DIR_TX
+    simple_nic_bi = call(simple_nic.bw_many, cfg, bw_spec, pcie.DIR_BOTH, pkt_sizes)
+    simple_nic_tx = call(simple_nic.bw_many, cfg, bw_spec, pcie.DIR_RX, pkt_sizes)
+    simple_nic_rx = call(simple_nic.bw_many, cfg, bw_spec, pcie.DIR_TX, pkt_sizes)
+
+    kernel_nic_bi = call(niantic.bw_many, cfg, bw_spec, pcie.DIR_BOTH, pkt_sizes)
+    kernel_nic_tx = call(niantic.bw_many, cfg, bw_spec, pcie.DIR_RX, pkt_sizes)
+    kernel_nic_rx = call(niantic.bw_many, cfg, bw_spec, pcie.DIR_TX, pkt_sizes)
+
+    pmd_nic_bi = call(niantic.bw_many, cfg, bw_spec, pcie.DIR_BOTH, pkt_sizes, h_opt="PMD")
+    pmd_nic_tx = call(niantic.bw_many, cfg, bw_spec, pcie.DIR_RX, pkt_sizes, h_opt="PMD")
+    pmd_nic_rx = call(niantic.bw_many, cfg, bw_spec, pcie.DIR_TX, pkt_sizes, h_opt="PMD")
+
+    return {'size': sizes,
+            'w_bw': call(mem_bw.write_many, cfg, bw_spec, pkt_sizes)['tx_eff'],
+            'rw_bw': call(mem_bw.read_many, cfg, bw_spec, pkt_sizes)['rx_eff'],
+            'eth_bw': np.array([ethcfg.bps_ex(size) / (1000 * 1000 * 1000.0)
+                                for size in pkt_sizes.tolist()]),
+            'simple_nic_bi': simple_nic_bi['tx_eff'],
+            'simple_nic_tx': simple_nic_tx['rx_eff'],
+            'simple_nic_rx': simple_nic_rx['tx_eff'],
+            'kernel_nic_bi': kernel_nic_bi['tx_eff'],
+            'kernel_nic_tx': kernel_nic_tx['rx_eff'],
+            'kernel_nic_rx': kernel_nic_rx['tx_eff'],
+            'pmd_nic_bi': pmd_nic_bi['tx_eff'],
+            'pmd_nic_tx': pmd_nic_tx['rx_eff'],
+            'pmd_nic_rx': pmd_nic_rx['tx_eff']}
+
 def main():
     """main"""
+    usage = """usage: %prog [options]"""
+
+    parser = OptionParser(usage)
+    parser.add_option('-f', '--format', dest='format', type="choice",
+                      choices=output.Formats, default='dat',
+                      help='Output format (%s)' % ', '.join(output.Formats))
+    parser.add_option('-o', '--outfile', dest='FILE',
+                      default=None, action='store',
+                      help='File where to write the data to')
+    parser.add_option('--cache', dest='cache', default=None, action='store',
+                      help='Cache model results in this file')
+
+    (options, _) = parser.parse_args()
+    if not options.FILE:
+        options.FILE = OUT_FILE + "." + options.format
+
     cfg = pcie.Cfg(version='gen3',
                    lanes='x8',
                    addr=64,
@@ -38,62 +118,16 @@ def main():
     tlp_bw = cfg.TLP_bw
     bw_spec = pcie.BW_Spec(tlp_bw, tlp_bw, pcie.BW_Spec.BW_RAW)
 
-    dat = open("nic_bw.dat", "w")
-    dat.write("\"Packet Size(Bytes)\" "
-              "\"Max. Write Bandwidth\" "
-              "\"Max. R/W Bandwidth\" "
-
-              "\"40Gb/s Line Rate (- FCS)\" "
-
-              "\"Simplistic NIC Bi-directional\" "
-              "\"Simplistic NIC TX only\" "
-              "\"Simplistic NIC RX only\" "
-
-              "\"kernel NIC Bi-directional\" "
-              "\"kernel NIC TX only\" "
-              "\"kernel NIC RX only\" "
-
-              "\"DPDK NIC Bi-directional\" "
-              "\"DPDK NIC TX only\" "
-              "\"DPDK NIC RX only\" "
-              "\n")
-
-    max_val = 0
-    for size in range(64, 1500):
-
-        w_bw = mem_bw.write(cfg, bw_spec, size - 4)
-        rw_bw = mem_bw.read(cfg, bw_spec, size - 4)
-
-        # Work out Ethernet bandwidth. Typically do not transfer the FCS
-        eth_bw = ethcfg.bps_ex(size - 4) / (1000 * 1000 * 1000.0)
-
-        # Remember NIC RX is DIR_TX
-        simple_nic_bi = simple_nic.bw(cfg, bw_spec, pcie.DIR_BOTH, size - 4)
-        simple_nic_tx = simple_nic.bw(cfg, bw_spec, pcie.DIR_RX, size - 4)
-        simple_nic_rx = simple_nic.bw(cfg, bw_spec, pcie.DIR_TX, size - 4)
-
-        kernel_nic_bi = niantic.bw(cfg, bw_spec, pcie.DIR_BOTH, size - 4)
-        kernel_nic_tx = niantic.bw(cfg, bw_spec, pcie.DIR_RX, size - 4)
-        kernel_nic_rx = niantic.bw(cfg, bw_spec, pcie.DIR_TX, size - 4)
-
-        pmd_nic_bi = niantic.bw(cfg, bw_spec, pcie.DIR_BOTH, size - 4, h_opt="PMD")
-        pmd_nic_tx = niantic.bw(cfg, bw_spec, pcie.DIR_RX, size - 4, h_opt="PMD")
-        pmd_nic_rx = niantic.bw(cfg, bw_spec, pcie.DIR_TX, size - 4, h_opt="PMD")
-
-        max_val = max(max_val, rw_bw.rx_eff, eth_bw,
-                      simple_nic_bi.tx_eff, simple_nic_tx.rx_eff, simple_nic_rx.tx_eff,
-                      kernel_nic_bi.tx_eff, kernel_nic_tx.rx_eff, kernel_nic_rx.tx_eff,
-                      pmd_nic_bi.tx_eff,    pmd_nic_tx.rx_eff,    pmd_nic_rx.tx_eff)
-
-        dat.write("%d %.2f %.2f   %.2f   %.2f %.2f %.2f   %.2f %.2f %.2f   %.2f %.2f %.2f\n" %
-                  (size, w_bw.tx_eff, rw_bw.rx_eff,
-                   eth_bw,
-                   simple_nic_bi.tx_eff, simple_nic_tx.rx_eff, simple_nic_rx.tx_eff,
-                   kernel_nic_bi.tx_eff, kernel_nic_tx.rx_eff, kernel_nic_rx.tx_eff,
-                   pmd_nic_bi.tx_eff,    pmd_nic_tx.rx_eff,    pmd_nic_rx.tx_eff
-                  ))
-
-    dat.close()
+    sizes = np.arange(64, 1500)
+    call = cache.direct
+    if options.cache:
+        res_cache = cache.Cache(options.cache)
+        call = res_cache.call
+    out = output.writer(options.format, options.FILE, COLUMNS, TEXT_FMT)
+    output.write_all(gen_blocks(cfg, ethcfg, bw_spec, sizes, call), out)
+    if options.cache:
+        print("Cache: %d hits, %d misses" % (res_cache.hits, res_cache.misses))
+        res_cache.close()
 
 if __name__ == '__main__':
     sys.exit(main())
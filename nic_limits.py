@@ -0,0 +1,108 @@
+#! /usr/bin/env python3
+#
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""Work out which resource limits the packet rate of a NIC"""
+
+import sys
+from optparse import OptionParser
+
+import numpy as np
+
+from model import pcie, eth, bottleneck, output
+
+OUT_FILE = "nic_limits"
+
+# Output columns and the row format for text output
+COLUMNS = [('size',        "Frame Size(Bytes)"),
+           ('pps',         "Packet Rate"),
+           ('gbps',        "Frame Data (Gb/s)"),
+           ('eth_pps',     "Ethernet Limit"),
+           ('pcie_rx_pps', "PCIe RX Limit"),
+           ('pcie_tx_pps', "PCIe TX Limit"),
+           ('lat_pps',     "Latency Limit"),
+           ('limit',       "Limit (%s)" % ', '.join(bottleneck.Limits))]
+TEXT_FMT = "%d %.0f %.2f %.0f %.0f %.0f %.0f %d"
+
+# Direction of the packets as seen by the NIC. Remember NIC RX is DIR_TX
+Dirs = {'rx': pcie.DIR_TX, 'tx': pcie.DIR_RX, 'both': pcie.DIR_BOTH}
+
+def main():
+    """Main"""
+    usage = """usage: %prog [options]
+
+For each frame size, works out the packet rate allowed by the Ethernet
+line rate, the PCIe bandwidth in each direction and, with --lat, the
+latency of device reads, and which of them limits the NIC."""
+
+    parser = OptionParser(usage)
+    parser.add_option('--gen', dest='gen', default='gen3', action='store',
+                      help='PCIe version')
+    parser.add_option('--lanes', dest='lanes', default='x8', action='store',
+                      help='Lane configuration')
+    parser.add_option('--addr', dest='addr', type="int", default=64,
+                      action='store', help='Address width')
+    parser.add_option('--mps', dest='MPS', type="int", default=256,
+                      action='store', help='Maximum payload size')
+    parser.add_option('--mrrs', dest='MRRS', type="int", default=512,
+                      action='store', help='Maximum read request size')
+    parser.add_option('--rcb', dest='RCB', type="int", default=64,
+                      action='store', help='Read completion boundary')
+    parser.add_option('--eth', dest='eth', type="choice",
+                      choices=eth.Variants, default='40GigE',
+                      help='Ethernet variant (%s)' % ', '.join(eth.Variants))
+    parser.add_option('--model', dest='model', type="choice",
+                      choices=list(bottleneck.Devices), default='niantic',
+                      help='NIC model (%s)' % ', '.join(bottleneck.Devices))
+    parser.add_option('--dir', dest='dir', type="choice",
+                      choices=list(Dirs), default='both',
+                      help='Packets received, transmitted or both by the NIC')
+    parser.add_option('--lat', dest='lat', type="float", default=None,
+                      action='store', help='Read completion latency in ns')
+    parser.add_option('--tags', dest='tags', type="int", default=pcie.Tags[8],
+                      action='store', help='Number of tags')
+    parser.add_option('-f', '--format', dest='format', type="choice",
+                      choices=output.Formats, default='dat',
+                      help='Output format (%s)' % ', '.join(output.Formats))
+    parser.add_option('-o', '--outfile', dest='FILE',
+                      default=None, action='store',
+                      help='File where to write the data to')
+
+    (options, _) = parser.parse_args()
+    if not options.FILE:
+        options.FILE = OUT_FILE + "." + options.format
+
+    cfg = pcie.Cfg(version=options.gen,
+                   lanes=options.lanes,
+                   addr=options.addr,
+                   ecrc=0,
+                   mps=options.MPS,
+                   mrrs=options.MRRS,
+                   rcb=options.RCB)
+    ethcfg = eth.Cfg(options.eth)
+
+    sizes = np.arange(64, 1519)
+    res = bottleneck.solve(cfg, ethcfg, options.model, Dirs[options.dir],
+                           sizes, lat=options.lat, tags=options.tags)
+    block = {name: res[name] for name, _ in COLUMNS}
+    out = output.writer(options.format, options.FILE, COLUMNS, TEXT_FMT)
+    output.write_all([block], out)
+
+    for start, limit in bottleneck.changes(res):
+        print("From %4dB: limited by %s" % (start, limit))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+#! /usr/bin/env python3
+#
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""Trade off NIC throughput against PCIe lanes and driver batching"""
+
+import sys
+import time
+from optparse import OptionParser
+
+from model import pcie, eth, pareto, output
+
+OUT_FILE = "nic_pareto"
+
+# Output columns and the row format for text output
+COLUMNS = [('size',       "Frame Size(Bytes)"),
+           ('version',    "PCIe Gen"),
+           ('lanes',      "Lanes"),
+           ('mps',        "MPS"),
+           ('mrrs',       "MRRS"),
+           ('irq_mod',    "IRQ Moderation"),
+           ('h_tx_batch', "TX Batch"),
+           ('h_fl_batch', "Freelist Batch"),
+           ('h_rx_batch', "RX Batch"),
+           ('pps',        "Packet Rate"),
+           ('gbps',       "Frame Data (Gb/s)"),
+           ('irq_rate',   "IRQs/s"),
+           ('batch_us',   "Batching Delay (us)")]
+TEXT_FMT = "%d %d %d %d %d %d %d %d %d %.0f %.2f %.0f %.3f"
+
+# Direction of the packets as seen by the NIC. Remember NIC RX is DIR_TX
+Dirs = {'rx': pcie.DIR_TX, 'tx': pcie.DIR_RX, 'both': pcie.DIR_BOTH}
+
+def _list(val, conv=str):
+    """Convert a comma separated option value into a list"""
+    if val is None:
+        return None
+    return [conv(v) for v in val.split(',')]
+
+def main():
+    """Main"""
+    usage = """usage: %prog [options]
+
+Evaluates the Niantic model for all combinations of PCIe configuration
+and host batching knobs and writes the Pareto frontier of throughput
+against the number of lanes, the interrupt rate and the batching
+delay for each frame size. Comma separated lists restrict the values
+explored."""
+
+    parser = OptionParser(usage)
+    parser.add_option('--eth', dest='eth', type="choice",
+                      choices=eth.Variants, default='40GigE',
+                      help='Ethernet variant (%s)' % ', '.join(eth.Variants))
+    parser.add_option('--dir', dest='dir', type="choice",
+                      choices=list(Dirs), default='both',
+                      help='Packets received, transmitted or both by the NIC')
+    parser.add_option('--sizes', dest='sizes', default='64,128,256,512,1518',
+                      action='store', help='Frame sizes')
+    parser.add_option('--gen', dest='gen', action='store',
+                      help='PCIe versions, e.g. gen3,gen4')
+    parser.add_option('--lanes', dest='lanes', action='store',
+                      help='Lane configurations, e.g. x8,x16')
+    parser.add_option('--mps', dest='MPS', action='store',
+                      help='Maximum payload sizes')
+    parser.add_option('--mrrs', dest='MRRS', action='store',
+                      help='Maximum read request sizes')
+    for knob in pareto.Knobs:
+        parser.add_option('--' + knob.replace('_', '-'), dest=knob,
+                          action='store',
+                          help='Values of %s (default %s)' %
+                          (knob, ','.join(str(v) for v in
+                                          pareto.Knob_vals[knob])))
+    parser.add_option('--max', dest='max', default=','.join(pareto.MAXIMIZE),
+                      action='store', help='Fields to maximise')
+    parser.add_option('--min', dest='min', default=','.join(pareto.MINIMIZE),
+                      action='store', help='Fields to minimise')
+    parser.add_option('-f', '--format', dest='format', type="choice",
+                      choices=output.Formats, default='dat',
+                      help='Output format (%s)' % ', '.join(output.Formats))
+    parser.add_option('-o', '--outfile', dest='FILE',
+                      default=None, action='store',
+                      help='File where to write the data to')
+
+    (options, _) = parser.parse_args()
+    if not options.FILE:
+        options.FILE = OUT_FILE + "." + options.format
+
+    knobs = {knob: _list(getattr(options, knob), int)
+             for knob in pareto.Knobs if getattr(options, knob)}
+    start = time.time()
+    res = pareto.explore(eth.Cfg(options.eth), Dirs[options.dir],
+                         _list(options.sizes, int),
+                         versions=_list(options.gen),
+                         lanes=_list(options.lanes),
+                         mpss=_list(options.MPS, int),
+                         mrrss=_list(options.MRRS, int), knobs=knobs)
+    front = pareto.frontier(res, _list(options.max), _list(options.min))
+    print("%d points, %d on the frontier (%.2fs)" %
+          (len(res), len(front), time.time() - start))
+
+    block = {name: front[name] for name, _ in COLUMNS}
+    out = output.writer(options.format, options.FILE, COLUMNS, TEXT_FMT)
+    output.write_all([block], out)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+#! /usr/bin/env python3
+#
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""Work out the PCIe bandwidth a NIC needs for a packet capture over time"""
+
+import sys
+from optparse import OptionParser
+
+import numpy as np
+
+from model import pcie, piecewise, output, pcap
+
+OUT_FILE = "pcap_bw"
+
+# Direction of the packets as seen by the NIC. Remember NIC RX is DIR_TX
+Dirs = {'rx': pcie.DIR_TX, 'tx': pcie.DIR_RX, 'both': pcie.DIR_BOTH}
+
+def main():
+    """Main"""
+    usage = """usage: %prog [options] capture
+
+Reads a pcap or pcapng file and, for each time window, works out the
+PCIe bandwidth a NIC model requires for the packets in it and the
+utilisation of the PCIe link."""
+
+    parser = OptionParser(usage)
+    parser.add_option('--gen', dest='gen', default='gen3', action='store',
+                      help='PCIe version')
+    parser.add_option('--lanes', dest='lanes', default='x8', action='store',
+                      help='Lane configuration')
+    parser.add_option('--addr', dest='addr', type="int", default=64,
+                      action='store', help='Address width')
+    parser.add_option('--mps', dest='MPS', type="int", default=256,
+                      action='store', help='Maximum payload size')
+    parser.add_option('--mrrs', dest='MRRS', type="int", default=512,
+                      action='store', help='Maximum read request size')
+    parser.add_option('--rcb', dest='RCB', type="int", default=64,
+                      action='store', help='Read completion boundary')
+    parser.add_option('--model', dest='model', type="choice",
+                      choices=list(piecewise.Models), default='niantic',
+                      help='Model (%s)' % ', '.join(piecewise.Models))
+    parser.add_option('--dir', dest='dir', type="choice",
+                      choices=list(Dirs), default='rx',
+                      help='Packets received, transmitted or both by the NIC')
+    parser.add_option('-w', '--window', dest='window', type="float",
+                      default=1000.0, action='store',
+                      help='Window length in us')
+    parser.add_option('-f', '--format', dest='format', type="choice",
+                      choices=output.Formats, default='dat',
+                      help='Output format (%s)' % ', '.join(output.Formats))
+    parser.add_option('-o', '--outfile', dest='FILE',
+                      default=None, action='store',
+                      help='File where to write the data to')
+
+    (options, args) = parser.parse_args()
+    if len(args) != 1:
+        parser.error("Need a capture file")
+    window_ns = int(options.window * 1000)
+    if window_ns <= 0:
+        parser.error("Window must be at least 1ns")
+    if not options.FILE:
+        options.FILE = OUT_FILE + "." + options.format
+
+    cfg = pcie.Cfg(version=options.gen,
+                   lanes=options.lanes,
+                   addr=options.addr,
+                   ecrc=0,
+                   mps=options.MPS,
+                   mrrs=options.MRRS,
+                   rcb=options.RCB)
+
+    # keep track of the peaks while streaming the blocks to the writer
+    stats = {'windows': 0, 'saturated': 0, 'peak': 0.0, 'peak_time': 0.0}
+    def track(blocks):
+        for block in blocks:
+            util = np.maximum(block['rx_util'], block['tx_util'])
+            stats['windows'] += len(util)
+            stats['saturated'] += int(np.count_nonzero(util > 1.0))
+            if len(util) and util.max() > stats['peak']:
+                stats['peak'] = float(util.max())
+                stats['peak_time'] = float(block['time'][util.argmax()])
+            yield block
+
+    blocks = pcap.timeline(pcap.read(args[0]), cfg, options.model,
+                           Dirs[options.dir], window_ns)
+    out = output.writer(options.format, options.FILE, pcap.Columns,
+                        pcap.Text_fmt)
+    output.write_all(track(blocks), out)
+
+    print("%d windows of %.1fus, peak utilisation %.2f at %.6fs, "
+          "%d windows saturated" %
+          (stats['windows'], options.window, stats['peak'],
+           stats['peak_time'], stats['saturated']))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -20,11 +20,64 @@
 import sys
 from optparse import OptionParser
 
-from model import pcie, eth, mem_bw
+import numpy as np
+
+from model import pcie, eth, mem_bw, output, cache
 
 # pylint: disable=too-many-locals
 
-OUT_FILE = "pcie_bw.dat"
+OUT_FILE = "pcie_bw"
+
+# Output columns and the row format for text output
+COLUMNS = [('size',       "Payload(Bytes)"),
+           ('wr_bw',      "PCIe Write BW"),
+           ('wr_trans',   "PCIe Write Trans/s"),
+           ('rd_bw',      "PCIe Read BW"),
+           ('rd_trans',   "PCIe Read Trans/s"),
+           ('rdwr_bw',    "PCIe Read/Write BW"),
+           ('rdwr_trans', "PCIe Read/Write Trans/s"),
+           ('eth_bw',     "40G Ethernet BW"),
+           ('eth_pps',    "40G Ethernet PPS"),
+           ('eth_lat',    "40G Ethernet Frame time (ns)")]
+TEXT_FMT = "%d %.2f %.1f %.2f %.1f %.2f %.1f %.2f %d %.2f"
+
+# Number of sizes computed per block
+BLOCK_SZ = 4096
+
+def gen_blocks(pciecfg, ethcfg, bw_spec, sizes, call=cache.direct):
+    """Generate blocks of output columns for @sizes. The Ethernet
+    columns are omitted for sizes smaller than the minimum frame size.
+    The models are evaluated with @call (see cache.Cache.call())"""
+    for start in range(0, len(sizes), BLOCK_SZ):
+        blk_sizes = sizes[start:start + BLOCK_SZ]
+        small = blk_sizes[blk_sizes < 64]
+        if len(small):
+            yield gen_block(pciecfg, None, bw_spec, small, call)
+        large = blk_sizes[blk_sizes >= 64]
+        if len(large):
+            yield gen_block(pciecfg, ethcfg, bw_spec, large, call)
+
+def gen_block(pciecfg, ethcfg, bw_spec, sizes, call=cache.direct):
+    """Compute the output columns for @sizes"""
+    wr_bw = call(mem_bw.write_many, pciecfg, bw_spec, sizes)
+    rd_bw = call(mem_bw.read_many, pciecfg, bw_spec, sizes)
+    rdwr_bw = call(mem_bw.read_write_many, pciecfg, bw_spec, sizes)
+
+    blk = {'size': sizes,
+           'wr_bw': wr_bw['tx_eff'],
+           'wr_trans': (wr_bw['tx_eff'] * 1000 * 1000 * 1000 / 8) / sizes,
+           'rd_bw': rd_bw['rx_eff'],
+           'rd_trans': (rd_bw['rx_eff'] * 1000 * 1000 * 1000 / 8) / sizes,
+           'rdwr_bw': rdwr_bw['tx_eff'],
+           'rdwr_trans': (rdwr_bw['tx_eff'] * 1000 * 1000 * 1000 / 8) / sizes}
+
+    if ethcfg:
+        eth_pps = np.array([ethcfg.pps_ex(size) for size in sizes.tolist()])
+        blk['eth_bw'] = np.array([ethcfg.bps_ex(size) / (1000 * 1000 * 1000.0)
+                                  for size in sizes.tolist()])
+        blk['eth_pps'] = eth_pps
+        blk['eth_lat'] = 1.0 * 1000 * 1000 * 1000 / eth_pps
+    return blk
 
 def main():
     """Main"""
@@ -52,11 +105,18 @@ def main():
     parser.add_option('--ecrc', dest='ecrc', type="int", action='store',
                       default=0,
                       help='Use ECRC (0 or 1)')
+    parser.add_option('-f', '--format', dest='format', type="choice",
+                      choices=output.Formats, default='dat',
+                      help='Output format (%s)' % ', '.join(output.Formats))
     parser.add_option('-o', '--outfile', dest='FILE',
-                      default=OUT_FILE, action='store',
+                      default=None, action='store',
                       help='File where to write the data to')
+    parser.add_option('--cache', dest='cache', default=None, action='store',
+                      help='Cache model results in this file')
 
     (options, _) = parser.parse_args()
+    if not options.FILE:
+        options.FILE = OUT_FILE + "." + options.format
 
     pciecfg = pcie.Cfg(version=options.gen,
                        lanes=options.lanes,
@@ -74,46 +134,16 @@ def main():
     tlp_bw = pciecfg.TLP_bw
     bw_spec = pcie.BW_Spec(tlp_bw, tlp_bw, pcie.BW_Spec.BW_RAW)
 
-    dat = open(options.FILE, "w")
-    dat.write("\"Payload(Bytes)\" "
-              "\"PCIe Write BW\" "
-              "\"PCIe Write Trans/s\" "
-              "\"PCIe Read BW\" "
-              "\"PCIe Read Trans/s\" "
-              "\"PCIe Read/Write BW\" "
-              "\"PCIe Read/Write Trans/s\" "
-              "\"40G Ethernet BW\" "
-              "\"40G Ethernet PPS\" "
-              "\"40G Ethernet Frame time (ns)\" "
-              "\n")
-
-    for size in range(1, 1500 + 1):
-        wr_bw = mem_bw.write(pciecfg, bw_spec, size)
-        rd_bw = mem_bw.read(pciecfg, bw_spec, size)
-        rdwr_bw = mem_bw.read_write(pciecfg, bw_spec, size)
-
-        wr_trans = (wr_bw.tx_eff * 1000 * 1000 * 1000 / 8) / size
-        rd_trans = (rd_bw.rx_eff * 1000 * 1000 * 1000 / 8) / size
-        rdwr_trans = (rdwr_bw.tx_eff * 1000 * 1000 * 1000 / 8) / size
-
-        if size >= 64:
-            eth_bw = ethcfg.bps_ex(size) / (1000 * 1000 * 1000.0)
-            eth_pps = ethcfg.pps_ex(size)
-            eth_lat = 1.0 * 1000 * 1000 * 1000 / eth_pps
-            dat.write("%d %.2f %.1f %.2f %.1f %.2f %.1f %.2f %d %.2f\n" %
-                      (size,
-                       wr_bw.tx_eff, wr_trans,
-                       rd_bw.rx_eff, rd_trans,
-                       rdwr_bw.tx_eff, rdwr_trans,
-                       eth_bw, eth_pps, eth_lat))
-        else:
-            dat.write("%d %.2f %.1f %.2f %.1f %.2f %.1f\n" %
-                      (size,
-                       wr_bw.tx_eff, wr_trans,
-                       rd_bw.rx_eff, rd_trans,
-                       rdwr_bw.tx_eff, rdwr_trans))
-
-    dat.close()
+    sizes = np.arange(1, 1500 + 1)
+    call = cache.direct
+    if options.cache:
+        res_cache = cache.Cache(options.cache)
+        call = res_cache.call
+    out = output.writer(options.format, options.FILE, COLUMNS, TEXT_FMT)
+    output.write_all(gen_blocks(pciecfg, ethcfg, bw_spec, sizes, call), out)
+    if options.cache:
+        print("Cache: %d hits, %d misses" % (res_cache.hits, res_cache.misses))
+        res_cache.close()
 
 if __name__ == '__main__':
     sys.exit(main())
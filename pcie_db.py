@@ -0,0 +1,87 @@
+#! /usr/bin/env python3
+#
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""Build or query a precomputed database of model results"""
+
+import sys
+import time
+from optparse import OptionParser
+
+from model import pcie, lookup, sweep
+
+DB_DIR = "pcie_db"
+
+def _list(val, conv=str):
+    """Convert a comma separated option value into a list"""
+    if val is None:
+        return None
+    return [conv(v) for v in val.split(',')]
+
+def main():
+    """Main"""
+    usage = """usage: %prog [options] build
+       %prog [options] query GEN LANES ADDR ECRC MPS MRRS RCB RCB_CHUNKS MODEL DIR SIZE
+
+build: Precompute results for the configurations selected with the
+       options (all legal configurations if none are given).
+query: Look up the result for a configuration, model, direction (1:
+       RX, 2: TX, 3: both) and size."""
+
+    parser = OptionParser(usage)
+    parser.add_option('-d', '--db', dest='db', default=DB_DIR,
+                      help='Database directory')
+    parser.add_option('--gen', dest='gen', help='PCIe versions')
+    parser.add_option('--lanes', dest='lanes', help='Lane configurations')
+    parser.add_option('--mps', dest='MPS', help='Maximum payload sizes')
+    parser.add_option('--mrrs', dest='MRRS', help='Maximum read request sizes')
+    parser.add_option('--models', dest='models',
+                      help='Models to store (%s)' % ', '.join(sweep.Model_names))
+    parser.add_option('--min-size', dest='min_size', type="int", default=1,
+                      help='Smallest size to store')
+    parser.add_option('--max-size', dest='max_size', type="int", default=1500,
+                      help='Largest size to store')
+    parser.add_option('--field', dest='field', default='tx_eff',
+                      help='Result to query (rx_eff or tx_eff)')
+    parser.add_option('-j', '--jobs', dest='jobs', type="int", default=None,
+                      help='Number of worker processes (default: #CPUs)')
+
+    (options, args) = parser.parse_args()
+    if not args or args[0] not in ['build', 'query']:
+        parser.error("Specify build or query")
+
+    if args[0] == 'build':
+        cfgs = sweep.space(versions=_list(options.gen),
+                           lanes=_list(options.lanes),
+                           mpss=_list(options.MPS, int),
+                           mrrss=_list(options.MRRS, int))
+        start = time.time()
+        n = lookup.build(options.db, cfgs, _list(options.models),
+                         options.min_size, options.max_size,
+                         processes=options.jobs)
+        print("Stored %d results for %d configurations in %s in %.1fs" %
+              (n, len(cfgs), options.db, time.time() - start))
+        return
+
+    if len(args) != 12:
+        parser.error("Wrong number of arguments for query")
+    cfg = pcie.Cfg(args[1], args[2], int(args[3]), int(args[4]),
+                   int(args[5]), int(args[6]), int(args[7]), bool(int(args[8])))
+    db = lookup.DB(options.db)
+    print("%.4f" % db.query(cfg, args[9], int(args[10]), int(args[11]),
+                            options.field))
+
+if __name__ == '__main__':
+    sys.exit(main())
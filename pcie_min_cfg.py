@@ -0,0 +1,92 @@
+#! /usr/bin/env python3
+#
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""Find the smallest PCIe configurations for a NIC to sustain a rate"""
+
+import sys
+from optparse import OptionParser
+
+import numpy as np
+
+from model import pcie, eth, bottleneck, inverse
+
+# Direction of the packets as seen by the NIC. Remember NIC RX is DIR_TX
+Dirs = {'rx': pcie.DIR_TX, 'tx': pcie.DIR_RX, 'both': pcie.DIR_BOTH}
+
+def _list(val, conv=str):
+    """Convert a comma separated option value into a list"""
+    if val is None:
+        return None
+    return [conv(v) for v in val.split(',')]
+
+def main():
+    """Main"""
+    usage = """usage: %prog [options]
+
+Lists the minimal PCIe configurations (version, lanes, MPS, MRRS) with
+which a NIC model sustains the Ethernet line rate, or --gbps, for all
+frame sizes from --min-size to --max-size."""
+
+    parser = OptionParser(usage)
+    parser.add_option('--eth', dest='eth', type="choice",
+                      choices=eth.Variants, default='100GigE',
+                      help='Ethernet variant (%s)' % ', '.join(eth.Variants))
+    parser.add_option('--gbps', dest='gbps', type="float", default=None,
+                      action='store',
+                      help='Target data rate in Gb/s instead of line rate')
+    parser.add_option('--model', dest='model', type="choice",
+                      choices=list(bottleneck.Devices), default='niantic',
+                      help='NIC model (%s)' % ', '.join(bottleneck.Devices))
+    parser.add_option('--dir', dest='dir', type="choice",
+                      choices=list(Dirs), default='both',
+                      help='Packets received, transmitted or both by the NIC')
+    parser.add_option('--min-size', dest='min_size', type="int", default=64,
+                      action='store', help='Smallest frame size')
+    parser.add_option('--max-size', dest='max_size', type="int",
+                      default=1518, action='store', help='Largest frame size')
+    parser.add_option('--gen', dest='gen', type="string", action='store',
+                      help='PCIe versions to consider, e.g. gen3,gen4')
+    parser.add_option('--lanes', dest='lanes', type="string", action='store',
+                      help='Lane configurations to consider, e.g. x8,x16')
+    parser.add_option('--mps', dest='MPS', type="string", action='store',
+                      help='Maximum payload sizes to consider')
+    parser.add_option('--mrrs', dest='MRRS', type="string", action='store',
+                      help='Maximum read request sizes to consider')
+    parser.add_option('--lat', dest='lat', type="float", default=None,
+                      action='store', help='Read completion latency in ns')
+    parser.add_option('--tags', dest='tags', type="int", default=pcie.Tags[8],
+                      action='store', help='Number of tags')
+
+    (options, _) = parser.parse_args()
+
+    sizes = np.arange(options.min_size, options.max_size + 1)
+    cfgs, evals = inverse.search(eth.Cfg(options.eth), options.model,
+                                 Dirs[options.dir], sizes, gbps=options.gbps,
+                                 versions=_list(options.gen),
+                                 lanes=_list(options.lanes),
+                                 mpss=_list(options.MPS, int),
+                                 mrrss=_list(options.MRRS, int),
+                                 lat=options.lat, tags=options.tags)
+    print("%d minimal configurations (%d evaluated)" % (len(cfgs), evals))
+    print("%-6s %-5s %5s %5s %10s" % ("Gen", "Lanes", "MPS", "MRRS",
+                                      "Raw Gb/s"))
+    for cfg in cfgs:
+        print("%-6s %-5s %5d %5d %10.2f" % (cfg.version, cfg.lanes, cfg.mps,
+                                            cfg.mrrs, cfg.RAW_bw))
+    return 0 if cfgs else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+#! /usr/bin/env python3
+#
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""Compare the TLP level simulator with the analytic memory models or
+replay a DMA workload with it"""
+
+import sys
+import time
+from optparse import OptionParser
+
+from model import pcie
+from model import mem_bw
+from model import sim
+
+Ops = {'wr': sim.OP_WR, 'rd': sim.OP_RD}
+
+def load_ops(fname):
+    """Read a workload file. Each line is '[host] wr|rd SIZE [TIME]',
+    lines starting with '#' are ignored. Returns the device and host
+    operations."""
+    dev_ops = []
+    host_ops = []
+    with open(fname) as f:
+        for line in f:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            ops = dev_ops
+            if fields[0] == 'host':
+                ops = host_ops
+                fields = fields[1:]
+            if fields[0] not in Ops:
+                raise Exception("Unknown operation: %s" % line)
+            op = (Ops[fields[0]], int(fields[1]))
+            if len(fields) > 2:
+                op += (float(fields[2]),)
+            ops.append(op)
+    return dev_ops, host_ops
+
+def print_res(res):
+    """Print the results of a simulation"""
+    print("%d operations in %.1f us (%d events)" %
+          (res.ops, res.duration / 1000.0, res.events))
+    print("Latency: mean=%.1f ns max=%.1f ns" % (res.mean_lat, res.max_lat))
+    for d, name in [(pcie.DIR_TX, 'TX'), (pcie.DIR_RX, 'RX')]:
+        print("%s: %d TLPs, utilisation %.3f, credit stalls %.1f ns" %
+              (name, res.tlps[d], res.util[d], res.stall[d]))
+        print("    bytes: " + " ".join("%s=%d" % (k, v)
+                                       for k, v in res.wire[d].items()))
+    print("Raw/effective Gb/s: RX %.2f/%.2f TX %.2f/%.2f" %
+          (res.bw.rx_raw, res.bw.rx_eff, res.bw.tx_raw, res.bw.tx_eff))
+
+def main():
+    """Main"""
+    usage = """usage: %prog [options] [workload file]
+
+Without a workload file, compare the simulated bandwidth of back to
+back memory writes and reads with the analytic models for a range of
+sizes."""
+
+    parser = OptionParser(usage)
+    parser.add_option('--gen', dest='gen', default='gen3', action='store',
+                      help='PCIe version')
+    parser.add_option('--lanes', dest='lanes', default='x8', action='store',
+                      help='Lane configuration')
+    parser.add_option('--addr', dest='addr', type="int", default=64,
+                      action='store', help='Address width')
+    parser.add_option('--mps', dest='MPS', type="int", default=256,
+                      action='store', help='Maximum payload size')
+    parser.add_option('--mrrs', dest='MRRS', type="int", default=512,
+                      action='store', help='Maximum read request size')
+    parser.add_option('--rcb', dest='RCB', type="int", default=64,
+                      action='store', help='Read completion boundary')
+    parser.add_option('--lat', dest='lat', type="float", default=0.0,
+                      action='store', help='One way link latency (ns)')
+    parser.add_option('--cpl-lat', dest='cpl_lat', type="float", default=0.0,
+                      action='store', help='Completion latency (ns)')
+    parser.add_option('--tags', dest='tags', type="int", default=256,
+                      action='store', help='Outstanding reads')
+    parser.add_option('-n', dest='n', type="int", default=10000,
+                      action='store', help='Operations per size')
+    parser.add_option('--sizes', dest='sizes', default='64,128,256,512,1500',
+                      action='store', help='Comma separated sizes')
+
+    (options, args) = parser.parse_args()
+
+    cfg = pcie.Cfg(version=options.gen,
+                   lanes=options.lanes,
+                   addr=options.addr,
+                   ecrc=0,
+                   mps=options.MPS,
+                   mrrs=options.MRRS,
+                   rcb=options.RCB)
+    cfg.pp()
+    kwargs = {'lat': options.lat, 'cpl_lat': options.cpl_lat,
+              'tags': options.tags}
+
+    if args:
+        dev_ops, host_ops = load_ops(args[0])
+        start = time.time()
+        res = sim.run(cfg, dev_ops, host_ops, **kwargs)
+        print_res(res)
+        print("Simulated %d TLPs in %.2fs" %
+              (sum(res.tlps.values()), time.time() - start))
+        return 0
+
+    bwspec = pcie.BW_Spec(cfg.TLP_bw, cfg.TLP_bw, pcie.BW_Spec.BW_RAW)
+    print("%-6s %5s %10s %10s %10s %10s" %
+          ("op", "size", "sim eff", "model eff", "sim lat", "TLPs/s"))
+    for size in [int(s) for s in options.sizes.split(',')]:
+        for name, op, fn, field in [('write', sim.OP_WR, mem_bw.write, 'tx_eff'),
+                                    ('read', sim.OP_RD, mem_bw.read, 'rx_eff')]:
+            start = time.time()
+            res = sim.run(cfg, sim.ops(op, size, options.n), **kwargs)
+            secs = time.time() - start
+            model = fn(cfg, bwspec, size)
+            print("%-6s %5d %10.2f %10.2f %10.1f %10.0f" %
+                  (name, size, getattr(res.bw, field), getattr(model, field),
+                   res.mean_lat, sum(res.tlps.values()) / secs))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
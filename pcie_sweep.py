@@ -0,0 +1,123 @@
+#! /usr/bin/env python3
+#
+## Copyright (C) 2018 Rolf Neugebauer.  All rights reserved.
+##
+## Licensed under the Apache License, Version 2.0 (the "License");
+## you may not use this file except in compliance with the License.
+## You may obtain a copy of the License at
+##
+##   http://www.apache.org/licenses/LICENSE-2.0
+##
+## Unless required by applicable law or agreed to in writing, software
+## distributed under the License is distributed on an "AS IS" BASIS,
+## WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+## See the License for the specific language governing permissions and
+## limitations under the License.
+
+"""Sweep the models across (a subset of) the PCIe configuration space"""
+
+import sys
+import time
+from optparse import OptionParser
+
+import numpy as np
+
+from model import sweep
+
+OUT_FILE = "pcie_sweep.npy"
+
+def _list(val, conv=str):
+    """Convert a comma separated option value into a list"""
+    if val is None:
+        return None
+    return [conv(v) for v in val.split(',')]
+
+def _progress(done, total, rate):
+    """Report the progress of the sweep"""
+    sys.stderr.write("\r%d/%d points (%.1f%%), %.0f points/s" %
+                     (done, total, 100.0 * done / total if total else 100.0,
+                      rate))
+    sys.stderr.flush()
+
+def main():
+    """Main"""
+    usage = """usage: %prog [options]
+
+All list options take comma separated values. If omitted, all legal
+values are swept."""
+
+    parser = OptionParser(usage)
+    parser.add_option('--gen', dest='gen', type="string", action='store',
+                      help='PCIe versions, e.g. gen3,gen4')
+    parser.add_option('--lanes', dest='lanes', type="string", action='store',
+                      help='Lane configurations, e.g. x8,x16')
+    parser.add_option('--addr', dest='addr', type="string", action='store',
+                      help='Address widths (32, 64)')
+    parser.add_option('--ecrc', dest='ecrc', type="string", action='store',
+                      help='ECRC settings (0, 1)')
+    parser.add_option('--mps', dest='MPS', type="string", action='store',
+                      help='Maximum payload sizes')
+    parser.add_option('--mrrs', dest='MRRS', type="string", action='store',
+                      help='Maximum read request sizes')
+    parser.add_option('--rcb', dest='RCB', type="string", action='store',
+                      help='Read completion boundaries')
+    parser.add_option('--rcb-chunks', dest='rcb_chunks', type="string",
+                      action='store',
+                      help='Completions chopped into RCB sized chunks (0, 1)')
+    parser.add_option('--models', dest='models', type="string",
+                      action='store', default=','.join(sweep.Model_names),
+                      help='Models to evaluate (%s)' %
+                      ', '.join(sweep.Model_names))
+    parser.add_option('--min-size', dest='min_size', type="int",
+                      action='store', default=64,
+                      help='Smallest transfer size')
+    parser.add_option('--max-size', dest='max_size', type="int",
+                      action='store', default=1500,
+                      help='Largest transfer size')
+    parser.add_option('--step', dest='step', type="int",
+                      action='store', default=1,
+                      help='Transfer size increments')
+    parser.add_option('-j', '--jobs', dest='jobs', type="int",
+                      action='store', default=None,
+                      help='Number of worker processes (default: #CPUs)')
+    parser.add_option('--shard', dest='shard', type="int",
+                      action='store', default=64,
+                      help='Number of configurations per work item')
+    parser.add_option('-o', '--outfile', dest='FILE',
+                      default=OUT_FILE, action='store',
+                      help='File where to write the data to')
+    parser.add_option('--checkpoint', dest='ckpt', default=None,
+                      action='store',
+                      help='Directory for checkpoints, new or empty. An '
+                      'interrupted sweep is resumed by running it again')
+    parser.add_option('-q', '--quiet', dest='quiet', default=False,
+                      action='store_true', help='Do not report progress')
+
+    (options, _) = parser.parse_args()
+
+    to_bool = lambda v: bool(int(v))
+    cfgs = sweep.space(versions=_list(options.gen),
+                       lanes=_list(options.lanes),
+                       addrs=_list(options.addr, int),
+                       ecrcs=_list(options.ecrc, int),
+                       mpss=_list(options.MPS, int),
+                       mrrss=_list(options.MRRS, int),
+                       rcbs=_list(options.RCB, int),
+                       rcb_chunks=_list(options.rcb_chunks, to_bool))
+    models = _list(options.models)
+    sizes = np.arange(options.min_size, options.max_size + 1, options.step)
+
+    print("Sweeping %d configurations x %d sizes for %s" %
+          (len(cfgs), len(sizes), ', '.join(models)))
+    start = time.time()
+    n = sweep.run_to_file(options.FILE, cfgs, models, sizes,
+                          processes=options.jobs, shard_size=options.shard,
+                          ckpt_dir=options.ckpt,
+                          progress=None if options.quiet else _progress)
+    if not options.quiet:
+        sys.stderr.write("\n")
+    print("Wrote %d records to %s in %.1fs" %
+          (n, options.FILE, time.time() - start))
+
+if __name__ == '__main__':
+    sys.exit(main())